@@ -0,0 +1,300 @@
+"""
+Бенчмарк парсера реестра ЕЭК (scripts/parse_eec_pdf.py).
+
+Случаи:
+  registry        — data/eec_registry.pdf как есть;
+  synthetic-xN    — синтетический реестр в N раз больше по числу страниц (PyMuPDF):
+                    разные раскладки таблиц, продолжения без заголовка, "из ####",
+                    диапазоны, даты, числа в описаниях. Генерация детерминирована (seed).
+
+Каждый случай идёт в отдельном процессе (честный пиковый RSS) тем же путём, что main():
+iter_page_hits -> RuleSet -> finalize. Отчёт: страниц/с, уникальные коды/с (итоговые
+правила exact + prefixObjects + ranges на время прогона), hits/с, пиковая память,
+время по стадиям и SHA-256 итоговых правил. Сравнение с baseline:
+правила должны совпасть, скорость — не упасть больше чем на --tolerance.
+Время одного прогона на общей машине гуляет на ±20%; --repeat N берёт лучший из N
+прогонов — baseline стоит писать так же (--update-baseline --repeat 3).
+
+Usage:
+  python scripts/bench_eec_parser.py [--scales 1,10] [--workers N] [--table-strategy all|adaptive] [--backends all|auto|LIST]
+                                     [--repeat N] [--baseline scripts/bench_baseline.json] [--update-baseline]
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+
+try:
+    import resource
+except ImportError:  # не Unix
+    resource = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+REGISTRY_PDF = os.path.join(ROOT, "data", "eec_registry.pdf")
+DEFAULT_BASELINE = os.path.join(HERE, "bench_baseline.json")
+REGISTRY_PAGES = 35  # страниц в data/eec_registry.pdf — база для масштаба синтетики
+
+
+# ----------------- Synthetic registry -----------------
+# Раскладки таблиц: ширины колонок, заголовки, индексы колонок описания, кода и даты.
+LAYOUTS = [
+    {
+        "widths": [150, 80, 80, 130, 100, 150, 110],
+        "header": ["Наименование товара", "Код ТН ВЭД ЕАЭС", "Особенности применения",
+                   "Нормативный правовой акт", "Дата начала и окончания", "Идентификационные сведения",
+                   "Дополнительные сведения"],
+        "desc": 0, "code": 1, "date": 4,
+    },
+    {
+        "widths": [260, 100, 50, 200, 170],
+        "header": ["Наименование товара", "Код ТН ВЭД", "Примечание", "Нормативный акт", "Срок действия"],
+        "desc": 0, "code": 1, "date": 4,
+    },
+    {
+        "widths": [30, 230, 110, 190, 100, 120],
+        "header": ["N", "Наименование", "Код ТН ВЭД ЕАЭС", "Основание", "Дата", "Сведения"],
+        "desc": 1, "code": 2, "date": 4,
+    },
+]
+
+WORDS = ("товары мясо свежее охлажденное замороженное изделия пластмасс средства туалетные "
+         "автомобили легковые препараты ферменты смеси кроме позиции группы компаний марки "
+         "постановление Совета Министров Правительства распространяется страны перечень").split()
+
+
+def _code4(rnd):
+    return f"{rnd.randint(101, 9706):04d}"
+
+
+def synthetic_code_cell(rnd):
+    kind = rnd.random()
+    if kind < 0.25:
+        return ",\n".join(f"из {_code4(rnd)}" for _ in range(rnd.randint(1, 3)))
+    if kind < 0.5:
+        c = _code4(rnd)
+        return f"{c} {rnd.randint(10, 99)} {rnd.randint(100, 999)} {rnd.randint(0, 9)}"
+    if kind < 0.65:
+        return _code4(rnd) if rnd.random() < 0.5 else f"{_code4(rnd)} {rnd.randint(10, 99)}"
+    if kind < 0.8:
+        c = _code4(rnd)
+        a = rnd.randint(10, 80)
+        return f"{c} {a} - {c} {a + rnd.randint(1, 9)}"
+    if kind < 0.9:
+        base = int(_code4(rnd)) * 10 ** 6 + rnd.randint(0, 899999)
+        return f"{base:010d} - {base + rnd.randint(1, 99999):010d}"
+    return "; ".join(_code4(rnd) for _ in range(rnd.randint(2, 4)))
+
+
+def synthetic_text(rnd, lines_max=3):
+    lines = []
+    for _ in range(rnd.randint(1, lines_max)):
+        line = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(2, 4)))
+        if rnd.random() < 0.1:
+            line += f" {rnd.randint(1000, 9999)}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def synthetic_date_cell(rnd):
+    if rnd.random() < 0.7:
+        return f"{rnd.randint(1, 28):02d}.{rnd.randint(1, 12):02d}.20{rnd.randint(20, 25)}"
+    return f"с {rnd.randint(1, 28)} апреля 20{rnd.randint(20, 25)} г.\nна постоянной основе"
+
+
+def make_synthetic_registry(path: str, pages: int, seed: int = 1):
+    """Синтетический реестр: секции по 3-10 страниц, заголовок таблицы только на первой странице секции."""
+    import fitz
+
+    rnd = random.Random(seed)
+    font = fitz.Font("helv")
+    fontsize = 7
+    line_h = fontsize * 1.25
+
+    doc = fitz.open()
+    left_in_section = 0
+    layout = None
+    for _ in range(pages):
+        page = doc.new_page(width=842, height=595)
+        rows = []
+        if left_in_section == 0:
+            layout = rnd.choice(LAYOUTS)
+            left_in_section = rnd.randint(3, 10)
+            rows.append(layout["header"])
+        left_in_section -= 1
+
+        n_rows = len(rows) + rnd.randint(8, 12)
+        while len(rows) < n_rows:
+            row = [synthetic_text(rnd, 2) for _ in layout["widths"]]
+            row[layout["desc"]] = synthetic_text(rnd, 4)
+            row[layout["code"]] = synthetic_code_cell(rnd)
+            row[layout["date"]] = synthetic_date_cell(rnd)
+            rows.append(row)
+
+        shape = page.new_shape()
+        writer = fitz.TextWriter(page.rect)
+        x_edges = [30]
+        for w in layout["widths"]:
+            x_edges.append(x_edges[-1] + w)
+        y = 30
+        for row in rows:
+            height = max(c.count("\n") + 1 for c in row) * line_h + 6
+            if y + height > 565:
+                break
+            for cell, x in zip(row, x_edges):
+                for k, text in enumerate(cell.split("\n")):
+                    writer.append((x + 3, y + 3 + fontsize + k * line_h), text, font=font, fontsize=fontsize)
+            shape.draw_line((x_edges[0], y), (x_edges[-1], y))
+            y += height
+        shape.draw_line((x_edges[0], y), (x_edges[-1], y))
+        for x in x_edges:
+            shape.draw_line((x, 30), (x, y))
+        shape.finish(width=0.5)
+        shape.commit()
+        writer.write_text(page)
+
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+
+
+# ----------------- Case run (child process) -----------------
+def _peak_rss_kb():
+    if resource is None:
+        return 0
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children)
+
+
+def run_case(pdf_path: str, workers: int = 1, table_strategy: str = "all", backends: str = "all"):
+    """Разбор тем же путём, что main(), без записи вывода. Возвращает метрики."""
+    sys.path.insert(0, HERE)
+    import parse_eec_pdf as parser
+
+    t0 = perf_counter()
+    rules = parser.RuleSet()
+    profile = parser.ProfileReport()
+    n_pages = 0
+    n_hits = 0
+    for hits, info in parser.iter_page_hits(pdf_path, workers=workers, table_strategy=table_strategy,
+                                              profile=True, backends=backends):
+        n_pages += 1
+        n_hits += len(hits)
+        if info["profile"] is not None:
+            profile.add_page(info["page"], info["profile"], hits)
+        rules.add_hits(hits)
+    rules.finalize()
+    seconds = perf_counter() - t0
+
+    stats = rules.stats()
+    out_rules = rules.to_json()
+    digest = hashlib.sha256(json.dumps(out_rules, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+    return {
+        "pages": n_pages,
+        "seconds": round(seconds, 3),
+        "pagesPerSec": round(n_pages / seconds, 3),
+        "codesPerSec": round(sum(stats.values()) / seconds, 1),  # уникальные коды итоговых правил
+        "hitsPerSec": round(n_hits / seconds, 1),  # hits всех источников, с повторами
+        "peakRssMb": round(_peak_rss_kb() / 1024, 1),
+        "stages": {name: round(t["wall"], 3) for name, t in profile.stage_totals().items()},
+        "rules": stats,
+        "rulesSha256": digest,
+    }
+
+
+def run_case_subprocess(pdf_path: str, workers: int, table_strategy: str, backends: str):
+    cmd = [sys.executable, os.path.abspath(__file__), "--run-case", pdf_path,
+           "--workers", str(workers), "--table-strategy", table_strategy, "--backends", backends]
+    res = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, text=True)
+    return json.loads(res.stdout.strip().splitlines()[-1])
+
+
+# ----------------- Report -----------------
+def compare(name, result, base, tolerance):
+    """Список проблем относительно baseline (пустой — всё в порядке)."""
+    problems = []
+    if base is None:
+        return problems
+    if result["rulesSha256"] != base["rulesSha256"]:
+        problems.append(f"{name}: rules changed ({base['rules']} -> {result['rules']})")
+    if result["pagesPerSec"] < base["pagesPerSec"] * (1 - tolerance):
+        problems.append(f"{name}: pages/s {result['pagesPerSec']} < baseline {base['pagesPerSec']} "
+                        f"(-{100 * (1 - result['pagesPerSec'] / base['pagesPerSec']):.0f}%)")
+    return problems
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Бенчмарк parse_eec_pdf.py")
+    ap.add_argument("--scales", default="1,10",
+                    help="масштабы по числу страниц: 1 — сам реестр, N — синтетика в N раз больше "
+                         "(100 — ~3500 страниц, около получаса; в baseline его нет)")
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--table-strategy", choices=["all", "adaptive"], default="all")
+    ap.add_argument("--backends", default="all")
+    ap.add_argument("--repeat", type=int, default=1, help="прогонов на случай, в отчёт идёт самый быстрый")
+    ap.add_argument("--baseline", default=DEFAULT_BASELINE)
+    ap.add_argument("--update-baseline", action="store_true", help="записать результаты как новый baseline")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="допустимое падение страниц/с (доля)")
+    ap.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "eec_bench"),
+                    help="куда складывать синтетические PDF (переиспользуются между запусками)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--run-case", metavar="PDF", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(args.run_case, max(1, args.workers), args.table_strategy, args.backends)))
+        return
+
+    os.makedirs(args.workdir, exist_ok=True)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = {}
+    problems = []
+    print(f"{'case':<34} {'pages':>6} {'sec':>8} {'pages/s':>8} {'codes/s':>8} {'hits/s':>9} {'RSS,MB':>7}  stages")
+    for scale in [int(x) for x in args.scales.split(",") if x.strip()]:
+        if scale == 1:
+            name, pdf_path = "registry", REGISTRY_PDF
+        else:
+            name = f"synthetic-x{scale}"
+            pdf_path = os.path.join(args.workdir, f"synthetic_x{scale}_seed{args.seed}.pdf")
+            if not os.path.exists(pdf_path):
+                make_synthetic_registry(pdf_path, REGISTRY_PAGES * scale, seed=args.seed)
+        key = f"{name}/workers={args.workers}/tables={args.table_strategy}"
+        if args.backends != "all":
+            key += f"/backends={args.backends}"
+
+        runs = [run_case_subprocess(pdf_path, max(1, args.workers), args.table_strategy, args.backends)
+                for _ in range(max(1, args.repeat))]
+        r = min(runs, key=lambda run: run["seconds"])
+        results[key] = r
+        stages = " ".join(f"{k}={v:.1f}" for k, v in sorted(r["stages"].items(), key=lambda kv: -kv[1]))
+        print(f"{key:<34} {r['pages']:>6} {r['seconds']:>8.2f} {r['pagesPerSec']:>8.2f} "
+              f"{r['codesPerSec']:>8.1f} {r['hitsPerSec']:>9.1f} {r['peakRssMb']:>7.1f}  {stages}")
+        if key not in baseline and not args.update_baseline:
+            print(f"note: {key}: no baseline, not compared")
+        problems += compare(key, r, baseline.get(key), args.tolerance)
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write("\n")
+        print("baseline updated:", args.baseline)
+        return
+
+    for p in problems:
+        print("FAIL:", p)
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+"""
+Пакетная проверка кодов ТН ВЭД (сразу вся декларация, тысячи строк).
+
+Правила загружаются один раз (rules.generated.json — то же, что читает checkTnved,
+или вывод parse_eec_pdf.py) и раскладываются в отсортированные массивы:
+  exact   — int64 10-значные коды;
+  prefix  — по массиву на каждую длину префикса;
+  ranges  — элементарные отрезки пространства 10-значных кодов, каждый помечен
+            первым (в порядке массива) диапазоном, который его покрывает.
+10-значные коды классифицируются одним проходом searchsorted (NumPy), остальные —
+по одному, той же логикой, что checkTnved. Без NumPy всё идёт через bisect.
+
+Ответ — тип совпадения и правило, как в checkTnved:
+  exact -> prefix (первый в порядке массива) -> range_prefix / range_numeric.
+
+Usage:
+  python scripts/eec_classify.py [--rules data/rules.generated.json] <code> [<code> ...]
+  python scripts/eec_classify.py [--rules ...] --file codes.txt      (по коду на строку, JSONL на выходе)
+  python scripts/eec_classify.py [--rules ...] --bench [N]           (по умолчанию 1 000 000 кодов)
+"""
+import argparse
+import heapq
+import json
+import os
+import random
+import re
+import sys
+from bisect import bisect_left, bisect_right
+from time import perf_counter
+
+# NumPy (зависимость, см. README) — пакетный searchsorted. Если не установлен — bisect по спискам.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from eec_ranges import CODE_LEN, range_bounds, range_interval
+
+RE_NON_DIGITS = re.compile(r"\D+")
+
+TYPES = (None, "exact", "prefix", "range_prefix", "range_numeric")
+NONE, EXACT, PREFIX, RANGE_PREFIX, RANGE_NUMERIC = range(len(TYPES))
+
+DEFAULT_RULES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "rules.generated.json")
+
+
+def digits(s) -> str:
+    return RE_NON_DIGITS.sub("", str(s if s is not None else ""))
+
+
+def _is_int(v) -> bool:
+    if isinstance(v, bool):
+        return False
+    return isinstance(v, int) or (np is not None and isinstance(v, np.integer))
+
+
+def range_kind(r):
+    """Какой проверкой checkTnved ловит диапазон: RANGE_PREFIX, RANGE_NUMERIC или None (никакой)."""
+    bounds = range_bounds(r)
+    if bounds is None:
+        return None
+    return RANGE_NUMERIC if bounds[0] == CODE_LEN else RANGE_PREFIX
+
+
+def label_segments(intervals):
+    """
+    intervals — [(lo, hi, idx)]. Возвращает (starts, labels): отрезок k = [starts[k], starts[k+1]),
+    labels[k] — минимальный idx среди покрывающих интервалов или -1. Один проход с кучей.
+    """
+    intervals = sorted(intervals)
+    bounds = sorted({lo for lo, _, _ in intervals} | {hi + 1 for _, hi, _ in intervals})
+    starts, labels = [], []
+    active = []  # (idx, hi)
+    j = 0
+    for b in bounds:
+        while j < len(intervals) and intervals[j][0] == b:
+            heapq.heappush(active, (intervals[j][2], intervals[j][1]))
+            j += 1
+        while active and active[0][1] < b:
+            heapq.heappop(active)
+        label = active[0][0] if active else -1
+        if not labels or labels[-1] != label:
+            starts.append(b)
+            labels.append(label)
+    return starts, labels
+
+
+class RuleTable:
+    """Правила в отсортированных массивах для пакетной классификации."""
+
+    def __init__(self, rules):
+        """rules — раздел "rules" из rules.generated.json (prefix/exact/ranges) или из eec_rules.json."""
+        if "prefixObjects" in rules:  # вывод parse_eec_pdf.py
+            rules = {
+                "prefix": [{**o, "source": "eec"} for o in rules.get("prefixObjects") or []],
+                "exact": [{"code": c, "source": "eec"} for c in rules.get("exact") or []],
+                "ranges": [{**r, "source": "eec"} for r in rules.get("ranges") or []],
+            }
+        self.exact = list(rules.get("exact") or [])
+        # "совместим и со string и с object"
+        self.prefix = [p if isinstance(p, dict) else {"prefix": str(p)} for p in rules.get("prefix") or []]
+        self.ranges = list(rules.get("ranges") or [])
+
+        # --- exact ---
+        self._exact_by_code = {}
+        for i, e in enumerate(self.exact):
+            self._exact_by_code.setdefault(str(e.get("code") or ""), i)
+        exact10 = sorted((int(c), i) for c, i in self._exact_by_code.items() if len(c) == CODE_LEN and c.isdigit())
+        self._exact_vals = [v for v, _ in exact10]
+        self._exact_idx = [i for _, i in exact10]
+
+        # --- prefix: по длинам ---
+        self._prefix_by_value = {}
+        for i, item in enumerate(self.prefix):
+            p = str(item.get("prefix") or "")
+            if p:
+                self._prefix_by_value.setdefault(p, i)
+        self._prefix_lengths = sorted({len(p) for p in self._prefix_by_value})
+        self._prefix_buckets = []  # (L, vals, idx) — только цифровые префиксы длины <= 10
+        for L in self._prefix_lengths:
+            items = sorted((int(p), i) for p, i in self._prefix_by_value.items() if len(p) == L and p.isdigit())
+            if L <= CODE_LEN and items:
+                self._prefix_buckets.append((L, [v for v, _ in items], [i for _, i in items]))
+
+        # --- ranges: отрезки в пространстве 10-значных кодов ---
+        self._range_kinds = [range_kind(r) for r in self.ranges]
+        intervals = []
+        for i, (r, kind) in enumerate(zip(self.ranges, self._range_kinds)):
+            if kind is None:
+                continue
+            lo, hi = range_interval(r)
+            intervals.append((lo, hi, i))
+        self._seg_starts, self._seg_labels = label_segments(intervals)
+
+        if np is not None:
+            self._np_exact_vals = np.array(self._exact_vals, dtype=np.int64)
+            self._np_exact_idx = np.array(self._exact_idx, dtype=np.int64)
+            self._np_prefix = [(L, np.array(vals, dtype=np.int64), np.array(idx, dtype=np.int64))
+                               for L, vals, idx in self._prefix_buckets]
+            self._np_seg_starts = np.array(self._seg_starts, dtype=np.int64)
+            self._np_seg_labels = np.array(self._seg_labels, dtype=np.int64)
+            self._np_range_types = np.array([kind or NONE for kind in self._range_kinds] or [NONE], dtype=np.int8)
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, "rb") as f:
+            data = f.read()
+        if data.startswith(b'{"type":"header"'):  # parse_eec_pdf.py --format jsonl
+            from eec_index import load_rules
+            return cls(load_rules(data))
+        return cls(json.loads(data)["rules"])
+
+    # --- один код ---
+    def match_one(self, code_raw):
+        """(type, index) для одного кода, как checkTnved; (None, -1) — нет совпадения."""
+        code = digits(code_raw)
+        if not code:
+            return NONE, -1
+        if len(code) == CODE_LEN:
+            return self._match_int(int(code))
+
+        i = self._exact_by_code.get(code)
+        if i is not None:
+            return EXACT, i
+
+        found = [self._prefix_by_value[code[:L]] for L in self._prefix_lengths
+                 if L <= len(code) and code[:L] in self._prefix_by_value]
+        if found:
+            return PREFIX, min(found)
+
+        for i, (r, kind) in enumerate(zip(self.ranges, self._range_kinds)):
+            a, b = str(r["from"]), str(r["to"])
+            if kind == RANGE_PREFIX and len(code) >= len(a) and a <= code[:len(a)] <= b:
+                return kind, i
+            if kind == RANGE_NUMERIC and int(a) <= int(code) <= int(b):
+                return kind, i
+        return NONE, -1
+
+    def _match_int(self, v: int):
+        """10-значный код как число: bisect по тем же массивам, что и пакетный путь."""
+        k = bisect_left(self._exact_vals, v)
+        if k < len(self._exact_vals) and self._exact_vals[k] == v:
+            return EXACT, self._exact_idx[k]
+
+        best = None
+        for L, vals, idx in self._prefix_buckets:
+            head = v // 10 ** (CODE_LEN - L)
+            k = bisect_left(vals, head)
+            if k < len(vals) and vals[k] == head and (best is None or idx[k] < best):
+                best = idx[k]
+        if best is not None:
+            return PREFIX, best
+
+        k = bisect_right(self._seg_starts, v) - 1
+        label = self._seg_labels[k] if k >= 0 else -1
+        if label >= 0:
+            return self._range_kinds[label], label
+        return NONE, -1
+
+    # --- пакет ---
+    def classify(self, codes):
+        """
+        codes — iterable строк (как ввёл пользователь) или целых (10-значные коды: ведущие
+        нули числу не нужны, 101210000 — это 0101210000).
+        Возвращает (types, indexes): тип (см. TYPES) и индекс правила в self.exact /
+        self.prefix / self.ranges для каждого кода; без NumPy — списки.
+        """
+        if np is not None and isinstance(codes, np.ndarray) and codes.dtype.kind in "iu":
+            return self._classify_np(codes.astype(np.int64, copy=False))
+
+        codes = list(codes)
+        n = len(codes)
+        types = [NONE] * n
+        indexes = [-1] * n
+
+        pos10, vals10 = [], []
+        for k, c in enumerate(codes):
+            if isinstance(c, str):
+                s = c if c.isdigit() else digits(c)
+            elif _is_int(c) and 0 <= c < 10 ** CODE_LEN:
+                s = f"{int(c):0{CODE_LEN}d}"  # как в пути NumPy: целое — это 10-значный код
+            else:
+                s = digits(c)
+            if len(s) == CODE_LEN:
+                pos10.append(k)
+                vals10.append(int(s))
+            elif s:
+                types[k], indexes[k] = self.match_one(s)
+
+        if np is not None and vals10:
+            t10, i10 = self._classify_np(np.array(vals10, dtype=np.int64))
+            t = np.array(types, dtype=np.int8)
+            ix = np.array(indexes, dtype=np.int64)
+            t[pos10] = t10
+            ix[pos10] = i10
+            return t, ix
+
+        for k, v in zip(pos10, vals10):
+            types[k], indexes[k] = self._match_int(v)
+        return types, indexes
+
+    def _classify_np(self, v):
+        n = len(v)
+        types = np.zeros(n, dtype=np.int8)
+        indexes = np.full(n, -1, dtype=np.int64)
+
+        # exact
+        if len(self._np_exact_vals):
+            k = np.minimum(np.searchsorted(self._np_exact_vals, v), len(self._np_exact_vals) - 1)
+            hit = self._np_exact_vals[k] == v
+            types[hit] = EXACT
+            indexes[hit] = self._np_exact_idx[k[hit]]
+
+        # prefix: минимальный индекс правила среди всех длин (= первый в порядке массива)
+        best = np.full(n, np.iinfo(np.int64).max, dtype=np.int64)
+        for L, vals, idx in self._np_prefix:
+            head = v // (10 ** (CODE_LEN - L))
+            k = np.minimum(np.searchsorted(vals, head), len(vals) - 1)
+            hit = vals[k] == head
+            best = np.where(hit, np.minimum(best, idx[k]), best)
+        mask = (types == NONE) & (best != np.iinfo(np.int64).max)
+        types[mask] = PREFIX
+        indexes[mask] = best[mask]
+
+        # ranges
+        if len(self._np_seg_starts):
+            k = np.searchsorted(self._np_seg_starts, v, side="right") - 1
+            label = np.where(k >= 0, self._np_seg_labels[np.maximum(k, 0)], -1)
+            mask = (types == NONE) & (label >= 0)
+            types[mask] = self._np_range_types[label[mask]]
+            indexes[mask] = label[mask]
+
+        return types, indexes
+
+    def rule(self, type_, index):
+        """Правило, на которое указывает (type, index) из classify / match_one."""
+        type_ = int(type_)
+        if type_ == EXACT:
+            return self.exact[index]
+        if type_ == PREFIX:
+            return self.prefix[index]
+        if type_ in (RANGE_PREFIX, RANGE_NUMERIC):
+            return self.ranges[index]
+        return None
+
+    def results(self, codes):
+        """classify + расшифровка: (code, type, rule) — для вывода, не для горячего пути."""
+        codes = list(codes)
+        types, indexes = self.classify(codes)
+        for code, t, i in zip(codes, types, indexes):
+            yield code, TYPES[int(t)], self.rule(t, int(i))
+
+
+# ----------------- Bench -----------------
+def bench(table: RuleTable, n: int, seed: int = 1):
+    """n кодов: треть — рядом с правилами (чтобы были совпадения), остальные случайные."""
+    rnd = random.Random(seed)
+    heads = [str(e.get("code") or "")[:6] for e in table.exact] + [str(p.get("prefix") or "") for p in table.prefix]
+    heads = [h for h in heads if h.isdigit()] or ["0"]
+    codes = []
+    for k in range(n):
+        if k % 3 == 0:
+            h = rnd.choice(heads)
+            codes.append(h + "".join(rnd.choice("0123456789") for _ in range(CODE_LEN - len(h))))
+        else:
+            codes.append(f"{rnd.randrange(10 ** CODE_LEN):010d}")
+
+    out = {"codes": n, "numpy": np is not None}
+    t0 = perf_counter()
+    types, _ = table.classify(codes)
+    out["strSeconds"] = round(perf_counter() - t0, 3)
+    if np is not None:
+        arr = np.array([int(c) for c in codes], dtype=np.int64)
+        t0 = perf_counter()
+        types, _ = table.classify(arr)
+        out["int64Seconds"] = round(perf_counter() - t0, 3)
+        out["codesPerSec"] = round(n / out["int64Seconds"])
+    else:
+        out["codesPerSec"] = round(n / out["strSeconds"])
+    out["matched"] = {TYPES[t]: int(sum(1 for x in types if x == t)) for t in range(1, len(TYPES))}
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Пакетная проверка кодов ТН ВЭД")
+    ap.add_argument("codes", nargs="*")
+    ap.add_argument("--rules", default=DEFAULT_RULES, help="rules.generated.json или вывод parse_eec_pdf.py")
+    ap.add_argument("--file", help="файл с кодами, по одному на строку")
+    ap.add_argument("--bench", nargs="?", type=int, const=1_000_000, metavar="N",
+                    help="замер скорости на N случайных кодах (по умолчанию 1 000 000)")
+    args = ap.parse_args()
+
+    t0 = perf_counter()
+    table = RuleTable.load(args.rules)
+    load_s = perf_counter() - t0
+
+    if args.bench:
+        res = bench(table, args.bench)
+        res["loadSeconds"] = round(load_s, 4)
+        print(json.dumps(res, ensure_ascii=False))
+        return
+
+    codes = list(args.codes)
+    if args.file:
+        with open(args.file, "r", encoding="utf-8") as f:
+            codes += [line.strip() for line in f if line.strip()]
+    if not codes:
+        ap.print_usage()
+        sys.exit(2)
+    for code, type_, rule in table.results(codes):
+        print(json.dumps({"code": code, "type": type_, "rule": rule}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,448 @@
+"""
+История правил ЕЭК по версиям реестра: «требовал ли код X пломбу на дату D?» без PDF.
+
+Хранилище — каталог:
+  versions.json  — версии по возрастанию даты: {"id", "date", "source", "fileSha256", "stats"};
+  rules.jsonl    — по строке на каждое правило, когда-либо встречавшееся (без повторов
+                   между версиями): {"type": "exact"|"prefix"|"range", "rule": {...},
+                   "valid": [[from_id, to_id|null], ...]} — правило действует с версии
+                   from_id до версии to_id, не включая её (null — действует до сих пор);
+  history.idx    — бинарный индекс для запросов, пересобирается при каждой новой версии.
+
+Версии можно добавлять не по порядку дат (бэкфилл архива): интервалы пересчитываются
+по порядку дат. Версия с тем же SHA-256 PDF, что уже есть, повторно не добавляется.
+
+Формат history.idx (little-endian), версии в нём — порядковые номера по дате (ord):
+
+  header (96 байт):
+    0   8s   magic  b"EECHIS01"
+    8   u32  version (= 2)
+    12  u32  n_versions
+    16  u32  n_exact
+    20  u32  n_prefix4
+    24  u32  n_prefix6
+    28  u32  n_range4, n_range6, n_numeric
+    40  u64  off_dates, off_exact, off_prefix4, off_prefix6, off_range4, off_range6, off_numeric
+
+  dates:    n_versions x i64                — даты версий (секунды UTC), по возрастанию
+  exact:    n_exact   x (u64 code, u32 from, u32 to)        — по (code, from)
+  prefix4:  n_prefix4 x (u32 prefix, u32 from, u32 to, u32 raw) — raw 1: "из ####"
+  prefix6:  то же для 6-значных
+  range4:   n_range4  x (u64 lo, u64 hi, u64 max_hi, u32 from, u32 to) — диапазоны по первым
+            4 цифрам, по lo; max_hi — максимум hi среди записей до этой включительно:
+            содержащие код интервалы ищутся бинарным поиском и коротким проходом назад.
+  range6:   то же по первым 6 цифрам; numeric — то же для 10-значных (весь код как число).
+  Интервал версий [from, to) — в ord; to = n_versions — действует в последней версии.
+
+lookup(code, at) отвечает так же, как EecIndex.lookup по правилам версии, действовавшей
+на дату at (exact -> prefix -> range; типы диапазонов — как в checkTnved, см. eec_index).
+У диапазона from/to — объединение диапазонов версии, содержащих код (EecIndex может
+вернуть шире, если к ним примыкают соседние).
+
+Usage:
+  python scripts/eec_history.py add <store_dir> <eec_rules.json|.jsonl> [--date DATE] [--source NAME]
+  python scripts/eec_history.py lookup <store_dir> <code> [<code> ...] [--at DATE]
+  python scripts/eec_history.py history <store_dir> <code>
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from datetime import datetime, timezone
+
+from eec_index import load_output
+from eec_ranges import CODE_LEN
+
+MAGIC = b"EECHIS01"
+VERSION = 2
+HEADER = struct.Struct("<8s8I7Q")
+RANGE_LENS = (4, 6, 10)  # порядок проверки диапазонов
+DATE = struct.Struct("<q")
+EXACT = struct.Struct("<QII")
+PREFIX = struct.Struct("<IIII")
+RANGE = struct.Struct("<QQQII")
+
+
+# ----------------- Dates -----------------
+def parse_date(value) -> int:
+    """"2025-03-01", ISO-время (в т.ч. с Z) или datetime -> секунды UTC."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    dt = value if isinstance(value, datetime) else datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def format_date(ts: int) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+# ----------------- Rules -----------------
+def rule_key(kind: str, rule) -> tuple:
+    """Ключ правила между версиями: у префикса значим raw, у диапазона — границы и режим."""
+    if kind == "exact":
+        return kind, rule["code"]
+    if kind == "prefix":
+        return kind, rule["prefix"], rule.get("raw")
+    return kind, rule["from"], rule["to"], rule.get("mode")
+
+
+def rule_entries(rules):
+    """Раздел "rules" вывода parse_eec_pdf.py -> {key: (kind, rule)}."""
+    out = {}
+    for code in rules.get("exact", []):
+        code = code["code"] if isinstance(code, dict) else str(code)
+        out[rule_key("exact", {"code": code})] = ("exact", {"code": code})
+    for obj in rules.get("prefixObjects", []):
+        obj = {"prefix": obj, "raw": None} if isinstance(obj, str) else {"prefix": obj["prefix"], "raw": obj.get("raw")}
+        out[rule_key("prefix", obj)] = ("prefix", obj)
+    for r in rules.get("ranges", []):
+        out[rule_key("range", r)] = ("range", dict(r))
+    return out
+
+
+def _runs(ids, present):
+    """Порядок версий ids + множество id, где правило есть -> [[from_id, to_id|None], ...]."""
+    valid = []
+    start = None
+    for vid in ids:
+        if vid in present:
+            if start is None:
+                start = vid
+        elif start is not None:
+            valid.append([start, vid])
+            start = None
+    if start is not None:
+        valid.append([start, None])
+    return valid
+
+
+def _write_atomic(path: str, data: bytes):
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+
+
+# ----------------- Store -----------------
+class HistoryStore:
+    """Каталог истории: добавление версий и пересборка индекса (см. описание модуля)."""
+
+    VERSIONS = "versions.json"
+    RULES = "rules.jsonl"
+    INDEX = "history.idx"
+
+    def __init__(self, path: str):
+        self.dir = path
+        self.versions = []
+        self.rules = {}  # key -> {"type", "rule", "valid"}
+        try:
+            with open(os.path.join(path, self.VERSIONS), "r", encoding="utf-8") as f:
+                self.versions = json.load(f)
+            with open(os.path.join(path, self.RULES), "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        rec = json.loads(line)
+                        self.rules[rule_key(rec["type"], rec["rule"])] = rec
+        except FileNotFoundError:
+            pass
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.dir, self.INDEX)
+
+    def _order(self):
+        return [v["id"] for v in self.versions]
+
+    def add(self, rules, date, source: str = None, file_sha: str = None):
+        """
+        Добавить версию реестра с правилами rules (раздел "rules") на дату date и сохранить.
+        Возвращает {"added", "version", "opened", "closed"}: opened/closed — правила,
+        появившиеся/исчезнувшие относительно предыдущей по дате версии.
+        """
+        if file_sha:
+            for v in self.versions:
+                if v.get("fileSha256") == file_sha:
+                    return {"added": False, "version": v["id"], "opened": 0, "closed": 0}
+
+        old_order = self._order()
+        pos = {vid: i for i, vid in enumerate(old_order)}
+        present = {}
+        for key, rec in self.rules.items():
+            ids = set()
+            for a, b in rec["valid"]:
+                ids.update(old_order[pos[a]:pos[b] if b is not None else len(old_order)])
+            present[key] = ids
+
+        ts = parse_date(date)
+        vid = max(old_order, default=0) + 1
+        entries = rule_entries(rules)
+        self.versions.append({
+            "id": vid,
+            "date": format_date(ts),
+            "source": source,
+            "fileSha256": file_sha,
+            "stats": {"exact": sum(k[0] == "exact" for k in entries), "prefix": sum(k[0] == "prefix" for k in entries),
+                      "ranges": sum(k[0] == "range" for k in entries)},
+        })
+        self.versions.sort(key=lambda v: (parse_date(v["date"]), v["id"]))
+        order = self._order()
+
+        for key, (kind, rule) in entries.items():
+            if key not in self.rules:
+                self.rules[key] = {"type": kind, "rule": rule, "valid": []}
+                present[key] = set()
+            present[key].add(vid)
+        for key, rec in self.rules.items():
+            rec["valid"] = _runs(order, present[key])
+
+        i = order.index(vid)
+        prev = order[i - 1] if i > 0 else None
+        opened = sum(1 for ids in present.values() if vid in ids and prev not in ids)
+        closed = sum(1 for ids in present.values() if prev in ids and vid not in ids) if prev is not None else 0
+        self.save()
+        return {"added": True, "version": vid, "opened": opened, "closed": closed}
+
+    def save(self):
+        os.makedirs(self.dir, exist_ok=True)
+        lines = [json.dumps(rec, ensure_ascii=False, separators=(",", ":"))
+                 for _, rec in sorted(self.rules.items(), key=lambda kv: tuple(str(x) for x in kv[0]))]
+        _write_atomic(os.path.join(self.dir, self.RULES), ("\n".join(lines) + "\n").encode("utf-8"))
+        _write_atomic(os.path.join(self.dir, self.VERSIONS),
+                      json.dumps(self.versions, ensure_ascii=False, indent=2).encode("utf-8"))
+        _write_atomic(self.index_path, self.build_index())
+
+    def build_index(self) -> bytes:
+        order = self._order()
+        n = len(order)
+        pos = {vid: i for i, vid in enumerate(order)}
+
+        def spans(rec):
+            for a, b in rec["valid"]:
+                yield pos[a], pos[b] if b is not None else n
+
+        exact, prefixes, ranges = [], {4: [], 6: []}, {L: [] for L in RANGE_LENS}
+        for rec in self.rules.values():
+            rule = rec["rule"]
+            if rec["type"] == "exact":
+                code = rule["code"]
+                if len(code) == CODE_LEN and code.isdigit():
+                    exact += [(int(code), a, b) for a, b in spans(rec)]
+            elif rec["type"] == "prefix":
+                p = str(rule["prefix"])
+                if len(p) in prefixes and p.isdigit():
+                    prefixes[len(p)] += [(int(p), a, b, int(rule.get("raw") is not None)) for a, b in spans(rec)]
+            else:
+                # как eec_index.range_tables: 4/6 — по началу кода, 10 — числом, остальное checkTnved не ловит
+                lo, hi = str(rule.get("from") or ""), str(rule.get("to") or "")
+                if len(lo) in ranges and len(lo) == len(hi) and lo.isdigit() and hi.isdigit() and lo <= hi:
+                    ranges[len(lo)] += [(int(lo), int(hi), a, b) for a, b in spans(rec)]
+
+        body = bytearray()
+        offsets = []
+        offsets.append(HEADER.size + len(body))
+        for vid in order:
+            body += DATE.pack(parse_date(self.versions[pos[vid]]["date"]))
+        offsets.append(HEADER.size + len(body))
+        for item in sorted(exact):
+            body += EXACT.pack(*item)
+        for L in (4, 6):
+            offsets.append(HEADER.size + len(body))
+            for item in sorted(prefixes[L]):
+                body += PREFIX.pack(*item)
+        for L in RANGE_LENS:
+            offsets.append(HEADER.size + len(body))
+            max_hi = 0
+            for lo, hi, a, b in sorted(ranges[L]):
+                max_hi = max(max_hi, hi)
+                body += RANGE.pack(lo, hi, max_hi, a, b)
+
+        header = HEADER.pack(MAGIC, VERSION, n, len(exact), len(prefixes[4]), len(prefixes[6]),
+                             *(len(ranges[L]) for L in RANGE_LENS), *offsets)
+        return header + bytes(body)
+
+
+# ----------------- Query -----------------
+class EecHistory:
+    """history.idx через mmap: поиск на дату и история кода — бинарным поиском, без JSON."""
+
+    def __init__(self, path: str):
+        if os.path.isdir(path):
+            path = os.path.join(path, HistoryStore.INDEX)
+        self.path = path
+        self._f = open(path, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = HEADER.unpack_from(self._mm, 0)[:2] if len(self._mm) >= HEADER.size else (None, None)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path}: not an EEC history index (magic={magic!r}, version={version})")
+        (_, _, self.n_versions, self.n_exact, n4, n6, r4, r6, rnum,
+         self._off_dates, self._off_exact, off4, off6, off_r4, off_r6, off_rnum) = HEADER.unpack_from(self._mm, 0)
+        self._prefix = {4: (off4, n4), 6: (off6, n6)}
+        self._ranges = [(4, off_r4, r4), (6, off_r6, r6), (CODE_LEN, off_rnum, rnum)]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def _bisect(self, off: int, n: int, st: struct.Struct, value: int, right: bool) -> int:
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key = st.unpack_from(self._mm, off + mid * st.size)[0]
+            if key < value or (right and key == value):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _equal(self, off: int, n: int, st: struct.Struct, value: int):
+        i = self._bisect(off, n, st, value, right=False)
+        while i < n:
+            rec = st.unpack_from(self._mm, off + i * st.size)
+            if rec[0] != value:
+                break
+            yield rec
+            i += 1
+
+    def dates(self):
+        return [DATE.unpack_from(self._mm, self._off_dates + i * DATE.size)[0] for i in range(self.n_versions)]
+
+    def version_at(self, at=None):
+        """ord версии, действовавшей на дату at (None — последняя); None — раньше первой версии."""
+        if at is None:
+            return self.n_versions - 1 if self.n_versions else None
+        i = self._bisect(self._off_dates, self.n_versions, DATE, parse_date(at), right=True) - 1
+        return i if i >= 0 else None
+
+    def _candidates(self, code: str):
+        """Записи, которые могут ответить на code в какой-либо версии: [(type, данные, from, to)]."""
+        out = []
+        if len(code) == CODE_LEN:
+            for c, a, b in self._equal(self._off_exact, self.n_exact, EXACT, int(code)):
+                out.append(("exact", code, a, b))
+        for L in (4, 6):
+            if len(code) < L:
+                break
+            off, n = self._prefix[L]
+            for p, a, b, raw in self._equal(off, n, PREFIX, int(code[:L])):
+                out.append(("prefix", (L, code[:L], raw), a, b))
+        for L, off, n in self._ranges:
+            if L < CODE_LEN:
+                if len(code) < L:
+                    continue
+                value = int(code[:L])
+            else:
+                value = int(code)
+                if value >= 10 ** CODE_LEN:
+                    continue
+            i = self._bisect(off, n, RANGE, value, right=True) - 1
+            while i >= 0:
+                lo, hi, max_hi, a, b = RANGE.unpack_from(self._mm, off + i * RANGE.size)
+                if max_hi < value:
+                    break
+                if hi >= value:
+                    out.append(("range", (L, lo, hi), a, b))
+                i -= 1
+        return out
+
+    @staticmethod
+    def _answer(candidates, ord_: int):
+        """Ответ lookup в версии ord_ по кандидатам (порядок как у EecIndex.lookup)."""
+        live = [(t, d) for t, d, a, b in candidates if a <= ord_ < b]
+        for t, d in live:
+            if t == "exact":
+                return {"type": "exact", "code": d}
+        prefixes = sorted(d for t, d in live if t == "prefix")
+        if prefixes:
+            # первый — самый короткий; флаг raw, если он есть хоть у одного варианта (как в EecIndex)
+            L, p, _ = prefixes[0]
+            raw = max(r for L2, p2, r in prefixes if p2 == p)
+            return {"type": "prefix", "prefix": p, "raw": f"из {p}" if raw else None}
+        for L in RANGE_LENS:
+            found = [d[1:] for t, d in live if t == "range" and d[0] == L]
+            if found:
+                lo, hi = min(lo for lo, _ in found), max(hi for _, hi in found)
+                return {"type": "range", "from": f"{lo:0{L}d}", "to": f"{hi:0{L}d}"}
+        return None
+
+    def lookup(self, code: str, at=None):
+        """Проверка кода по правилам версии, действовавшей на дату at (None — последняя)."""
+        code = "".join(ch for ch in str(code or "") if ch.isdigit())
+        ord_ = self.version_at(at)
+        if not code or ord_ is None:
+            return None
+        return self._answer(self._candidates(code), ord_)
+
+    def history(self, code: str):
+        """
+        Как менялся ответ lookup для кода: [{"from", "to", "match"}] по периодам,
+        from/to — даты версий (to = None — действует до сих пор), match — ответ lookup или None.
+        """
+        code = "".join(ch for ch in str(code or "") if ch.isdigit())
+        if not code or not self.n_versions:
+            return []
+        candidates = self._candidates(code)
+        bounds = sorted({0} | {x for _, _, a, b in candidates for x in (a, b) if x < self.n_versions})
+        dates = self.dates()
+        periods = []
+        for ord_ in bounds:
+            match = self._answer(candidates, ord_)
+            if periods and periods[-1]["match"] == match:
+                continue
+            if periods:
+                periods[-1]["to"] = format_date(dates[ord_])
+            periods.append({"from": format_date(dates[ord_]), "to": None, "match": match})
+        return periods
+
+
+def main():
+    args = sys.argv[1:]
+    opts = {}
+    for name in ("--date", "--source", "--at"):
+        if name in args:
+            i = args.index(name)
+            opts[name] = args[i + 1]
+            del args[i:i + 2]
+
+    if len(args) >= 3 and args[0] == "add":
+        with open(args[2], "rb") as f:
+            doc = load_output(f.read())
+        date = opts.get("--date") or doc["generatedAt"]
+        if not date:
+            print("--date: the output has no generatedAt")
+            sys.exit(2)
+        result = HistoryStore(args[1]).add(doc["rules"], date, source=opts.get("--source") or args[2])
+        print("OK:", args[1], result)
+        return
+
+    if len(args) >= 3 and args[0] == "lookup":
+        with EecHistory(args[1]) as hist:
+            for code in args[2:]:
+                print(code, json.dumps(hist.lookup(code, opts.get("--at")), ensure_ascii=False))
+        return
+
+    if len(args) == 3 and args[0] == "history":
+        with EecHistory(args[1]) as hist:
+            print(json.dumps(hist.history(args[2]), ensure_ascii=False, indent=2))
+        return
+
+    print("Usage: python scripts/eec_history.py add <store_dir> <eec_rules.json|.jsonl> [--date DATE] [--source NAME]")
+    print("       python scripts/eec_history.py lookup <store_dir> <code> [<code> ...] [--at DATE]")
+    print("       python scripts/eec_history.py history <store_dir> <code>")
+    sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
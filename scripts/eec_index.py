@@ -0,0 +1,292 @@
+"""
+Компактный бинарный индекс правил ЕЭК (рядом с eec_rules.json) и чтение из него.
+
+Файл открывается через mmap, поиск — бинарный (O(log n)), разбирать JSON не нужно.
+
+Формат (все числа little-endian):
+
+  header (88 байт):
+    0   8s   magic  b"EECIDX01"
+    8   u32  version (= 2)
+    12  u32  n_exact
+    16  u32  n_prefix4
+    20  u32  n_prefix6
+    24  u32  n_range4
+    28  u32  n_range6
+    32  u32  n_numeric
+    36  u32  reserved (0)
+    40  u64  off_exact
+    48  u64  off_prefix4
+    56  u64  off_prefix6
+    64  u64  off_range4
+    72  u64  off_range6
+    80  u64  off_numeric
+
+  exact:    n_exact   x u64          — 10-значные коды как числа, по возрастанию
+  prefix4:  n_prefix4 x u32          — 4-значные префиксы, по возрастанию
+            n_prefix4 x u8           — флаг 1: префикс задан как "из ####" (raw)
+  prefix6:  n_prefix6 x u32 + n_prefix6 x u8 — то же для 6-значных
+  range4:   n_range4  x (u32 lo, u32 hi) — диапазоны по первым 4 цифрам ("0103"-"0106"),
+            непересекающиеся, по возрастанию; соседние/перекрывающиеся слиты
+  range6:   n_range6  x (u32 lo, u32 hi) — то же по первым 6 цифрам
+  numeric:  n_numeric x (u64 lo, u64 hi) — 10-значные диапазоны (from..to как числа), слиты
+
+Типы диапазонов не смешиваются: checkTnved сравнивает их по-разному.
+  range4/range6: код не короче L цифр, первые L цифр в [from, to];
+  numeric:       код целиком как число в [from, to] (короткий код — маленькое число,
+                 длинный — большое: "9401" и "940100000012" в 9401000000-9401999999 не попадают).
+Диапазоны другой длины (8 цифр, from и to разной длины) checkTnved не ловит — их в индексе нет.
+Префикс, под которым уже есть более короткий префикс, недостижим и в индекс не попадает
+(eec_ranges.normalize_rules); диапазоны берутся из правил как есть.
+
+lookup(code) проверяет в том же порядке, что checkTnved: exact -> prefix -> range.
+
+Usage:
+  python scripts/eec_index.py build <eec_rules.json|.jsonl> <eec_rules.idx>
+  python scripts/eec_index.py lookup <eec_rules.idx> <code> [<code> ...]
+"""
+import json
+import mmap
+import struct
+import sys
+
+from eec_ranges import CODE_LEN, merge_intervals, normalize_rules
+
+MAGIC = b"EECIDX01"
+VERSION = 2
+HEADER = struct.Struct("<8s8I6Q")
+U64 = struct.Struct("<Q")
+U32 = struct.Struct("<I")
+RANGE = struct.Struct("<QQ")
+RANGE32 = struct.Struct("<II")
+
+
+def load_output(data: bytes):
+    """
+    Вывод parse_eec_pdf.py — JSON (pretty/compact) или JSONL (--format jsonl) —
+    -> {"generatedAt", "rules", "provenance", "stats"} (provenance и stats могут отсутствовать -> None).
+    """
+    if not data.startswith(b'{"type":"header"'):
+        doc = json.loads(data)
+        return {"generatedAt": doc.get("generatedAt"), "rules": doc["rules"], "provenance": doc.get("provenance"),
+                "stats": doc.get("stats")}
+    out = {"generatedAt": None, "rules": {"prefixObjects": [], "exact": [], "ranges": []}, "provenance": None,
+           "stats": None}
+    rules = out["rules"]
+    for line in data.splitlines():
+        if not line.strip():
+            continue
+        rec = json.loads(line)
+        kind = rec.pop("type")
+        if kind == "prefix":
+            rules["prefixObjects"].append(rec)
+        elif kind == "exact":
+            rules["exact"].append(rec["code"])
+        elif kind == "range":
+            rules["ranges"].append(rec)
+        elif kind == "header":
+            out["generatedAt"] = rec.get("generatedAt")
+        elif kind == "provenance":
+            out["provenance"] = rec
+        elif kind == "stats":
+            out["stats"] = rec
+    return out
+
+
+def load_rules(data: bytes):
+    """Раздел "rules" из вывода parse_eec_pdf.py в любом формате."""
+    return load_output(data)["rules"]
+
+
+def range_tables(ranges):
+    """Диапазоны -> {4: [(lo, hi)], 6: [...], 10: [...]} по тому, как их проверяет checkTnved; слиты."""
+    tables = {4: [], 6: [], CODE_LEN: []}
+    for r in ranges:
+        a = str(r.get("from") or "")
+        b = str(r.get("to") or "")
+        if len(a) in tables and len(a) == len(b) and a.isdigit() and b.isdigit() and int(a) <= int(b):
+            tables[len(a)].append((int(a), int(b)))
+    return {L: merge_intervals(items) for L, items in tables.items()}
+
+
+def build_index(rules) -> bytes:
+    """
+    rules — раздел "rules" из eec_rules.json (prefixObjects / exact / ranges).
+    exact и префиксы — из минимального набора (eec_ranges.normalize_rules), диапазоны —
+    по типам (range_tables): ответы lookup те же, что у checkTnved.
+    """
+    ranges = range_tables(rules.get("ranges", []))
+    rules = normalize_rules(rules)["minimal"]
+    exact = sorted({int(c) for c in rules.get("exact", []) if len(c) == CODE_LEN and c.isdigit()})
+
+    prefixes = {4: {}, 6: {}}
+    for obj in rules.get("prefixObjects", []):
+        p = str(obj.get("prefix") or "")
+        if len(p) in prefixes and p.isdigit():
+            prefixes[len(p)][int(p)] = prefixes[len(p)].get(int(p), 0) or int(obj.get("raw") is not None)
+
+    body = bytearray()
+    offsets = []
+
+    offsets.append(HEADER.size + len(body))
+    for c in exact:
+        body += U64.pack(c)
+
+    for L in (4, 6):
+        offsets.append(HEADER.size + len(body))
+        items = sorted(prefixes[L].items())
+        for p, _ in items:
+            body += U32.pack(p)
+        body += bytes(flag for _, flag in items)
+
+    # выравниваем интервалы на 8 байт
+    body += b"\0" * (-(HEADER.size + len(body)) % 8)
+    for L, st in ((4, RANGE32), (6, RANGE32), (CODE_LEN, RANGE)):
+        offsets.append(HEADER.size + len(body))
+        for lo, hi in ranges[L]:
+            body += st.pack(lo, hi)
+
+    header = HEADER.pack(MAGIC, VERSION, len(exact), len(prefixes[4]), len(prefixes[6]), len(ranges[4]),
+                         len(ranges[6]), len(ranges[CODE_LEN]), 0, *offsets)
+    return header + bytes(body)
+
+
+def write_index(rules, path: str):
+    data = build_index(rules)
+    with open(path, "wb") as f:
+        f.write(data)
+    return len(data)
+
+
+class EecIndex:
+    """Индекс, открытый через mmap. Поиск — бинарный, без загрузки в память целиком."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._f = open(path, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = HEADER.unpack_from(self._mm, 0)[:2] if len(self._mm) >= HEADER.size else (None, None)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path}: not an EEC index (magic={magic!r}, version={version})")
+        (_, _, self.n_exact, n4, n6, r4, r6, rnum, _,
+         self._off_exact, off4, off6, off_r4, off_r6, off_rnum) = HEADER.unpack_from(self._mm, 0)
+        self._prefix = {4: (off4, n4), 6: (off6, n6)}
+        # (L, off, n, struct): порядок проверки диапазонов
+        self._ranges = [(4, off_r4, r4, RANGE32), (6, off_r6, r6, RANGE32), (CODE_LEN, off_rnum, rnum, RANGE)]
+        self.n_ranges = r4 + r6 + rnum
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    # --- бинарный поиск по массиву фиксированной ширины ---
+    def _bisect_right(self, off: int, n: int, st: struct.Struct, value: int) -> int:
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if st.unpack_from(self._mm, off + mid * st.size)[0] <= value:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _find(self, off: int, n: int, st: struct.Struct, value: int):
+        i = self._bisect_right(off, n, st, value) - 1
+        if i >= 0 and st.unpack_from(self._mm, off + i * st.size)[0] == value:
+            return i
+        return None
+
+    def has_exact(self, code: str) -> bool:
+        if len(code) != CODE_LEN:
+            return False
+        return self._find(self._off_exact, self.n_exact, U64, int(code)) is not None
+
+    def find_prefix(self, code: str):
+        """Первый (самый короткий) префикс, под который попадает code: (prefix, raw) или None."""
+        for L in (4, 6):
+            if len(code) < L:
+                break
+            off, n = self._prefix[L]
+            i = self._find(off, n, U32, int(code[:L]))
+            if i is not None:
+                p = code[:L]
+                return p, (f"из {p}" if self._mm[off + n * U32.size + i] else None)
+        return None
+
+    def find_range(self, code: str):
+        """
+        Слитый диапазон, под который code попадает по правилам checkTnved: (from, to) строками
+        длины L (4/6 — по первым L цифрам кода, 10 — весь код как число) или None.
+        """
+        for L, off, n, st in self._ranges:
+            if L < CODE_LEN:
+                if len(code) < L:
+                    continue
+                value = int(code[:L])
+            else:
+                value = int(code)
+                if value >= 10 ** CODE_LEN:
+                    continue
+            i = self._bisect_right(off, n, st, value) - 1
+            if i >= 0:
+                lo, hi = st.unpack_from(self._mm, off + i * st.size)
+                if lo <= value <= hi:
+                    return f"{lo:0{L}d}", f"{hi:0{L}d}"
+        return None
+
+    def lookup(self, code: str):
+        """
+        Проверка кода: exact -> prefix -> range (как checkTnved).
+        Возвращает {"type": "exact"|"prefix"|"range", ...} или None.
+        """
+        code = "".join(ch for ch in str(code or "") if ch.isdigit())
+        if not code:
+            return None
+
+        if self.has_exact(code):
+            return {"type": "exact", "code": code}
+
+        found = self.find_prefix(code)
+        if found is not None:
+            p, raw = found
+            return {"type": "prefix", "prefix": p, "raw": raw}
+
+        found = self.find_range(code)
+        if found is not None:
+            return {"type": "range", "from": found[0], "to": found[1]}
+
+        return None
+
+
+def main():
+    if len(sys.argv) >= 4 and sys.argv[1] == "build":
+        with open(sys.argv[2], "rb") as f:
+            rules = load_rules(f.read())
+        size = write_index(rules, sys.argv[3])
+        print("OK:", sys.argv[3], f"{size} bytes")
+        return
+
+    if len(sys.argv) >= 4 and sys.argv[1] == "lookup":
+        with EecIndex(sys.argv[2]) as idx:
+            for code in sys.argv[3:]:
+                print(code, json.dumps(idx.lookup(code), ensure_ascii=False))
+        return
+
+    print("Usage: python scripts/eec_index.py build <eec_rules.json|.jsonl> <eec_rules.idx>")
+    print("       python scripts/eec_index.py lookup <eec_rules.idx> <code> [<code> ...]")
+    sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Нормализация правил ЕЭК: минимальный набор с теми же ответами, что у checkTnved.
+
+Диапазоны checkTnved сравнивает по-разному, поэтому они живут в своих пространствах
+(range_bounds) и между собой не смешиваются:
+  range "2203"-"2299"   (4 цифры) -> [2203, 2299]   по первым 4 цифрам кода (код не короче 4);
+  range "220300"-"220399" (6)     -> [220300, 220399] по первым 6 цифрам;
+  range from..to        (10)      -> [from, to]     весь код как число, любой длины.
+Диапазоны другой длины checkTnved не ловит — они остаются как есть.
+
+normalize_rules() строит минимальный набор правил с теми же ответами lookup
+(порядок проверки как в checkTnved: exact -> prefix -> range) для кодов любой длины:
+  - exact остаются все (проверяются первыми — ответ "exact" не должен меняться);
+  - префикс, под которым уже есть более короткий префикс, недостижим -> убираем;
+  - диапазоны сливаются (пересечения и соседние) внутри своего вида; 4/6-значный
+    диапазон целиком под префиксом (тоже по началу кода) недостижим -> убираем.
+    10-значный префиксом не покрывается: он ловит и коды без ведущих нулей.
+Отчёт говорит, что чем покрыто (subsumed) и какие диапазоны слились (merged),
+со страницами из provenance, если они есть.
+
+Usage:
+  python scripts/eec_ranges.py <eec_rules.json|.jsonl> [<report.json>]
+"""
+import json
+import sys
+from bisect import bisect_right
+
+CODE_LEN = 10
+
+
+def range_bounds(r):
+    """
+    Диапазон из eec_rules.json -> (L, lo, hi): L = 4/6 — границы первых L цифр кода,
+    L = 10 — границы кода как числа; None — checkTnved такой диапазон не ловит.
+    """
+    a = str(r.get("from") or "")
+    b = str(r.get("to") or "")
+    if len(a) not in (4, 6, CODE_LEN) or len(a) != len(b) or not (a.isdigit() and b.isdigit()) or a > b:
+        return None
+    return len(a), int(a), int(b)
+
+
+def range_interval(r):
+    """
+    Диапазон из eec_rules.json -> (lo, hi) в пространстве 10-значных кодов или None.
+    Верно только для 10-значных кодов: короткие и длинные 4/6 и 10 ловят по-разному (range_bounds).
+    """
+    a = str(r.get("from") or "")
+    b = str(r.get("to") or "")
+    if not (a.isdigit() and b.isdigit()) or len(a) != len(b) or len(a) > CODE_LEN:
+        return None
+    scale = 10 ** (CODE_LEN - len(a))
+    lo = int(a) * scale
+    hi = (int(b) + 1) * scale - 1
+    if lo > hi:
+        return None
+    return lo, hi
+
+
+def interval_range(L: int, lo: int, hi: int):
+    """Интервал вида L (см. range_bounds) -> диапазон в формате eec_rules.json."""
+    return {**_fmt(L, lo, hi), "len": L, "mode": "numeric" if L == CODE_LEN else "prefix", "raw": None}
+
+
+def merge_intervals(intervals):
+    """Сортировка + слияние перекрывающихся и соседних интервалов."""
+    return [(lo, hi) for lo, hi, _ in merge_groups((lo, hi, None) for lo, hi in intervals)]
+
+
+def merge_groups(items):
+    """
+    Слияние (lo, hi, ref) одним проходом по отсортированным интервалам.
+    Возвращает [(lo, hi, [ref, ...])] — непересекающиеся, по возрастанию.
+    """
+    out = []
+    for lo, hi, ref in sorted(items, key=lambda it: (it[0], it[1])):
+        if out and lo <= out[-1][1] + 1:
+            if hi > out[-1][1]:
+                out[-1][1] = hi
+            out[-1][2].append(ref)
+        else:
+            out.append([lo, hi, [ref]])
+    return [(lo, hi, refs) for lo, hi, refs in out]
+
+
+def _pages(provenance, section: str, n: int):
+    pages = (provenance or {}).get(section) or []
+    return pages if len(pages) == n else [None] * n
+
+
+def _fmt(L: int, lo: int, hi: int):
+    return {"from": f"{lo:0{L}d}", "to": f"{hi:0{L}d}"}
+
+
+def normalize_rules(rules, provenance=None):
+    """
+    rules — раздел "rules" (prefixObjects / exact / ranges), provenance — массивы страниц,
+    параллельные им (см. parse_eec_pdf.RuleSet.provenance), или None.
+    Возвращает {"minimal", "subsumed", "merged", "stats"}.
+    """
+    subsumed = {"exact": [], "prefixes": [], "ranges": []}
+
+    # --- префиксы: вложенный под более короткий недостижим ---
+    prefix_objs = rules.get("prefixObjects") or []
+    prefix_pages = _pages(provenance, "prefixObjects", len(prefix_objs))
+    by_prefix = {str(o.get("prefix") or ""): o for o in prefix_objs}
+
+    def shorter_prefix(code: str):
+        for L in range(1, len(code)):
+            if code[:L] in by_prefix:
+                return code[:L]
+        return None
+
+    kept_prefixes = []
+    for obj, page in zip(prefix_objs, prefix_pages):
+        p = str(obj.get("prefix") or "")
+        if not p.isdigit():
+            kept_prefixes.append(obj)
+            continue
+        q = shorter_prefix(p)
+        if q is not None:
+            subsumed["prefixes"].append({"prefix": p, "raw": obj.get("raw"), "page": page,
+                                         "by": {"type": "prefix", "prefix": q}})
+        else:
+            kept_prefixes.append(obj)
+
+    # оставшиеся префиксы не вложены друг в друга -> интервалы не пересекаются;
+    # для 4/6-значных диапазонов — в пространстве первых L цифр (префиксы не длиннее L)
+    prefix_spans = {}
+    for o in kept_prefixes:
+        p = str(o.get("prefix") or "")
+        for L in (4, 6):
+            if p.isdigit() and len(p) <= L:
+                scale = 10 ** (L - len(p))
+                prefix_spans.setdefault(L, []).append((int(p) * scale, (int(p) + 1) * scale - 1, p))
+    for spans in prefix_spans.values():
+        spans.sort()
+
+    def covering_prefix(L: int, lo: int, hi: int):
+        spans = prefix_spans.get(L) or []
+        i = bisect_right(spans, (lo, float("inf"))) - 1
+        if i >= 0 and spans[i][1] >= hi:
+            return spans[i][2]
+        return None
+
+    # --- диапазоны: слияние внутри вида и покрытие префиксами ---
+    ranges = rules.get("ranges") or []
+    range_pages = _pages(provenance, "ranges", len(ranges))
+    invalid = []
+    items = {4: [], 6: [], CODE_LEN: []}
+    for r, page in zip(ranges, range_pages):
+        rb = range_bounds(r)
+        if rb is None:
+            invalid.append(r)  # checkTnved его не ловит — оставляем как есть
+        else:
+            items[rb[0]].append((rb[1], rb[2], {**r, "page": page}))
+    groups = {L: merge_groups(kind_items) for L, kind_items in items.items()}
+
+    minimal_ranges = list(invalid)
+    merged = []
+    for L, kind_groups in groups.items():
+        for lo, hi, members in kind_groups:
+            p = covering_prefix(L, lo, hi) if L < CODE_LEN else None
+            if p is not None:
+                for m in members:
+                    subsumed["ranges"].append({**m, "by": {"type": "prefix", "prefix": p}})
+                continue
+            if len(members) == 1:
+                minimal_ranges.append({k: v for k, v in members[0].items() if k != "page"})
+            else:
+                minimal_ranges.append(interval_range(L, lo, hi))
+                merged.append({**_fmt(L, lo, hi), "members": members})
+    minimal_ranges.sort(key=lambda r: (len(str(r.get("from"))), str(r.get("from")), str(r.get("to"))))
+
+    # --- exact: остаются все, но отмечаем покрытые префиксом или диапазоном ---
+    exact = rules.get("exact") or []
+    exact_pages = _pages(provenance, "exact", len(exact))
+    group_los = {L: [lo for lo, _, _ in kind_groups] for L, kind_groups in groups.items()}
+
+    def covering_range(code: str):
+        for L, kind_groups in groups.items():
+            if len(code) < L:
+                continue
+            value = int(code[:L]) if L < CODE_LEN else int(code)
+            i = bisect_right(group_los[L], value) - 1
+            if i >= 0 and kind_groups[i][1] >= value:
+                return _fmt(L, kind_groups[i][0], kind_groups[i][1])
+        return None
+
+    for code, page in zip(exact, exact_pages):
+        if not code.isdigit():
+            continue
+        q = shorter_prefix(code)
+        if q is not None:
+            subsumed["exact"].append({"code": code, "page": page, "by": {"type": "prefix", "prefix": q}})
+            continue
+        bounds = covering_range(code) if len(code) == CODE_LEN else None
+        if bounds is not None:
+            subsumed["exact"].append({"code": code, "page": page, "by": {"type": "range", **bounds}})
+
+    minimal = {
+        "prefixObjects": sorted(kept_prefixes, key=lambda o: str(o.get("prefix"))),
+        "exact": sorted(exact),
+        "ranges": minimal_ranges,
+    }
+    stats = {
+        "prefixObjects": [len(prefix_objs), len(minimal["prefixObjects"])],
+        "exact": [len(exact), len(minimal["exact"])],
+        "ranges": [len(ranges), len(minimal_ranges)],
+        "subsumed": {k: len(v) for k, v in subsumed.items()},
+        "merged": len(merged),
+    }
+    return {"minimal": minimal, "subsumed": subsumed, "merged": merged, "stats": stats}
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python scripts/eec_ranges.py <eec_rules.json|.jsonl> [<report.json>]")
+        sys.exit(2)
+
+    from eec_index import load_output
+
+    with open(sys.argv[1], "rb") as f:
+        doc = load_output(f.read())
+    report = normalize_rules(doc["rules"], doc["provenance"])
+    if len(sys.argv) >= 3:
+        with open(sys.argv[2], "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print("OK:", sys.argv[2])
+    print(json.dumps(report["stats"], ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
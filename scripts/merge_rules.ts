@@ -1,5 +1,6 @@
 import fs from "node:fs";
 import path from "node:path";
+import readline from "node:readline";
 
 type StaticRules = {
   version: number;
@@ -30,17 +31,53 @@ function readJson<T>(p: string): T {
   return JSON.parse(fs.readFileSync(p, "utf-8"));
 }
 
-function main() {
+// parse_eec_pdf.py --format jsonl: первая строка — {"type":"header",...}
+function isJsonl(p: string): boolean {
+  const fd = fs.openSync(p, "r");
+  try {
+    const buf = Buffer.alloc(16);
+    const n = fs.readSync(fd, buf, 0, buf.length, 0);
+    return buf.subarray(0, n).toString("utf-8") === '{"type":"header"';
+  } finally {
+    fs.closeSync(fd);
+  }
+}
+
+// JSONL читаем построчно, не держа весь файл в памяти строкой
+async function readEec(p: string): Promise<EecRules> {
+  if (!isJsonl(p)) return readJson<EecRules>(p);
+
+  const eec: EecRules = { rules: { prefixObjects: [], exact: [], ranges: [] } };
+  const lines = readline.createInterface({ input: fs.createReadStream(p, "utf-8"), crlfDelay: Infinity });
+  for await (const line of lines) {
+    if (!line.trim()) continue;
+    const { type, ...rec } = JSON.parse(line);
+    if (type === "header") {
+      eec.source = rec.source;
+      eec.generatedAt = rec.generatedAt;
+    } else if (type === "prefix") {
+      eec.rules.prefixObjects!.push(rec);
+    } else if (type === "exact") {
+      eec.rules.exact!.push(rec.code);
+    } else if (type === "range") {
+      eec.rules.ranges!.push(rec);
+    }
+  }
+  return eec;
+}
+
+async function main() {
   const dataDir = path.join(process.cwd(), "data");
   const staticPath = path.join(dataDir, "rules.json");
-  const eecPath = path.join(dataDir, "eec_rules.json");
+  // EEC_RULES — другой вывод парсера, например data/eec_rules.jsonl (--format jsonl)
+  const eecPath = process.env.EEC_RULES || path.join(dataDir, "eec_rules.json");
   const outPath = path.join(dataDir, "rules.generated.json");
 
   if (!fs.existsSync(staticPath)) throw new Error("Нет data/rules.json — сначала npm run import:csv");
-  if (!fs.existsSync(eecPath)) throw new Error("Нет data/eec_rules.json — сначала парсинг PDF");
+  if (!fs.existsSync(eecPath)) throw new Error(`Нет ${eecPath} — сначала парсинг PDF`);
 
   const staticRules = readJson<StaticRules>(staticPath);
-  const eec = readJson<EecRules>(eecPath);
+  const eec = await readEec(eecPath);
 
   // -------- exact: берём статичные и ЕЭК, но в итог кладём только 10-значные --------
   const exactMap = new Map<string, { code: string; tag?: string; note?: string; source: "static" | "eec" }>();
@@ -111,4 +148,7 @@ function main() {
   console.log(`prefix: ${prefix.length}, exact10: ${exact10.length}, ranges: ${ranges.length}`);
 }
 
-main();
+main().catch((e) => {
+  console.error(e);
+  process.exit(1);
+});
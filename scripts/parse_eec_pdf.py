@@ -1,19 +1,80 @@
-import sys, json, re
+import sys, json, re, os
+import argparse
+import csv
+import gc
+import hashlib
+import multiprocessing
+import random
+import signal
+import threading
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stderr, redirect_stdout
 from datetime import datetime
-
-import pdfplumber
-
-# Optional: pdfminer (часто уже установлен как зависимость)
+from io import StringIO
+from itertools import islice
+from time import perf_counter, process_time, time
+from types import MappingProxyType
+from typing import NamedTuple
+
+# PDF-библиотеки импортируются при первом использовании (load_pdf_libs): попадание
+# в кэш, --help и --no-parse обходятся без них, а ненужный бэкенд не грузится вовсе.
+pdfplumber = None
+PDFObjRef = PDFStream = list_value = resolve1 = None  # pdfminer.pdftypes — приходит вместе с pdfplumber
+TextConverter = LAParams = PDFDocument = PDFPageInterpreter = PDFResourceManager = PDFPage = PDFParser = None
+fitz = None
+_PDF_LIBS_LOADED = set()
+
+
+def load_pdf_libs(*names):
+    """
+    Импорт по требованию: "pdfplumber" (обязателен), "pdfminer" и "fitz" (опциональны:
+    если не установлены — остаются None и просто не используются).
+    """
+    global pdfplumber, PDFObjRef, PDFStream, list_value, resolve1, fitz
+    global TextConverter, LAParams, PDFDocument, PDFPageInterpreter, PDFResourceManager, PDFPage, PDFParser
+    for name in names:
+        if name in _PDF_LIBS_LOADED:
+            continue
+        _PDF_LIBS_LOADED.add(name)
+        if name == "pdfplumber":
+            import pdfplumber as _pdfplumber
+            from pdfminer.pdftypes import PDFObjRef, PDFStream, list_value, resolve1
+            pdfplumber = _pdfplumber
+        elif name == "pdfminer":
+            # Optional: pdfminer (часто уже установлен как зависимость)
+            try:
+                from pdfminer.converter import TextConverter
+                from pdfminer.layout import LAParams
+                from pdfminer.pdfdocument import PDFDocument
+                from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+                from pdfminer.pdfpage import PDFPage
+                from pdfminer.pdfparser import PDFParser
+            except Exception:
+                PDFPage = None
+        elif name == "fitz":
+            # Optional: PyMuPDF (fitz). Если не установлен — просто не используем.
+            try:
+                import fitz as _fitz  # PyMuPDF
+            except Exception:
+                _fitz = None
+            fitz = _fitz
+
+# Optional: orjson — быстрее json, байты вывода те же
 try:
-    from pdfminer.high_level import extract_text as pdfminer_extract_text
-except Exception:
-    pdfminer_extract_text = None
+    import orjson
+except ImportError:
+    orjson = None
 
-# Optional: PyMuPDF (fitz). Если не установлен — просто не используем.
 try:
-    import fitz  # PyMuPDF
-except Exception:
-    fitz = None
+    import resource
+except ImportError:  # не Unix
+    resource = None
+
+from eec_history import HistoryStore
+from eec_index import load_output, write_index
+from eec_ranges import normalize_rules
 
 
 # ----------------- Regexes -----------------
@@ -33,7 +94,10 @@ HEADER_HINTS = [
 
 # Фрагменты с цифрами и разделителями -> нормализуем в digits-only
 RE_CHUNK_NUMBERS = re.compile(r"(?<!\d)\d[\d\s\u00A0\u2009\u202F\-–—]{2,60}\d(?!\d)")
-RE_SOLID_10 = re.compile(r"(?<!\d)\d{10}(?!\d)")
+RE_NON_DIGITS = re.compile(r"\D+")
+# DDMMYYYY: целиком (8 цифр) и как начало 10-значного фрагмента
+RE_DATE_DIGITS = re.compile(r"^(0[1-9]|[12]\d|3[01])(0[1-9]|1[0-2])(19|20)\d{2}$")
+RE_DATE_PREFIX = re.compile(r"(0[1-9]|[12]\d|3[01])(0[1-9]|1[0-2])(19|20)\d{2}")
 
 
 # ----------------- Helpers -----------------
@@ -41,7 +105,7 @@ def norm(s: str) -> str:
     return re.sub(r"\s+", " ", (s or "").strip())
 
 def digits(s: str) -> str:
-    return re.sub(r"\D", "", s or "")
+    return RE_NON_DIGITS.sub("", s or "")
 
 def is_date_like(raw: str) -> bool:
     raw = (raw or "").strip()
@@ -56,7 +120,7 @@ def is_probably_tnved(code: str, raw: str) -> bool:
     if len(code) not in (4, 6, 10):
         return False
     # Отсекаем DDMMYYYY.. (на всякий)
-    if re.match(r"^(0[1-9]|[12]\d|3[01])(0[1-9]|1[0-2])(19|20)\d{2}$", code):
+    if RE_DATE_DIGITS.match(code):
         return False
     return True
 
@@ -78,130 +142,305 @@ def table_cols_count(table):
     return max(len(r) for r in table if r)
 
 
-def extract_tables_robust(page):
+# Стратегии извлечения таблиц: (имя, table_settings); None — настройки pdfplumber по умолчанию.
+TABLE_STRATEGIES = [
+    ("default", None),
+    ("lines", {
+        "vertical_strategy": "lines",
+        "horizontal_strategy": "lines",
+        "intersection_tolerance": 5,
+        "snap_tolerance": 3,
+        "join_tolerance": 3,
+        "edge_min_length": 10,
+        "min_words_vertical": 1,
+        "min_words_horizontal": 1,
+    }),
+    ("text", {
+        "vertical_strategy": "text",
+        "horizontal_strategy": "text",
+        "intersection_tolerance": 5,
+        "snap_tolerance": 3,
+        "join_tolerance": 3,
+        "min_words_vertical": 1,
+        "min_words_horizontal": 1,
+    }),
+    ("lines_text", {
+        "vertical_strategy": "lines",
+        "horizontal_strategy": "text",
+        "intersection_tolerance": 5,
+        "snap_tolerance": 3,
+        "join_tolerance": 3,
+        "min_words_vertical": 1,
+        "min_words_horizontal": 1,
+    }),
+]
+
+
+class TableStrategyPicker:
+    """
+    Учёт стратегий таблиц: сколько раз каждая выиграла и сколько времени на неё ушло.
+    adaptive=True -> сначала пробуем стратегию, чаще всех выигрывавшую на прошлых страницах,
+    и запускаем остальные, только если она ничего не нашла или таблицы не прошли
+    проверку на коды (tables_have_codes).
+    """
+
+    def __init__(self, adaptive: bool = False):
+        self.adaptive = adaptive
+        self.wins = [0] * len(TABLE_STRATEGIES)
+        self.runs = [0] * len(TABLE_STRATEGIES)
+        self.seconds = [0.0] * len(TABLE_STRATEGIES)
+        self.fallbacks = 0  # adaptive: сколько раз пришлось пробовать остальные
+        self._taken = self._counters()
+
+    def preferred(self):
+        if not self.adaptive or not any(self.wins):
+            return None
+        return max(range(len(self.wins)), key=lambda i: (self.wins[i], -i))
+
+    def _counters(self):
+        return {"wins": list(self.wins), "runs": list(self.runs), "seconds": list(self.seconds),
+                "fallbacks": self.fallbacks}
+
+    def take(self):
+        """Прирост счётчиков с прошлого take() — статистика страницы (в т.ч. из воркера)."""
+        cur, prev = self._counters(), self._taken
+        self._taken = cur
+        return {
+            "wins": [a - b for a, b in zip(cur["wins"], prev["wins"])],
+            "runs": [a - b for a, b in zip(cur["runs"], prev["runs"])],
+            "seconds": [a - b for a, b in zip(cur["seconds"], prev["seconds"])],
+            "fallbacks": cur["fallbacks"] - prev["fallbacks"],
+        }
+
+    def add(self, stats):
+        for i in range(len(TABLE_STRATEGIES)):
+            self.wins[i] += stats["wins"][i]
+            self.runs[i] += stats["runs"][i]
+            self.seconds[i] += stats["seconds"][i]
+        self.fallbacks += stats["fallbacks"]
+
+    def report(self):
+        return {
+            "mode": "adaptive" if self.adaptive else "all",
+            "fallbacks": self.fallbacks,
+            "strategies": {
+                name: {"wins": self.wins[i], "runs": self.runs[i], "seconds": round(self.seconds[i], 3)}
+                for i, (name, _) in enumerate(TABLE_STRATEGIES)
+            },
+        }
+
+
+def code_col_hits(table, code_col: int, limit: int = 10) -> int:
+    """Сколько ячеек колонки code_col в первых limit строках после заголовка похожи на коды."""
+    hits = 0
+    for test_row in table[1:limit + 1]:
+        if test_row and code_col < len(test_row):
+            if parse_code_cell(test_row[code_col] or ""):
+                hits += 1
+    return hits
+
+
+def tables_have_codes(tables) -> bool:
+    """
+    Та же проверка, что table_suspicious в interpret_tables, но без знания колонки кода:
+    хотя бы у одной таблицы есть колонка с >= 2 кодами в первых строках.
+    """
+    for table in clean_tables(tables):
+        if len(table) < 2:
+            continue
+        for col in range(table_cols_count(table)):
+            if code_col_hits(table, col) >= 2:
+                return True
+    return False
+
+
+def extract_tables_robust(page, picker: TableStrategyPicker = None):
     """
     Пробуем разные стратегии извлечения таблиц, выбираем вариант с максимумом таблиц.
+    С picker в режиме adaptive сначала пробуем выученную стратегию (см. TableStrategyPicker).
     """
-    settings_list = [
-        None,
-        {
-            "vertical_strategy": "lines",
-            "horizontal_strategy": "lines",
-            "intersection_tolerance": 5,
-            "snap_tolerance": 3,
-            "join_tolerance": 3,
-            "edge_min_length": 10,
-            "min_words_vertical": 1,
-            "min_words_horizontal": 1,
-        },
-        {
-            "vertical_strategy": "text",
-            "horizontal_strategy": "text",
-            "intersection_tolerance": 5,
-            "snap_tolerance": 3,
-            "join_tolerance": 3,
-            "min_words_vertical": 1,
-            "min_words_horizontal": 1,
-        },
-        {
-            "vertical_strategy": "lines",
-            "horizontal_strategy": "text",
-            "intersection_tolerance": 5,
-            "snap_tolerance": 3,
-            "join_tolerance": 3,
-            "min_words_vertical": 1,
-            "min_words_horizontal": 1,
-        },
-    ]
 
-    best = []
-    for s in settings_list:
+    def run(i):
+        t0 = perf_counter()
+        s = TABLE_STRATEGIES[i][1]
         try:
             tables = page.extract_tables(table_settings=s) if s else (page.extract_tables() or [])
         except Exception:
             tables = []
+        if picker is not None:
+            picker.runs[i] += 1
+            picker.seconds[i] += perf_counter() - t0
+        return tables or []
+
+    done = {}
+    first = picker.preferred() if picker is not None else None
+    if first is not None:
+        done[first] = run(first)
+        if done[first] and tables_have_codes(done[first]):
+            picker.wins[first] += 1
+            return done[first]
+        picker.fallbacks += 1
+
+    best = []
+    best_i = None
+    for i in range(len(TABLE_STRATEGIES)):
+        tables = done[i] if i in done else run(i)
         if tables and len(tables) > len(best):
             best = tables
+            best_i = i
+    if picker is not None and best_i is not None:
+        picker.wins[best_i] += 1
     return best or []
 
 
-def page_lines_from_words(page, y_tol=3):
+# ----------------- Page layout -----------------
+class PageLayout:
     """
-    Собираем "строки" из words (pdfplumber) по координате top.
+    Слой разметки страницы pdfplumber: chars -> words -> строки считаются один раз
+    и переиспользуются построчным сканом (words) и fallback.
+    Слова извлекаются лениво, при первом обращении. Хранение компактное: координаты
+    слов — array('d'), текст всех слов — одна строка с массивом смещений, строки —
+    индексы первого слова. release() отпускает всё, включая кэши страницы pdfplumber.
     """
-    words = page.extract_words(use_text_flow=True) or []
-    if not words:
-        return []
-    words = sorted(words, key=lambda w: (round(w["top"] / y_tol), w["x0"]))
 
-    lines = []
-    cur_key = None
-    cur = []
+    __slots__ = ("page", "y_tol", "x0", "top", "text", "offsets", "line_starts", "_line_codes", "_page_text")
+
+    def __init__(self, page, y_tol=3):
+        self.page = page
+        self.y_tol = y_tol
+        self.x0 = self.top = self.text = self.offsets = self.line_starts = None
+        self._line_codes = None
+        self._page_text = None
+
+    def _build(self):
+        y_tol = self.y_tol
+        words = self.page.extract_words(use_text_flow=True) or []
+        words.sort(key=lambda w: (round(w["top"] / y_tol), w["x0"]))
+
+        self.x0 = array("d", (w["x0"] for w in words))
+        self.top = array("d", (w["top"] for w in words))
+        self.text = "".join(w["text"] for w in words)
+        self.offsets = array("I", [0])
+        self.line_starts = array("I")
+        prev_key = None
+        for i, w in enumerate(words):
+            self.offsets.append(self.offsets[-1] + len(w["text"]))
+            key = round(w["top"] / y_tol)
+            if key != prev_key:
+                self.line_starts.append(i)
+                prev_key = key
+        self.line_starts.append(len(words))
+
+    def word(self, i: int) -> str:
+        return self.text[self.offsets[i]:self.offsets[i + 1]]
+
+    def lines(self):
+        """Строки страницы: слова, сгруппированные по top (с допуском y_tol) и отсортированные по x0."""
+        if self.line_starts is None:
+            self._build()
+        ls = self.line_starts
+        return [" ".join(self.word(i) for i in range(ls[k], ls[k + 1])) for k in range(len(ls) - 1)]
+
+    def line_codes(self) -> set:
+        """4/6/10 ПОСТРОЧНО (чтобы фильтр short covered by 10 работал по строке), один раз на страницу."""
+        if self._line_codes is None:
+            found = set()
+            for line in self.lines():
+                found |= filter_short_codes_if_covered_by_10(extract_codes_any_4_6_10(line))
+            self._line_codes = found
+        return set(self._line_codes)
+
+    def page_text(self) -> str:
+        """page.extract_text() — у pdfplumber своя группировка слов, поэтому отдельно (но один раз)."""
+        if self._page_text is None:
+            self._page_text = self.page.extract_text() or ""
+        return self._page_text
+
+    def release(self):
+        self.x0 = self.top = self.offsets = self.line_starts = None
+        self.text = self._page_text = self._line_codes = None
+        if self.page is not None:
+            self.page.close()
+            self.page = None
 
-    for w in words:
-        key = round(w["top"] / y_tol)
-        if cur_key is None or key == cur_key:
-            cur.append(w["text"])
-            cur_key = key
-        else:
-            lines.append(" ".join(cur))
-            cur = [w["text"]]
-            cur_key = key
-    if cur:
-        lines.append(" ".join(cur))
-    return lines
 
+def page_lines_from_words(page, y_tol=3):
+    """
+    Собираем "строки" из words (pdfplumber) по координате top.
+    """
+    return PageLayout(page, y_tol).lines()
 
-def extract_codes10_any(text: str):
+
+def scan_code_tokens(text: str):
     """
-    Оставлено для совместимости, но ниже используем универсальный extract_codes_any_4_6_10.
+    Единый токенизатор кодов: один проход RE_CHUNK_NUMBERS по тексту.
+    Фрагмент с цифрами+разделителями всегда начинается и заканчивается на границе
+    сплошного прогона цифр, поэтому из него же берём и слитные прогоны 4/6/10.
+
+    Возвращает список (code, solid, dated):
+      code   — digits-only кандидат длины 4/6/10;
+      solid  — код записан слитно (один прогон цифр);
+      dated  — 10 цифр, начинающихся с даты DDMMYYYY (31122023..).
     """
+    out = []
     if not text:
-        return set()
+        return out
 
-    out = set()
     for m in RE_CHUNK_NUMBERS.finditer(text):
-        chunk = m.group(0)
-        code = re.sub(r"\D", "", chunk)
-        if len(code) == 10:
-            if re.match(r"^(0[1-9]|[12]\d|3[01])(0[1-9]|1[0-2])(19|20)\d{2}", code):
-                continue
-            out.add(code)
+        runs = RE_NON_DIGITS.split(m.group(0))
+        code = "".join(runs)
+        single = len(runs) == 1
+        if len(code) in (4, 6, 10):
+            out.append((code, single, len(code) == 10 and RE_DATE_PREFIX.match(code) is not None))
+        if not single:
+            # плюс слитные коды внутри фрагмента (часто встречаются)
+            for run in runs:
+                if len(run) in (4, 6, 10):
+                    out.append((run, True, len(run) == 10 and RE_DATE_PREFIX.match(run) is not None))
+    return out
 
-    for m in RE_SOLID_10.finditer(text):
-        out.add(m.group(0))
 
-    return out
+def extract_codes10_any(text: str):
+    """
+    Оставлено для совместимости, но ниже используем универсальный extract_codes_any_4_6_10.
+    10-значные из фрагментов, кроме начинающихся с даты; слитные 10 — всегда.
+    """
+    return {code for code, solid, dated in scan_code_tokens(text) if len(code) == 10 and (solid or not dated)}
 
 
 def extract_codes_any_4_6_10(text: str):
     """
     Достаём коды 4/6/10 из текста (works для words/text).
     Берём фрагменты с цифрами+разделителями, нормализуем до digits-only.
+    (Проверка на дату DDMMYYYY для 4/6/10 не срабатывает: там ровно 8 цифр.)
     """
-    if not text:
-        return set()
+    return {code for code, _, _ in scan_code_tokens(text)}
 
-    out = set()
 
-    for m in RE_CHUNK_NUMBERS.finditer(text):
-        chunk = m.group(0)
-        code = re.sub(r"\D", "", chunk)
-        if len(code) in (4, 6, 10):
-            # отсекаем даты типа 31122023
-            if re.match(r"^(0[1-9]|[12]\d|3[01])(0[1-9]|1[0-2])(19|20)\d{2}$", code):
-                continue
-            out.add(code)
+class TenPrefixIndex:
+    """
+    Индекс покрытия: 4- и 6-значные префиксы 10-значных кодов в хеш-множестве.
+    Строится один раз на набор кодов; covers(code) — за O(1) вместо перебора всех 10-значных.
+    """
 
-    # плюс слитные коды (часто встречаются)
-    for mm in re.finditer(r"(?<!\d)\d{4}(?!\d)", text):
-        out.add(mm.group(0))
-    for mm in re.finditer(r"(?<!\d)\d{6}(?!\d)", text):
-        out.add(mm.group(0))
-    for mm in re.finditer(r"(?<!\d)\d{10}(?!\d)", text):
-        out.add(mm.group(0))
+    __slots__ = ("prefixes",)
 
-    return out
+    def __init__(self, codes=()):
+        self.prefixes = set()
+        for c in codes:
+            self.add(c)
+
+    def add(self, code: str):
+        if len(code) == 10:
+            self.prefixes.add(code[:4])
+            self.prefixes.add(code[:6])
+
+    def covers(self, code: str) -> bool:
+        """4/6-значный code — префикс хотя бы одного 10-значного из индекса."""
+        return code in self.prefixes
+
+    def __bool__(self):
+        return bool(self.prefixes)
 
 
 def filter_short_codes_if_covered_by_10(codes: set):
@@ -212,18 +451,33 @@ def filter_short_codes_if_covered_by_10(codes: set):
     if not codes:
         return set()
 
-    tens = [c for c in codes if len(c) == 10]
-    if not tens:
+    cover = TenPrefixIndex(codes)
+    if not cover:
         return codes
 
-    out = set(codes)
-    for c in list(out):
-        if len(c) in (4, 6):
-            for t in tens:
-                if t.startswith(c):
-                    out.discard(c)
-                    break
-    return out
+    return {c for c in codes if not (len(c) in (4, 6) and cover.covers(c))}
+
+
+def drop_prefixes_covered_by_exact(prefix_objects: dict, exact: set):
+    """
+    post-clean: убрать ложные префиксы (raw=None), которые "появились сами",
+    если уже есть точные 10-значные коды, начинающиеся с этого префикса.
+    Это лечит кейс: "3306 10 000 0" -> exact=3306100000, но где-то отдельно вылезает "3306".
+    Порог — 1 попадание и для 4-, и для 6-значных префиксов, поэтому хватает TenPrefixIndex.
+    """
+    cover = TenPrefixIndex(exact)
+
+    drop = []
+    for p, obj in prefix_objects.items():
+        # Если префикс задан как "из ####" -> это настоящее правило, не трогаем
+        if obj.get("raw") is not None:
+            continue
+        if len(p) in (4, 6) and cover.covers(p):
+            drop.append(p)
+
+    for p in drop:
+        prefix_objects.pop(p, None)
+    return drop
 
 
 def add_code_to_rules(code: str, *, exact: set, prefix_objects: dict):
@@ -240,48 +494,147 @@ def add_code_to_rules(code: str, *, exact: set, prefix_objects: dict):
             prefix_objects[code] = {"prefix": code, "raw": None}
 
 
-def extract_codes_from_page_words_pdfplumber(page):
+def extract_codes_from_page_words_pdfplumber(layout: PageLayout):
     """
     Берем строки из words и извлекаем 4/6/10 ПОСТРОЧНО,
     чтобы точный фильтр (short covered by 10) работал корректно.
     """
-    found = set()
-    for line in page_lines_from_words(page):
-        line_codes = extract_codes_any_4_6_10(line)
-        line_codes = filter_short_codes_if_covered_by_10(line_codes)
-        found |= line_codes
-    return found
+    return layout.line_codes()
 
 
-def extract_codes_any_from_pdfminer_page(pdf_path: str, page_i: int):
-    if pdfminer_extract_text is None:
+# ----------------- Backend session -----------------
+class BackendSession:
+    """
+    pdfminer и PyMuPDF открываются один раз на прогон, а не на каждую страницу.
+    Страницы pdfminer идут лениво (по дереву страниц, без разбора содержимого),
+    текст и words страницы мемоизируются до release(page_i) — fallback
+    переиспользует то, что уже извлёк основной скан.
+    low_memory -> release() сбрасывает и кэш объектов документа pdfminer (store MuPDF
+    ограничен сам по себе, его сбрасывает только MemoryGuard).
+    """
+
+    def __init__(self, pdf_path: str, low_memory: bool = False):
+        self.pdf_path = pdf_path
+        self.low_memory = low_memory
+        self._memo = {}  # (backend, kind, page_i) -> text | words
+
+        self._miner_fp = None
+        self._miner_doc = None
+        self._miner_rsrc = None
+        self._miner_iter = None
+        self._miner_pages = []
+
+        self._fitz_doc = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._memo.clear()
+        self._miner_pages = []
+        self._miner_iter = None
+        self._miner_doc = None
+        if self._miner_fp is not None:
+            self._miner_fp.close()
+            self._miner_fp = None
+        if self._fitz_doc is not None:
+            self._fitz_doc.close()
+            self._fitz_doc = None
+
+    def release(self, page_i: int):
+        """Страница разобрана: отпускаем её текст/words и объект pdfminer."""
+        for key in [k for k in self._memo if k[2] == page_i]:
+            del self._memo[key]
+        if page_i <= len(self._miner_pages):
+            self._miner_pages[page_i - 1] = None
+        if self.low_memory and self._miner_doc is not None:
+            evict_pdf_objects(self._miner_doc)
+
+    # --- pdfminer ---
+    def _miner_page(self, page_i: int):
+        if self._miner_iter is None:
+            load_pdf_libs("pdfminer")
+            self._miner_fp = open(self.pdf_path, "rb")
+            self._miner_doc = PDFDocument(PDFParser(self._miner_fp))
+            self._miner_rsrc = PDFResourceManager(caching=True)
+            self._miner_iter = PDFPage.create_pages(self._miner_doc)
+        while len(self._miner_pages) < page_i:
+            try:
+                page = next(self._miner_iter, None)
+            except StageTimeout:
+                self.close()  # прерванный генератор страниц не продолжить — документ откроется заново
+                raise
+            if page is None:
+                return None
+            self._miner_pages.append(page)
+        return self._miner_pages[page_i - 1]
+
+    def pdfminer_text(self, page_i: int) -> str:
+        """То же, что pdfminer extract_text(pdf_path, page_numbers=[page_i - 1])."""
+        key = ("pdfminer", "text", page_i)
+        if key not in self._memo:
+            txt = ""
+            try:
+                page = self._miner_page(page_i)
+                if page is not None:
+                    with StringIO() as buf:
+                        device = TextConverter(self._miner_rsrc, buf, codec="utf-8", laparams=LAParams())
+                        PDFPageInterpreter(self._miner_rsrc, device).process_page(page)
+                        device.close()
+                        txt = buf.getvalue()
+            except Exception:
+                txt = ""
+            self._memo[key] = txt
+        return self._memo[key]
+
+    # --- PyMuPDF ---
+    def _fitz_page(self, page_i: int):
+        if self._fitz_doc is None:
+            load_pdf_libs("fitz")
+            self._fitz_doc = fitz.open(self.pdf_path)
+        return self._fitz_doc[page_i - 1]
+
+    def pymupdf_text(self, page_i: int) -> str:
+        key = ("pymupdf", "text", page_i)
+        if key not in self._memo:
+            self._memo[key] = self._fitz_page(page_i).get_text("text") or ""
+        return self._memo[key]
+
+    def pymupdf_words(self, page_i: int):
+        key = ("pymupdf", "words", page_i)
+        if key not in self._memo:
+            self._memo[key] = self._fitz_page(page_i).get_text("words") or []
+        return self._memo[key]
+
+
+def extract_codes_any_from_pdfminer_page(backends: BackendSession, page_i: int):
+    load_pdf_libs("pdfminer")
+    if PDFPage is None:
         return set()
-    try:
-        txt = pdfminer_extract_text(pdf_path, page_numbers=[page_i - 1]) or ""
-    except Exception:
-        txt = ""
+    txt = backends.pdfminer_text(page_i)
     codes = extract_codes_any_4_6_10(txt)
     # pdfminer даёт весь текст страницы одним куском — фильтр здесь менее точный, но безопасный:
     # убираем 4/6 только если они покрываются 10 в этом куске
     return filter_short_codes_if_covered_by_10(codes)
 
 
-def extract_codes_any_from_pymupdf_page(pdf_path: str, page_i: int):
+def extract_codes_any_from_pymupdf_page(backends: BackendSession, page_i: int):
+    load_pdf_libs("fitz")
     if fitz is None:
         return set()
 
     found = set()
     try:
-        doc = fitz.open(pdf_path)
-        p = doc[page_i - 1]
-
         # 1) простой текст страницы
-        txt = p.get_text("text") or ""
+        txt = backends.pymupdf_text(page_i)
         codes = extract_codes_any_4_6_10(txt)
         found |= filter_short_codes_if_covered_by_10(codes)
 
         # 2) words -> построчно (более точная фильтрация)
-        words = p.get_text("words") or []
+        words = backends.pymupdf_words(page_i)
         lines = {}
         for w in words:
             key = (w[5], w[6])  # (block, line)
@@ -292,38 +645,182 @@ def extract_codes_any_from_pymupdf_page(pdf_path: str, page_i: int):
             line_codes = extract_codes_any_4_6_10(line_text)
             line_codes = filter_short_codes_if_covered_by_10(line_codes)
             found |= line_codes
-
-        doc.close()
     except Exception:
         pass
 
     return found
 
 
+# ----------------- Backend policy -----------------
+# Текстовые бэкенды в порядке запуска: имя -> kind hits.
+BACKENDS = [
+    ("words", "code_page_words_pdfplumber"),
+    ("pdfminer", "code_pdfminer"),
+    ("pymupdf", "code_pymupdf"),
+]
+BACKEND_NAMES = [name for name, _ in BACKENDS]
+
+
+def run_backend(name: str, layout: PageLayout, page_i: int, backends: BackendSession):
+    if name == "words":
+        return extract_codes_from_page_words_pdfplumber(layout)
+    if name == "pdfminer":
+        return extract_codes_any_from_pdfminer_page(backends, page_i)
+    return extract_codes_any_from_pymupdf_page(backends, page_i)
+
+
+def page_confident(table_hits) -> bool:
+    """Таблицы страницы дали правила, и ни одна из них не была сомнительной (нет row_scan)."""
+    return bool(table_hits) and not any(h.kind == "code_row_scan" for h in table_hits)
+
+
+class BackendPolicy:
+    """
+    Какие текстовые бэкенды запускать на странице (--backends).
+      all           — все, как раньше;
+      words,pymupdf — только перечисленные;
+      auto          — считаем, сколько уникальных кодов (которых нет ни в таблицах,
+                      ни у других бэкендов) каждый бэкенд добавил на прошлых страницах,
+                      и пропускаем дорогие (в среднем от MIN_SECONDS на страницу) бэкенды,
+                      которые все последние WINDOW запусков ничего не добавили. Сомнительные страницы (нет правил из таблиц
+                      или таблица без явной колонки кодов) всегда идут полным набором,
+                      первые WARMUP страниц и каждая PROBE_EVERY-я — тоже.
+    """
+
+    WARMUP = 5
+    WINDOW = 20
+    PROBE_EVERY = 50
+    MIN_SECONDS = 0.02  # дешевле этого (в среднем на страницу) бэкенд не пропускаем
+
+    def __init__(self, spec: str = "all"):
+        spec = (spec or "all").strip()
+        if spec in ("all", "auto"):
+            self.mode = spec
+            self.enabled = list(BACKEND_NAMES)
+        else:
+            names = [n.strip() for n in spec.split(",") if n.strip()]
+            unknown = [n for n in names if n not in BACKEND_NAMES]
+            if not names or unknown:
+                raise ValueError(f"--backends: expected all, auto or a list of {','.join(BACKEND_NAMES)}, got {spec!r}")
+            self.mode = "fixed"
+            self.enabled = [n for n in BACKEND_NAMES if n in names]
+
+        self.pages = 0
+        self.runs = {n: 0 for n in BACKEND_NAMES}
+        self.skipped = {n: 0 for n in BACKEND_NAMES}
+        self.seconds = {n: 0.0 for n in BACKEND_NAMES}
+        self.novel = {n: 0 for n in BACKEND_NAMES}
+        self.full_pages = 0  # auto: страниц, где из-за низкой уверенности шли все бэкенды
+        self._recent = {n: deque(maxlen=self.WINDOW) for n in BACKEND_NAMES}
+        self._taken = self._counters()
+
+    def _idle(self, name: str) -> bool:
+        recent = self._recent[name]
+        if len(recent) < self.WINDOW or any(recent):
+            return False
+        return self.seconds[name] / max(1, self.runs[name]) >= self.MIN_SECONDS
+
+    def plan(self, confident: bool):
+        """Список бэкендов для страницы."""
+        if self.mode != "auto":
+            return list(self.enabled)
+        self.pages += 1
+        if not confident:
+            self.full_pages += 1
+            return list(BACKEND_NAMES)
+        if self.pages <= self.WARMUP or self.pages % self.PROBE_EVERY == 0:
+            return list(BACKEND_NAMES)
+        return [n for n in BACKEND_NAMES if not self._idle(n)]
+
+    def observe(self, found, seconds, table_codes):
+        """
+        found — {backend: set кодов} для запущенных бэкендов страницы, seconds — их время.
+        Уникальный вклад бэкенда — коды, которых нет ни в таблицах, ни у других бэкендов.
+        """
+        for name in BACKEND_NAMES:
+            if name not in found:
+                self.skipped[name] += 1
+                continue
+            others = set(table_codes).union(*(c for n, c in found.items() if n != name))
+            novel = len(found[name] - others)
+            self.runs[name] += 1
+            self.seconds[name] += seconds[name]
+            self.novel[name] += novel
+            self._recent[name].append(novel)
+
+    def _counters(self):
+        return {"runs": dict(self.runs), "skipped": dict(self.skipped), "seconds": dict(self.seconds),
+                "novel": dict(self.novel), "fullPages": self.full_pages}
+
+    def take(self):
+        """Прирост счётчиков с прошлого take() — как TableStrategyPicker.take()."""
+        cur, prev = self._counters(), self._taken
+        self._taken = cur
+        out = {k: {n: cur[k][n] - prev[k][n] for n in BACKEND_NAMES} for k in ("runs", "skipped", "seconds", "novel")}
+        out["fullPages"] = cur["fullPages"] - prev["fullPages"]
+        return out
+
+    def add(self, stats):
+        for name in BACKEND_NAMES:
+            self.runs[name] += stats["runs"][name]
+            self.skipped[name] += stats["skipped"][name]
+            self.seconds[name] += stats["seconds"][name]
+            self.novel[name] += stats["novel"][name]
+        self.full_pages += stats["fullPages"]
+
+    def report(self):
+        return {
+            "mode": self.mode,
+            "enabled": self.enabled,
+            "fullPages": self.full_pages,
+            "backends": {
+                n: {"runs": self.runs[n], "skipped": self.skipped[n], "seconds": round(self.seconds[n], 3),
+                    "uniqueCodes": self.novel[n]}
+                for n in BACKEND_NAMES
+            },
+        }
+
+
 # ----------------- Table continuation memory -----------------
-LAST_SHAPE = None  # (cols_count, code_col)
+# Форма таблицы (cols_count, code_col) передаётся явно: choose_code_col получает
+# форму предыдущих таблиц и возвращает новую. Так продолжение таблицы со страницы
+# на страницу не зависит от того, в каком порядке страницы были разобраны.
 
-def choose_code_col(table):
+def choose_code_col(table, last_shape=None):
     """
     1) Ищем колонку кода по заголовку.
     2) Если заголовка нет, допускаем продолжение таблицы (same cols count).
+
+    Возвращает (code_col, shape); shape передаётся в следующий вызов.
     """
-    global LAST_SHAPE
     header = table[0] if table else None
 
     by_header = detect_code_col_by_header(header)
     if by_header is not None:
-        LAST_SHAPE = (table_cols_count(table), by_header)
-        return by_header
+        return by_header, (table_cols_count(table), by_header)
 
-    if LAST_SHAPE:
-        last_cols, last_col = LAST_SHAPE
+    if last_shape:
+        last_cols, last_col = last_shape
         cols = table_cols_count(table)
         # допускаем +-1 колонку (часто из-за объединённых ячеек)
         if cols == last_cols or cols == last_cols + 1 or cols + 1 == last_cols:
-            return last_col
+            return last_col, last_shape
 
-    return None
+    return None, last_shape
+
+
+def cell_code(raw: str) -> str:
+    """
+    Код из одной части ячейки (после "из", сторона диапазона или вся часть) — тем же
+    scan_code_tokens, что и текст страницы. Часть — код, только если все её цифры
+    образуют один кандидат 4/6/10; иначе "". Флаг dated здесь не смотрим: в колонке
+    кодов 2103 20 000 0 — код, а не 21.03.2000.
+    """
+    d = digits(raw)
+    for code, _, _ in scan_code_tokens(raw):
+        if code == d:
+            return code
+    return ""
 
 
 def parse_code_cell(cell: str):
@@ -344,7 +841,7 @@ def parse_code_cell(cell: str):
     parts = [p.strip() for p in RE_SPLIT.split(raw_cell) if p.strip()]
 
     # Сначала соберём exact(10) из этой ячейки, чтобы потом точнее отфильтровать 4/6 “обломки”
-    exact_in_cell = set()
+    exact_in_cell = TenPrefixIndex()
 
     tmp_items = []
     for p in parts:
@@ -353,7 +850,7 @@ def parse_code_cell(cell: str):
 
         m = RE_PREFIX.match(p)
         if m:
-            code = digits(m.group(1))
+            code = cell_code(m.group(1))
             if is_probably_tnved(code, p):
                 if len(code) == 10:
                     tmp_items.append(("exact", code))
@@ -367,8 +864,8 @@ def parse_code_cell(cell: str):
         if m:
             a_raw = m.group(1)
             b_raw = m.group(2)
-            a = digits(a_raw)
-            b = digits(b_raw)
+            a = cell_code(a_raw)
+            b = cell_code(b_raw)
             if not (is_probably_tnved(a, a_raw) and is_probably_tnved(b, b_raw)):
                 continue
             if len(a) != len(b):
@@ -380,7 +877,7 @@ def parse_code_cell(cell: str):
                 tmp_items.append(("range", {"from": a, "to": b, "len": L, "mode": "numeric", "raw": p}))
             continue
 
-        d = digits(p)
+        d = cell_code(p)
         if is_probably_tnved(d, p):
             if len(d) == 10:
                 tmp_items.append(("exact", d))
@@ -394,253 +891,1916 @@ def parse_code_cell(cell: str):
     for kind, value in tmp_items:
         if kind == "prefix":
             p = value
-            if exact_in_cell and any(x.startswith(p) for x in exact_in_cell):
+            if exact_in_cell.covers(p):
                 continue  # отбрасываем ложный prefix из 10-значной записи
         out.append((kind, value))
 
     return out
 
 
-def main():
-    if len(sys.argv) != 3:
-        print("Usage: python scripts/parse_eec_pdf.py <input.pdf> <output.json>")
-        sys.exit(2)
+# ----------------- Profiling -----------------
+def _peak_rss_kb() -> int:
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # Linux: KB
 
-    pdf_path = sys.argv[1]
-    out_path = sys.argv[2]
 
-    prefix_objects = {}  # prefix -> {"prefix":..., "raw":...} raw only if реально было "из ####"
-    exact = set()
-    ranges = set()  # (from,to,len,mode,raw)
+def run_stage(prof, name: str, fn, *args):
+    """
+    Выполняет стадию страницы; при prof (список) дописывает замер:
+    wall/CPU, прирост пикового RSS процесса и число кодов (если стадия вернула set).
+    """
+    if prof is None:
+        return fn(*args)
+    rss0 = _peak_rss_kb()
+    w0 = perf_counter()
+    c0 = process_time()
+    result = fn(*args)
+    prof.append({
+        "stage": name,
+        "wall": perf_counter() - w0,
+        "cpu": process_time() - c0,
+        "rssPeakDeltaKb": _peak_rss_kb() - rss0,
+        "codes": len(result) if isinstance(result, set) else None,
+    })
+    return result
+
+
+def hit_code(hit) -> str:
+    """Ключ правила из hit — чтобы сравнивать вклад разных источников."""
+    if hit.kind in ("prefix", "prefixObj"):
+        return hit.value["prefix"]
+    if hit.kind == "range":
+        return f"{hit.value['from']}-{hit.value['to']}"
+    return hit.value
+
+
+class ProfileReport:
+    """
+    Отчёт --profile: стадии по страницам (JSON + CSV рядом с выводом)
+    и вклад каждого источника в уникальные коды относительно его стоимости.
+    """
 
-    debug_hits = []
+    SOURCES = {
+        "code_page_words_pdfplumber": "words",
+        "code_pdfminer": "pdfminer",
+        "code_pymupdf": "pymupdf",
+        "code_fallback_after_tables": "fallback",
+    }  # остальные kinds — из таблиц
+
+    def __init__(self):
+        self.pages = []
+        self.codes = {}  # source -> set of codes (по всему документу)
+
+    def add_page(self, page_i: int, stages, hits):
+        by_source = {}
+        for h in hits:
+            by_source.setdefault(self.SOURCES.get(h.kind, "tables"), set()).add(hit_code(h))
+        for st in stages:
+            if st["stage"] == "tables":
+                st["codes"] = len(by_source.get("tables", ()))
+        for src, codes in by_source.items():
+            self.codes.setdefault(src, set()).update(codes)
+        self.pages.append({
+            "page": page_i,
+            "wall": sum(st["wall"] for st in stages),
+            "cpu": sum(st["cpu"] for st in stages),
+            "stages": stages,
+        })
+
+    def stage_totals(self):
+        totals = {}
+        for page in self.pages:
+            for st in page["stages"]:
+                t = totals.setdefault(st["stage"], {"wall": 0.0, "cpu": 0.0, "rssPeakDeltaKb": 0, "codes": 0})
+                t["wall"] += st["wall"]
+                t["cpu"] += st["cpu"]
+                t["rssPeakDeltaKb"] += st["rssPeakDeltaKb"]
+                t["codes"] += st["codes"] or 0
+        for src, codes in self.codes.items():
+            others = set().union(*(c for s, c in self.codes.items() if s != src))
+            if src in totals:
+                totals[src]["uniqueCodes"] = len(codes - others)
+        return totals
+
+    def slowest(self, top: int = 10):
+        return sorted(self.pages, key=lambda p: -p["wall"])[:top]
+
+    def write(self, out_path: str, top: int = 10):
+        base = os.path.splitext(out_path)[0]
+        report = {
+            "stages": self.stage_totals(),
+            "slowestPages": [p["page"] for p in self.slowest(top)],
+            "pages": self.pages,
+        }
+        with open(base + ".profile.json", "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        with open(base + ".profile.csv", "w", encoding="utf-8", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(["page", "stage", "wall_s", "cpu_s", "rss_peak_delta_kb", "codes"])
+            for page in self.pages:
+                for st in page["stages"]:
+                    w.writerow([page["page"], st["stage"], f"{st['wall']:.4f}", f"{st['cpu']:.4f}",
+                                st["rssPeakDeltaKb"], "" if st["codes"] is None else st["codes"]])
+        return base + ".profile.json", base + ".profile.csv"
+
+    def summary(self, top: int = 10) -> str:
+        lines = ["stage          wall,s    cpu,s   codes  unique"]
+        for name, t in sorted(self.stage_totals().items(), key=lambda kv: -kv[1]["wall"]):
+            lines.append(f"{name:<12} {t['wall']:8.2f} {t['cpu']:8.2f} {t['codes']:7d} {t.get('uniqueCodes', ''):>7}")
+        lines.append(f"slowest pages (top {top}):")
+        for p in self.slowest(top):
+            parts = ", ".join(f"{st['stage']} {st['wall']:.2f}" for st in p["stages"])
+            lines.append(f"  page {p['page']:>4}: {p['wall']:.2f}s ({parts})")
+        return "\n".join(lines)
+
+
+# ----------------- Page pipeline -----------------
+class Hit:
+    """Одно совпадение (откуда взято правило). Компактно: __slots__ вместо dict."""
+
+    __slots__ = ("page", "table", "row", "kind", "value", "raw_cell", "desc_cell")
+
+    def __init__(self, page, kind, value, table=None, row=None, raw_cell=None, desc_cell=None):
+        self.page = page
+        self.table = table
+        self.row = row
+        self.kind = kind
+        self.value = value
+        self.raw_cell = raw_cell
+        self.desc_cell = desc_cell
+
+    def to_dict(self):
+        return {
+            "page": self.page, "table": self.table, "row": self.row,
+            "kind": self.kind, "value": self.value,
+            "rawCell": self.raw_cell, "descCell": self.desc_cell,
+        }
+
+    def copy(self):
+        return Hit(self.page, self.kind, self.value, self.table, self.row, self.raw_cell, self.desc_cell)
+
+    @classmethod
+    def from_dict(cls, d, page=None):
+        return cls(d["page"] if page is None else page, d["kind"], d["value"],
+                   d["table"], d["row"], d["rawCell"], d["descCell"])
+
+
+def make_hit(page_i, kind, value, table=None, row=None, raw_cell=None, desc_cell=None):
+    return Hit(page_i, kind, value, table, row, raw_cell, desc_cell)
+
+
+def code_hits(page_i, kind, codes):
+    # сортируем, чтобы порядок hits не зависел от хеширования строк в процессе
+    return [make_hit(page_i, kind, c) for c in sorted(codes or ())]
+
+
+def apply_hit(hit, *, exact: set, prefix_objects: dict, ranges: set):
+    """
+    Переносит одно совпадение в накопленные правила.
+    Для prefixObj value заменяется на накопленный объект (как и раньше в debug).
+    """
+    kind = hit.kind
+    value = hit.value
+
+    if kind == "prefixObj":
+        p = value["prefix"]
+        raw = value.get("raw")
+        if p not in prefix_objects:
+            prefix_objects[p] = {"prefix": p, "raw": raw}
+        else:
+            if prefix_objects[p].get("raw") is None and raw is not None:
+                prefix_objects[p]["raw"] = raw
+        hit.value = prefix_objects[p]
 
-    with pdfplumber.open(pdf_path) as pdf:
-        for page_i, page in enumerate(pdf.pages, start=1):
-            page_found_any = False
-
-            # ✅ Page scan (pdfplumber words): 4/6/10 построчно
-            page_codes_words = extract_codes_from_page_words_pdfplumber(page)
-            for c in page_codes_words:
-                add_code_to_rules(c, exact=exact, prefix_objects=prefix_objects)
-                debug_hits.append({
-                    "page": page_i, "table": None, "row": None,
-                    "kind": "code_page_words_pdfplumber",
-                    "value": c, "rawCell": None, "descCell": None
-                })
-
-            # ✅ Дополнительно пробуем pdfminer (если доступен)
-            codes_pdfminer = extract_codes_any_from_pdfminer_page(pdf_path, page_i)
-            for c in codes_pdfminer:
-                add_code_to_rules(c, exact=exact, prefix_objects=prefix_objects)
-                debug_hits.append({
-                    "page": page_i, "table": None, "row": None,
-                    "kind": "code_pdfminer",
-                    "value": c, "rawCell": None, "descCell": None
-                })
-
-            # ✅ Дополнительно пробуем PyMuPDF (если доступен)
-            codes_pymupdf = extract_codes_any_from_pymupdf_page(pdf_path, page_i)
-            for c in codes_pymupdf:
-                add_code_to_rules(c, exact=exact, prefix_objects=prefix_objects)
-                debug_hits.append({
-                    "page": page_i, "table": None, "row": None,
-                    "kind": "code_pymupdf",
-                    "value": c, "rawCell": None, "descCell": None
-                })
-
-            # --- robust tables ---
-            tables = extract_tables_robust(page)
-            if not tables:
-                tables = []
-
-            for t_i, t in enumerate(tables, start=1):
-                table = [[(c or "").strip() for c in row] for row in t if row]
-                if not table or len(table) < 2:
-                    continue
+    elif kind == "prefix":
+        p = value["prefix"]
+        if p not in prefix_objects:
+            prefix_objects[p] = {"prefix": p, "raw": None}
 
-                code_col = choose_code_col(table)
-                if code_col is None:
-                    continue
+    elif kind == "exact":
+        exact.add(value)
 
-                # sanity-check (мягкий): таблица не отбрасывается, только помечается как сомнительная
-                hits = 0
-                for test_row in table[1:11]:
-                    if test_row and code_col < len(test_row):
-                        if parse_code_cell(test_row[code_col] or ""):
-                            hits += 1
-                table_suspicious = hits < 2
-
-                desc_col = code_col - 1 if code_col - 1 >= 0 else None
-
-                for r_i, row in enumerate(table[1:], start=2):
-                    if not row or code_col >= len(row):
-                        continue
-
-                    code_cell = row[code_col] or ""
-                    desc_cell = (row[desc_col] or "") if (desc_col is not None and desc_col < len(row)) else ""
-
-                    # ✅ страховка row_scan: только если таблица сомнительная, и строго по строке
-                    codes_row = set()
-                    row_text = None
-                    if table_suspicious:
-                        row_text = " ".join([c for c in row if c])
-                        codes_row = extract_codes_any_4_6_10(row_text)
-                        codes_row = filter_short_codes_if_covered_by_10(codes_row)
-
-                    for c in codes_row:
-                        add_code_to_rules(c, exact=exact, prefix_objects=prefix_objects)
-                        page_found_any = True
-                        debug_hits.append({
-                            "page": page_i, "table": t_i, "row": r_i,
-                            "kind": "code_row_scan",
-                            "value": c,
-                            "rawCell": row_text,
-                            "descCell": desc_cell
-                        })
-
-                    # Основной разбор ячейки кода
-                    items = parse_code_cell(code_cell)
-
-                    for kind, value in items:
-                        if kind == "prefixObj":
-                            p = value["prefix"]
-                            raw = value.get("raw")
-                            if p not in prefix_objects:
-                                prefix_objects[p] = {"prefix": p, "raw": raw}
-                            else:
-                                if prefix_objects[p].get("raw") is None and raw is not None:
-                                    prefix_objects[p]["raw"] = raw
-                            page_found_any = True
-                            debug_hits.append({
-                                "page": page_i, "table": t_i, "row": r_i,
-                                "kind": "prefixObj", "value": prefix_objects[p],
-                                "rawCell": code_cell, "descCell": desc_cell
-                            })
-
-                        elif kind == "prefix":
-                            p = value
-                            if p not in prefix_objects:
-                                prefix_objects[p] = {"prefix": p, "raw": None}
-                            page_found_any = True
-                            debug_hits.append({
-                                "page": page_i, "table": t_i, "row": r_i,
-                                "kind": "prefix", "value": {"prefix": p, "raw": None},
-                                "rawCell": code_cell, "descCell": desc_cell
-                            })
-
-                        elif kind == "exact":
-                            exact.add(value)
-                            page_found_any = True
-                            debug_hits.append({
-                                "page": page_i, "table": t_i, "row": r_i,
-                                "kind": "exact", "value": value,
-                                "rawCell": code_cell, "descCell": desc_cell
-                            })
-
-                        elif kind == "range":
-                            ranges.add((value["from"], value["to"], value["len"], value["mode"], value.get("raw")))
-                            page_found_any = True
-                            debug_hits.append({
-                                "page": page_i, "table": t_i, "row": r_i,
-                                "kind": "range", "value": value,
-                                "rawCell": code_cell, "descCell": desc_cell
-                            })
-
-            # ✅ FALLBACK after tables: если таблицы были, но мы не извлекли НИ ОДНОГО правила из таблиц
-            if not page_found_any:
-                # 1) extract_text
-                txt = page.extract_text() or ""
-                codes_any = extract_codes_any_4_6_10(txt)
-                codes_any = filter_short_codes_if_covered_by_10(codes_any)
-
-                # 2) words lines построчно (точнее)
-                if not codes_any:
-                    for line in page_lines_from_words(page):
-                        line_codes = extract_codes_any_4_6_10(line)
-                        line_codes = filter_short_codes_if_covered_by_10(line_codes)
-                        codes_any |= line_codes
-
-                # 3) pdfminer
-                codes_any |= extract_codes_any_from_pdfminer_page(pdf_path, page_i)
-
-                # 4) pymupdf
-                codes_any |= extract_codes_any_from_pymupdf_page(pdf_path, page_i)
-
-                for c in codes_any:
-                    add_code_to_rules(c, exact=exact, prefix_objects=prefix_objects)
-                    debug_hits.append({
-                        "page": page_i,
-                        "table": None,
-                        "row": None,
-                        "kind": "code_fallback_after_tables",
-                        "value": c,
-                        "rawCell": None,
-                        "descCell": None
-                    })
-
-    # ❗ ВАЖНО: exact НЕ удаляем, даже если они покрыты prefix.
-    # Иначе теряются точные 10-значные коды.
-
-    # --- post-clean: убрать ложные префиксы (raw=None), которые "появились сами",
-    # если уже есть точные 10-значные коды, начинающиеся с этого префикса.
-    # Это лечит кейс: "3306 10 000 0" -> exact=3306100000, но где-то отдельно вылезает "3306".
-    exact_list = [c for c in exact if len(c) == 10]
-
-    # считаем, сколько exact начинается с каждого 4/6 префикса
-    cover4 = {}
-    cover6 = {}
-    for c in exact_list:
-        p4 = c[:4]
-        p6 = c[:6]
-        cover4[p4] = cover4.get(p4, 0) + 1
-        cover6[p6] = cover6.get(p6, 0) + 1
-
-    # пороги: для 4-значного префикса достаточно 1 попадания (как в 3306),
-    # для 6-значного можно тоже 1
-    TH4 = 1
-    TH6 = 1
+    elif kind == "range":
+        ranges.add((value["from"], value["to"], value["len"], value["mode"], value.get("raw")))
 
-    drop = []
-    for p, obj in prefix_objects.items():
-        # Если префикс задан как "из ####" -> это настоящее правило, не трогаем
-        if obj.get("raw") is not None:
+    else:
+        # code_* из построчных сканов
+        add_code_to_rules(value, exact=exact, prefix_objects=prefix_objects)
+
+
+def rule_key(hit):
+    """Какое правило даёт hit: ("prefix", p) | ("exact", code) | ("range", (from,to,len,mode,raw))."""
+    kind, value = hit.kind, hit.value
+    if kind in ("prefix", "prefixObj"):
+        return "prefix", value["prefix"]
+    if kind == "range":
+        return "range", (value["from"], value["to"], value["len"], value["mode"], value.get("raw"))
+    if kind == "exact" or len(value) == 10:
+        return "exact", value
+    return "prefix", value
+
+
+class RuleSet:
+    """
+    Правила документа, накопленные из hits страниц (в порядке страниц).
+    pages — откуда правило: первая страница, где оно встретилось (для префикса —
+    страница, где появился raw "из ####", если он появился позже).
+    """
+
+    def __init__(self):
+        self.prefix_objects = {}  # prefix -> {"prefix":..., "raw":...} raw only if реально было "из ####"
+        self.exact = set()
+        self.ranges = set()  # (from,to,len,mode,raw)
+        self.pages = {}  # rule_key -> page
+
+    def add_hits(self, hits):
+        for h in hits:
+            key = rule_key(h)
+            had_raw = key[0] == "prefix" and (self.prefix_objects.get(key[1]) or {}).get("raw") is not None
+            apply_hit(h, exact=self.exact, prefix_objects=self.prefix_objects, ranges=self.ranges)
+            if key not in self.pages:
+                self.pages[key] = h.page
+            elif key[0] == "prefix" and not had_raw and self.prefix_objects[key[1]].get("raw") is not None:
+                self.pages[key] = h.page
+
+    def finalize(self):
+        # ❗ ВАЖНО: exact НЕ удаляем, даже если они покрыты prefix.
+        # Иначе теряются точные 10-значные коды.
+
+        # --- post-clean: ложные префиксы (raw=None), покрытые точными 10-значными кодами
+        drop_prefixes_covered_by_exact(self.prefix_objects, self.exact)
+
+    def to_json(self):
+        return {
+            "prefixObjects": sorted(self.prefix_objects.values(), key=lambda x: x["prefix"]),
+            "exact": sorted(self.exact),
+            "ranges": [
+                {"from": a, "to": b, "len": L, "mode": mode, "raw": raw}
+                for (a, b, L, mode, raw) in sorted(self.ranges)
+            ],
+        }
+
+    def provenance(self):
+        """Страницы правил — массивы, параллельные массивам to_json()."""
+        pages = self.pages
+        return {
+            "prefixObjects": [pages.get(("prefix", p)) for p in sorted(self.prefix_objects)],
+            "exact": [pages.get(("exact", c)) for c in sorted(self.exact)],
+            "ranges": [pages.get(("range", r)) for r in sorted(self.ranges)],
+        }
+
+    def stats(self):
+        return {
+            "prefixObjects": len(self.prefix_objects),
+            "exact": len(self.exact),
+            "ranges": len(self.ranges),
+        }
+
+
+def clean_tables(tables):
+    return [[[(c or "").strip() for c in row] for row in t if row] for t in (tables or [])]
+
+
+def interpret_tables(page_i: int, tables, shape):
+    """
+    Разбор уже извлечённых таблиц страницы.
+    Возвращает (hits, page_found_any, shape) — shape уходит на следующую страницу.
+    """
+    hits = []
+    page_found_any = False
+
+    for t_i, table in enumerate(tables, start=1):
+        if not table or len(table) < 2:
             continue
 
-        if len(p) == 4 and cover4.get(p, 0) >= TH4:
-            drop.append(p)
-        elif len(p) == 6 and cover6.get(p, 0) >= TH6:
-            drop.append(p)
+        code_col, shape = choose_code_col(table, shape)
+        if code_col is None:
+            continue
 
-    for p in drop:
-        prefix_objects.pop(p, None)
+        # sanity-check (мягкий): таблица не отбрасывается, только помечается как сомнительная
+        table_suspicious = code_col_hits(table, code_col) < 2
+
+        desc_col = code_col - 1 if code_col - 1 >= 0 else None
+
+        for r_i, row in enumerate(table[1:], start=2):
+            if not row or code_col >= len(row):
+                continue
+
+            code_cell = row[code_col] or ""
+            desc_cell = (row[desc_col] or "") if (desc_col is not None and desc_col < len(row)) else ""
+
+            # ✅ страховка row_scan: только если таблица сомнительная, и строго по строке
+            if table_suspicious:
+                row_text = " ".join([c for c in row if c])
+                codes_row = extract_codes_any_4_6_10(row_text)
+                codes_row = filter_short_codes_if_covered_by_10(codes_row)
+                for c in sorted(codes_row):
+                    page_found_any = True
+                    hits.append(make_hit(page_i, "code_row_scan", c, t_i, r_i, row_text, desc_cell))
+
+            # Основной разбор ячейки кода
+            for kind, value in parse_code_cell(code_cell):
+                if kind == "prefix":
+                    value = {"prefix": value, "raw": None}
+                page_found_any = True
+                hits.append(make_hit(page_i, kind, value, t_i, r_i, code_cell, desc_cell))
+
+    return hits, page_found_any, shape
+
+
+def extract_fallback_codes(layout: PageLayout, page_i: int, backends: BackendSession):
+    """
+    FALLBACK after tables: вызывается, если из таблиц страницы не извлекли НИ ОДНОГО правила.
+    """
+    # 1) extract_text
+    txt = layout.page_text()
+    codes_any = extract_codes_any_4_6_10(txt)
+    codes_any = filter_short_codes_if_covered_by_10(codes_any)
+
+    # 2) words lines построчно (точнее) — те же строки, что уже разобрал words-скан
+    if not codes_any:
+        codes_any |= layout.line_codes()
+
+    # 3) pdfminer
+    codes_any |= extract_codes_any_from_pdfminer_page(backends, page_i)
+
+    # 4) pymupdf
+    codes_any |= extract_codes_any_from_pymupdf_page(backends, page_i)
+
+    return codes_any
+
+
+# ----------------- Time budget -----------------
+class StageTimeout(BaseException):
+    """
+    Стадия вышла за бюджет (SIGALRM). BaseException, а не Exception: извлечение
+    таблиц и бэкенды глушат Exception, и таймаут не должен превращаться в «пусто».
+    """
+
+
+def _raise_stage_timeout(signum, frame):
+    raise StageTimeout()
+
+
+class Watchdog:
+    """
+    Бюджет времени разбора: на стадию (--stage-budget), на страницу (--page-budget) и
+    дедлайн всего прогона (--deadline, хранится как абсолютное time(), общее для воркеров).
+    Стадию прерывает SIGALRM — только в главном потоке процесса (воркеры пула, CLI);
+    из другого потока бюджет не соблюдается. Код на C (PyMuPDF) прерывается только
+    по возвращении в Python. Объект простой и передаётся в воркеры через initargs.
+    """
+
+    def __init__(self, page_budget: float = None, stage_budget: float = None, deadline: float = None):
+        self.page_budget = page_budget
+        self.stage_budget = stage_budget
+        self.deadline_at = time() + deadline if deadline is not None else None
+
+    @property
+    def enabled(self) -> bool:
+        return self.page_budget is not None or self.stage_budget is not None or self.deadline_at is not None
+
+    def page(self):
+        return PageBudget(self) if self.enabled else None
+
+    def enforced(self) -> bool:
+        return hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+
+class PageBudget:
+    """
+    Бюджет одной страницы. Стадия, вышедшая за бюджет, попадает в degraded, и дальше
+    страница идёт дешёвыми экстракторами: без pdfminer, fallback и таблиц — words
+    (если не он превысил бюджет), затем PyMuPDF. PyMuPDF — последняя ступень и идёт
+    без таймера, так что у страницы всегда есть хоть какой-то скан. После --deadline
+    страницы сразу идут только через PyMuPDF.
+    """
+
+    CHEAP = ("words", "pymupdf")
+    FLOOR = "pymupdf"
+
+    def __init__(self, watchdog: Watchdog):
+        self.watchdog = watchdog
+        self.page_end = perf_counter() + watchdog.page_budget if watchdog.page_budget is not None else None
+        self.degraded = []  # стадии, вышедшие за бюджет; "deadline" — дедлайн прогона прошёл
+        if watchdog.deadline_at is not None and time() >= watchdog.deadline_at:
+            self.degraded.append("deadline")
+
+    def allows(self, stage: str) -> bool:
+        if not self.degraded:
+            return True
+        if stage == self.FLOOR:
+            return True
+        return stage in self.CHEAP and stage not in self.degraded and "deadline" not in self.degraded
+
+    def limit(self):
+        """Секунд на следующую стадию или None (без ограничения)."""
+        limits = []
+        if self.watchdog.stage_budget is not None:
+            limits.append(self.watchdog.stage_budget)
+        if self.page_end is not None:
+            limits.append(self.page_end - perf_counter())
+        if self.watchdog.deadline_at is not None:
+            limits.append(self.watchdog.deadline_at - time())
+        return min(limits) if limits else None
+
+    def run(self, prof, stage: str, fn, *args):
+        """run_stage под бюджетом. Время вышло -> stage в degraded, результат None."""
+        limit = self.limit()
+        if stage == self.FLOOR or limit is None or not self.watchdog.enforced():
+            return run_stage(prof, stage, fn, *args)
+        w0, c0 = perf_counter(), process_time()
+        old = signal.signal(signal.SIGALRM, _raise_stage_timeout)
+        try:
+            if limit <= 0:
+                raise StageTimeout()
+            signal.setitimer(signal.ITIMER_REAL, limit)
+            try:
+                return run_stage(prof, stage, fn, *args)
+            finally:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        except StageTimeout:
+            self.degraded.append(stage)
+            if prof is not None:
+                prof.append({"stage": stage, "wall": perf_counter() - w0, "cpu": process_time() - c0,
+                             "rssPeakDeltaKb": 0, "codes": None})
+            return None
+        finally:
+            signal.signal(signal.SIGALRM, old)
+
+
+def run_text_backends(prof, names, layout: PageLayout, page_i: int, backends: BackendSession,
+                      budget: PageBudget = None):
+    """
+    Текстовые бэкенды names на странице -> (found {name: codes}, seconds {name: s}).
+    budget -> бэкенды идут под бюджетом страницы; пропущенные и прерванные в found не попадают.
+    """
+    found, seconds = {}, {}
+    for name in names:
+        if budget is not None and not budget.allows(name):
+            continue
+        t0 = perf_counter()
+        if budget is None:
+            found[name] = run_stage(prof, name, run_backend, name, layout, page_i, backends)
+        else:
+            codes = budget.run(prof, name, run_backend, name, layout, page_i, backends)
+            if codes is None:
+                continue
+            found[name] = codes
+        seconds[name] = perf_counter() - t0
+    return found, seconds
+
+
+def scan_page(page, page_i: int, backends: BackendSession, shape, picker: TableStrategyPicker = None,
+              profile: bool = False, policy: BackendPolicy = None, watchdog: Watchdog = None):
+    """
+    Тяжёлая часть разбора страницы: таблицы, words, pdfminer, PyMuPDF.
+    shape — форма таблицы с прошлых страниц (или None, если она неизвестна).
+    Таблицы идут первыми: по ним policy (BackendPolicy) решает, какие бэкенды запускать.
+    Fallback-коды извлекаются сразу, если таблицы при этой форме ничего не дали:
+    с None находок может быть только меньше, поэтому для воркеров это безопасно.
+    profile -> scan["profile"]: замеры по стадиям (см. run_stage).
+    watchdog -> стадии идут под бюджетом (см. PageBudget); scan["degraded"] — стадии,
+    вышедшие за него: таблицы такой страницы пусты, текстовые бэкенды — дешёвые.
+    """
+    prof = [] if profile else None
+    budget = watchdog.page() if watchdog is not None else None
+    layout = PageLayout(page)
+
+    def tables_stage():
+        return clean_tables(extract_tables_robust(page, picker))
+
+    if budget is None:
+        tables = run_stage(prof, "tables", tables_stage)
+    else:
+        tables = budget.run(prof, "tables", tables_stage) if budget.allows("tables") else None
+        if tables is None:
+            tables = []
+    scan = {
+        "page": page_i,
+        # --- robust tables ---
+        "tables": tables,
+        "tableStrategies": picker.take() if picker is not None else None,
+        "fallback": None,
+        "skipped": [],
+        "backendStats": None,
+        "degraded": None,
+        "profile": prof,
+    }
+
+    table_hits, page_found_any, _ = interpret_tables(page_i, scan["tables"], shape)
+    run = policy.plan(page_confident(table_hits)) if policy is not None else BACKEND_NAMES
+
+    # ✅ Page scan (pdfplumber words): 4/6/10 построчно
+    # ✅ Дополнительно пробуем pdfminer и PyMuPDF (если доступны)
+    names = []
+    for name in BACKEND_NAMES:
+        scan[name] = None  # не запускался (--backends, auto или бюджет)
+        if name not in run:
+            if policy is None or name in policy.enabled:
+                scan["skipped"].append(name)  # пропущен auto-режимом, а не выключен явно
+            continue
+        names.append(name)
+    found, seconds = run_text_backends(prof, names, layout, page_i, backends, budget)
+    scan.update(found)
+
+    if policy is not None:
+        policy.observe(found, seconds, {hit_code(h) for h in table_hits})
+        scan["backendStats"] = policy.take()
+
+    if not page_found_any:
+        if budget is None:
+            scan["fallback"] = run_stage(prof, "fallback", extract_fallback_codes, layout, page_i, backends)
+        elif budget.allows("fallback"):
+            scan["fallback"] = budget.run(prof, "fallback", extract_fallback_codes, layout, page_i, backends)
+        if budget is not None and scan["fallback"] is None:
+            # бюджет кончился: fallback — то, что уже нашли дешёвые бэкенды
+            scan["fallback"] = set().union(*found.values())
+
+    if budget is not None and budget.degraded:
+        scan["degraded"] = budget.degraded
+    # страница отсканирована: слова, строки и кэши pdfplumber больше не нужны
+    layout.release()
+    return scan
+
+
+def top_up_scan(scan, page, backends: BackendSession, shape, watchdog: Watchdog = None):
+    """
+    Скан из воркера сделан с формой None. Если с фактической формой страница оказалась
+    сомнительной, а часть бэкендов была пропущена, — догоняем их здесь.
+    Страницы, уже вышедшие за бюджет (scan["degraded"]), не догоняем.
+    """
+    if not scan["skipped"] or scan["degraded"]:
+        return scan
+    page_i = scan["page"]
+    table_hits, _, _ = interpret_tables(page_i, scan["tables"], shape)
+    if page_confident(table_hits):
+        return scan
+    layout = PageLayout(page)
+    budget = watchdog.page() if watchdog is not None else None
+    found, _ = run_text_backends(scan["profile"], scan["skipped"], layout, page_i, backends, budget)
+    scan.update(found)
+    if budget is not None and budget.degraded:
+        scan["degraded"] = budget.degraded
+    layout.release()
+    scan["skipped"] = []
+    return scan
+
+
+def finish_page(scan, shape):
+    """
+    Дешёвая часть: интерпретация таблиц с фактической формой и сборка hits страницы.
+    Возвращает (hits, shape).
+    """
+    page_i = scan["page"]
+
+    hits = []
+    for name, kind in BACKENDS:
+        hits += code_hits(page_i, kind, scan[name])  # None -> бэкенд пропущен (--backends)
+
+    table_hits, page_found_any, shape = interpret_tables(page_i, scan["tables"], shape)
+    hits += table_hits
+
+    if not page_found_any:
+        hits += code_hits(page_i, "code_fallback_after_tables", scan["fallback"])
+
+    return hits, shape
+
+
+# ----------------- Debug hits -----------------
+class DebugRecorder:
+    """
+    Куда идут debug-hits (--debug-hits):
+      off          — никуда;
+      first:N      — первые N (по умолчанию first:5000, как раньше);
+      reservoir:N  — равномерная выборка N из всех (reservoir sampling, фиксированный seed);
+      stream:PATH  — все hits в отдельный JSONL, по мере готовности страниц.
+    В памяти держится не больше N объектов Hit.
+    """
+
+    def __init__(self, mode: str = "first", limit: int = 5000, path: str = None, seed: int = 0):
+        if mode not in ("off", "first", "reservoir", "stream"):
+            raise ValueError(f"unknown debug-hits mode: {mode}")
+        self.mode = mode
+        self.limit = limit
+        self.path = path
+        self.seen = 0
+        self.sample = []
+        self._rnd = random.Random(seed)
+        self._fh = open(path, "w", encoding="utf-8") if mode == "stream" else None
+
+    @classmethod
+    def from_spec(cls, spec: str):
+        mode, _, arg = (spec or "off").partition(":")
+        if mode in ("first", "reservoir"):
+            return cls(mode, limit=int(arg or 5000))
+        if mode == "stream":
+            if not arg:
+                raise ValueError("stream:PATH — не указан путь")
+            return cls(mode, path=arg)
+        return cls(mode)
+
+    def add_page(self, hits):
+        if self.mode == "off":
+            self.seen += len(hits)
+            return
+        if self.mode == "stream":
+            for h in hits:
+                self._fh.write(json.dumps(h.to_dict(), ensure_ascii=False))
+                self._fh.write("\n")
+            self._fh.flush()
+            self.seen += len(hits)
+            return
+        for h in hits:
+            self.seen += 1
+            if len(self.sample) < self.limit:
+                self.sample.append(h)
+            elif self.mode == "reservoir":
+                j = self._rnd.randrange(self.seen)
+                if j < self.limit:
+                    self.sample[j] = h
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def section(self):
+        """Раздел debug для выходного JSON."""
+        if self.mode == "stream":
+            return {"note": "Все совпадения — в отдельном JSONL.", "hitsFile": self.path, "hits": self.seen}
+        if self.mode == "off":
+            return {"note": "Сбор совпадений отключён.", "hits": self.seen}
+        if self.mode == "reservoir":
+            return {
+                "note": f"Случайная выборка {len(self.sample)} из {self.seen} совпадений.",
+                "hitsSample": [h.to_dict() for h in self.sample],
+            }
+        return {
+            "note": f"Первые {self.limit} совпадений для проверки откуда взято.",
+            "hitsSample": [h.to_dict() for h in self.sample],
+        }
+
+
+# ----------------- Page iteration -----------------
+def evict_pdf_objects(doc):
+    """
+    Сбросить кэш объектов pdfminer PDFDocument: словари и content streams разобранных
+    страниц иначе копятся до закрытия файла. Нужное позже перечитывается по xref.
+    """
+    for name in ("_cached_objs", "_parsed_objs"):
+        cache = getattr(doc, name, None)
+        if isinstance(cache, dict):
+            cache.clear()
+
+
+def iter_pdf_pages(pdf, low_memory: bool = False):
+    """
+    (page_i, Page) по порядку.
+    Обычно — pdf.pages: список и кэш объектов pdfminer живут, пока PDF открыт.
+    low_memory -> Page строится по ходу обхода и нигде не удерживается, после каждой
+    страницы сбрасывается кэш объектов документа: память не растёт с числом страниц.
+    """
+    if not low_memory:
+        yield from enumerate(pdf.pages, start=1)
+        return
+    load_pdf_libs("pdfminer")
+    doctop = 0
+    for page_i, page_obj in enumerate(PDFPage.create_pages(pdf.doc), start=1):
+        page = pdfplumber.page.Page(pdf, page_obj, page_number=page_i, initial_doctop=doctop)
+        doctop += page.height
+        yield page_i, page
+        evict_pdf_objects(pdf.doc)
+
+
+def _map_ahead(pool, fn, items, ahead: int):
+    """
+    pool.map с ограниченным забеганием вперёд: в работе и готовыми не больше ahead
+    результатов, иначе при медленном потребителе готовые страницы копятся в памяти.
+    """
+    items = iter(items)
+    futures = deque(pool.submit(fn, it) for it in islice(items, ahead))
+    while futures:
+        result = futures.popleft().result()
+        futures.extend(pool.submit(fn, it) for it in islice(items, 1))
+        yield result
+
+
+# ----------------- Process pool -----------------
+# Каждый воркер открывает свои дескрипторы PDF один раз (initializer).
+_POOL_PATH = None
+_POOL_PDF = None
+_POOL_PAGES = None  # low_memory: iter_pdf_pages воркера, страницы приходят по возрастанию
+_POOL_BACKENDS = None
+_POOL_PICKER = None
+_POOL_POLICY = None
+_POOL_WATCHDOG = None
+_POOL_PROFILE = False
+
+
+def _pool_init(pdf_path: str, table_strategy: str = "all", profile: bool = False, backends: str = "all",
+               low_memory: bool = False, watchdog: Watchdog = None):
+    global _POOL_PATH, _POOL_PDF, _POOL_PAGES, _POOL_BACKENDS, _POOL_PICKER, _POOL_POLICY, _POOL_WATCHDOG, \
+        _POOL_PROFILE
+    _POOL_PROFILE = profile
+    load_pdf_libs("pdfplumber")
+    _POOL_PATH = pdf_path
+    _POOL_PDF = pdfplumber.open(pdf_path)
+    _POOL_PAGES = iter_pdf_pages(_POOL_PDF, low_memory=True) if low_memory else None
+    _POOL_BACKENDS = BackendSession(pdf_path, low_memory=low_memory)
+    # adaptive/auto в воркере учатся на страницах, доставшихся этому воркеру
+    _POOL_PICKER = TableStrategyPicker(adaptive=table_strategy == "adaptive")
+    _POOL_POLICY = BackendPolicy(backends)
+    _POOL_WATCHDOG = watchdog  # дедлайн абсолютный — общий с родителем
+
+
+def _pool_page(page_i: int):
+    if _POOL_PAGES is None:
+        return _POOL_PDF.pages[page_i - 1]
+    for i, page in _POOL_PAGES:  # пропущенные страницы достались другим воркерам
+        if i == page_i:
+            return page
+    raise IndexError(page_i)
+
+
+def _pool_scan_page(page_i: int):
+    page = _pool_page(page_i)
+    # форма таблицы с прошлых страниц воркеру неизвестна -> None
+    scan = scan_page(page, page_i, _POOL_BACKENDS, None, _POOL_PICKER, _POOL_PROFILE, _POOL_POLICY, _POOL_WATCHDOG)
+    _POOL_BACKENDS.release(page_i)
+    return scan
+
+
+# batch: один пул на все документы, воркер переоткрывает PDF, когда очередь переходит к следующему
+_BATCH_OPTIONS = None
+
+
+def _batch_init(table_strategy: str = "all", profile: bool = False, backends: str = "all",
+                low_memory: bool = False, watchdog: Watchdog = None):
+    global _BATCH_OPTIONS
+    _BATCH_OPTIONS = (table_strategy, profile, backends, low_memory, watchdog)
+
+
+def _batch_scan_page(task):
+    pdf_path, page_i = task
+    if _POOL_PATH != pdf_path:
+        if _POOL_PDF is not None:
+            _POOL_BACKENDS.close()
+            _POOL_PDF.close()
+        _pool_init(pdf_path, *_BATCH_OPTIONS)
+    return _pool_scan_page(page_i)
+
+
+def iter_page_hits(pdf_path: str, workers: int = 1, cache=None, table_strategy: str = "all",
+                   profile: bool = False, backends: str = "all", low_memory: bool = False, scans=None,
+                   watchdog: Watchdog = None):
+    """
+    Отдаёт (hits, info) по страницам строго в порядке страниц.
+    info — диагностика страницы: {"page", "cached", "tableStrategies", "backends", "degraded", "profile"}.
+    backends — политика текстовых бэкендов (см. BackendPolicy).
+    workers > 1 -> тяжёлая часть идёт в пуле процессов, интерпретация таблиц — здесь же,
+    по порядку, поэтому результат совпадает с последовательным прогоном.
+    cache (ParseCache) -> неизменённые страницы берутся из кэша, в пул уходят только изменённые.
+    low_memory -> страницы не удерживаются после разбора (см. iter_pdf_pages), в том числе в воркерах.
+    scans -> итератор готовых scan_page всех страниц по порядку (общий пул batch), свой пул не нужен.
+    watchdog -> бюджет времени страниц (см. Watchdog); страницы, вышедшие за него, в кэш не идут.
+    """
+    shape = None
+    picker = TableStrategyPicker(adaptive=table_strategy == "adaptive")
+    policy = BackendPolicy(backends)
+
+    load_pdf_libs("pdfplumber")
+    with pdfplumber.open(pdf_path) as pdf, BackendSession(pdf_path, low_memory=low_memory) as session:
+        keys = dirty = None
+        if cache:
+            memo = {}
+            keys = [page_fingerprint(p.page_obj, memo) for _, p in iter_pdf_pages(pdf, low_memory)]
+            dirty = cache.plan(keys)
+
+        pool = None
+        pooled = iter(()) if scans is None else scans
+        pooled_pages = set()
+        if workers > 1 and scans is None:
+            todo = sorted(dirty) if cache else list(range(1, sum(1 for _ in iter_pdf_pages(pdf, low_memory)) + 1))
+            if todo:
+                pool = ProcessPoolExecutor(max_workers=workers, initializer=_pool_init,
+                                           initargs=(pdf_path, table_strategy, profile, backends, low_memory,
+                                                     watchdog))
+                pooled = _map_ahead(pool, _pool_scan_page, todo, ahead=4 * workers)
+                pooled_pages = set(todo)
+
+        try:
+            for page_i, page in iter_pdf_pages(pdf, low_memory):
+                key = keys[page_i - 1] if cache else None
+
+                cached = cache.get_page(page_i, key, shape) if cache and page_i not in dirty else None
+                if cached is not None:
+                    hits, shape = cached
+                    yield hits, {"page": page_i, "cached": True, "tableStrategies": None, "backends": None,
+                                 "degraded": None, "profile": None}
+                    continue
+
+                shape_in = shape
+                if page_i in pooled_pages or scans is not None:
+                    scan = top_up_scan(next(pooled), page, session, shape, watchdog)
+                else:
+                    # сюда же попадают страницы из кэша, у которых сменилась входящая форма таблицы
+                    scan = scan_page(page, page_i, session, shape, picker, profile, policy, watchdog)
+                session.release(page_i)
+                hits, shape = run_stage(scan["profile"], "interpret", finish_page, scan, shape)
+                if cache and not scan["degraded"]:
+                    cache.put_page(key, shape_in, shape, hits)
+                yield hits, {"page": page_i, "cached": False, "tableStrategies": scan["tableStrategies"],
+                             "backends": scan["backendStats"], "degraded": scan["degraded"],
+                             "profile": scan["profile"]}
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+
+# ----------------- Page results (library API) -----------------
+PARSE_DEFAULTS = {
+    "workers": 1,
+    "cache": None,  # ParseCache или None
+    "tableStrategy": "all",
+    "profile": False,
+    "backends": "all",
+    "lowMemory": False,
+    "scans": None,  # готовые scan_page страниц из общего пула (batch)
+    "pageBudget": None,  # секунд на страницу
+    "stageBudget": None,  # секунд на стадию страницы
+    "deadline": None,  # секунд на весь прогон, от начала итерации
+}
+
+
+class PageRules(NamedTuple):
+    """
+    Результат одной страницы из iter_page_rules — неизменяемый.
+    exact — коды; prefixes — ((prefix, raw), ...); ranges — ((from, to, len, mode, raw), ...);
+    всё отсортировано. Это правила одной страницы, без post-clean документа (RuleSet.finalize).
+    hits — совпадения страницы; apply_hit меняет Hit, поэтому в RuleSet идут копии (hits_copy).
+    timings — {"seconds": время на страницу, стадия: wall, ...} (стадии — при profile).
+    info — диагностика iter_page_hits: cached, tableStrategies, backends, degraded, profile.
+    """
+
+    page: int
+    exact: tuple
+    prefixes: tuple
+    ranges: tuple
+    hits: tuple
+    timings: MappingProxyType
+    info: MappingProxyType
+
+    @property
+    def cached(self) -> bool:
+        return self.info["cached"]
+
+    def hits_copy(self):
+        return [h.copy() for h in self.hits]
+
+
+def page_rules(hits, seconds: float, info) -> PageRules:
+    exact, prefix_objects, ranges = set(), {}, set()
+    for h in hits:
+        apply_hit(h.copy(), exact=exact, prefix_objects=prefix_objects, ranges=ranges)
+    timings = {"seconds": seconds}
+    for st in info["profile"] or ():
+        timings[st["stage"]] = timings.get(st["stage"], 0.0) + st["wall"]
+    return PageRules(
+        page=info["page"],
+        exact=tuple(sorted(exact)),
+        prefixes=tuple(sorted((p, o["raw"]) for p, o in prefix_objects.items())),
+        ranges=tuple(sorted(ranges)),
+        hits=tuple(hits),
+        timings=MappingProxyType(timings),
+        info=MappingProxyType(info),
+    )
+
+
+def iter_page_rules(pdf_path: str, options=None):
+    """
+    Библиотечный API: PageRules по каждой странице, по порядку, как только страница готова.
+    options — dict поверх PARSE_DEFAULTS (workers, cache, tableStrategy, profile, backends, lowMemory, scans,
+    pageBudget, stageBudget, deadline).
+    Правила документа — RuleSet из hits_copy() всех страниц + finalize() (так делает main).
+    """
+    opts = dict(PARSE_DEFAULTS)
+    unknown = set(options or ()) - set(opts)
+    if unknown:
+        raise ValueError(f"unknown options: {', '.join(sorted(unknown))}")
+    opts.update(options or {})
+
+    pages = iter_page_hits(pdf_path, workers=max(1, opts["workers"]), cache=opts["cache"],
+                           table_strategy=opts["tableStrategy"], profile=opts["profile"],
+                           backends=opts["backends"], low_memory=opts["lowMemory"], scans=opts["scans"],
+                           watchdog=Watchdog(opts["pageBudget"], opts["stageBudget"], opts["deadline"]))
+    try:
+        t0 = perf_counter()
+        for hits, info in pages:
+            t1 = perf_counter()
+            yield page_rules(hits, t1 - t0, info)
+            t0 = perf_counter()  # время потребителя между страницами не считаем
+    finally:
+        pages.close()  # потребитель остановился раньше -> закрыть PDF и пул сразу
+
+
+# ----------------- Parse cache -----------------
+PARSE_CACHE_VERSION = 2
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _pdf_digest(obj, memo, depth: int = 0) -> bytes:
+    """
+    SHA-256 объекта PDF с разрешёнными ссылками: потоки — словарь + сырые байты.
+    memo — {objid: digest} на документ, общие шрифты и XObject считаются один раз.
+    /Parent не идём (дерево страниц — весь документ), глубина ограничена (циклы).
+    """
+    if isinstance(obj, PDFObjRef):
+        if obj.objid in memo:
+            return memo[obj.objid]
+        memo[obj.objid] = b"cycle"
+        digest = memo[obj.objid] = _pdf_digest(resolve1(obj), memo, depth)
+        return digest
+    h = hashlib.sha256()
+    if depth > 32:
+        h.update(b"deep")
+    elif isinstance(obj, PDFStream):
+        h.update(b"stream")
+        h.update(_pdf_digest(obj.attrs, memo, depth + 1))
+        raw = obj.get_rawdata()
+        h.update(raw if raw is not None else b"decoded" + obj.get_data())
+    elif isinstance(obj, dict):
+        h.update(b"dict")
+        for k in sorted(obj, key=str):
+            if k != "Parent":
+                h.update(str(k).encode() + _pdf_digest(obj[k], memo, depth + 1))
+    elif isinstance(obj, (list, tuple)):
+        h.update(b"list")
+        for v in obj:
+            h.update(_pdf_digest(v, memo, depth + 1))
+    else:
+        h.update(repr(obj).encode())
+    return h.digest()
+
+
+def page_fingerprint(page_obj, memo=None) -> str:
+    """
+    Отпечаток страницы (pdfminer PDFPage) без разбора содержимого и layout-анализа:
+    геометрия, сырые content streams и ресурсы, от которых зависит текст, —
+    шрифты (в т.ч. ToUnicode) и XObject (формы — вместе с их ресурсами).
+    Правка шрифта или формы без правки самой страницы тоже меняет отпечаток.
+    """
+    memo = {} if memo is None else memo
+    h = hashlib.sha256()
+    h.update(repr((page_obj.mediabox, page_obj.rotate)).encode())
+    for ref in list_value(page_obj.contents or []):
+        stream = resolve1(ref)
+        if isinstance(stream, PDFStream):
+            h.update(stream.get_rawdata() or b"")
+    h.update(_pdf_digest(page_obj.resources or {}, memo))
+    return h.hexdigest()
+
+
+class ParseCache:
+    """
+    Инкрементальный кэш разбора (--cache DIR).
+    - тот же файл (SHA-256 целиком) -> отдаём прошлый eec_rules.json как есть;
+    - иначе страница с тем же отпечатком (page_fingerprint) и той же входящей формой
+      таблицы берётся из кэша; страницы с новым отпечатком и их соседи разбираются заново.
+    Ключ кэша включает версию и SHA-256 самого парсера: правка логики сбрасывает кэш.
+    """
+
+    META = "parse_cache.json"
+    OUTPUT = "output.json"
+    SPILL = "pages.spill.jsonl"
+
+    def __init__(self, cache_dir: str, options=None):
+        self.dir = cache_dir
+        self.key = {
+            "version": PARSE_CACHE_VERSION,
+            "parser": file_sha256(__file__),
+            "options": options or {},
+        }
+        self.meta = {}
+        try:
+            with open(os.path.join(cache_dir, self.META), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("key") == self.key:
+                self.meta = meta
+        except (OSError, ValueError):
+            pass
+
+        self._old = {}  # sha -> {shapeIn(json) -> entry}
+        for entry in self.meta.get("pages", []):
+            self._old.setdefault(entry["sha256"], {})[json.dumps(entry["shapeIn"])] = entry
+        self._new = []
+        self._spill = None  # файл с уже сброшенными на диск записями _new (--max-rss)
+        self.spilled = 0
+        self.page_stats = None
+
+    def cached_output(self, file_sha: str):
+        """bytes прошлого вывода, если файл не изменился; иначе None."""
+        if not file_sha or self.meta.get("fileSha256") != file_sha:
+            return None
+        try:
+            with open(os.path.join(self.dir, self.OUTPUT), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    @property
+    def stats(self):
+        return self.meta.get("stats")
+
+    def plan(self, keys):
+        """
+        keys — отпечатки страниц по порядку. Возвращает номера страниц (с 1) для полного
+        разбора: отпечатка нет в кэше — и соседние с ними, чтобы продолжение таблицы
+        (choose_code_col) через границу изменённой страницы считалось заново.
+        Остальные берутся из кэша, если совпала и входящая форма таблицы.
+        """
+        changed = [i for i, key in enumerate(keys, start=1) if key not in self._old]
+        dirty = {j for i in changed for j in (i - 1, i, i + 1) if 1 <= j <= len(keys)}
+        self.page_stats = {"pages": len(keys), "changed": len(changed), "neighbours": len(dirty) - len(changed),
+                           "reused": 0}
+        return dirty
+
+    def get_page(self, page_i: int, sha: str, shape_in):
+        """(hits, shape_out) из кэша или None. Номер страницы в hits переписывается."""
+        entry = self._old.get(sha, {}).get(json.dumps(shape_in))
+        if entry is None:
+            return None
+        hits = [Hit.from_dict(h, page=page_i) for h in entry["hits"]]
+        self._new.append(entry)
+        self.page_stats["reused"] += 1
+        shape_out = entry["shapeOut"]
+        return hits, (tuple(shape_out) if shape_out else None)
+
+    def put_page(self, sha: str, shape_in, shape_out, hits):
+        # копия до apply_hit: тот подменяет value у prefixObj на накопленный объект
+        self._new.append({
+            "sha256": sha,
+            "shapeIn": shape_in,
+            "shapeOut": shape_out,
+            "hits": [h.to_dict() for h in hits],
+        })
+
+    def spill(self) -> int:
+        """Записи страниц, накопленные в памяти, -> во временный JSONL в каталоге кэша."""
+        if not self._new:
+            return 0
+        if self._spill is None:
+            os.makedirs(self.dir, exist_ok=True)
+            self._spill = open(os.path.join(self.dir, self.SPILL), "w+", encoding="utf-8")
+        for entry in self._new:
+            self._spill.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        n = len(self._new)
+        self.spilled += n
+        self._new = []
+        return n
+
+    def _entries_json(self):
+        if self._spill is not None:
+            self._spill.seek(0)
+            for line in self._spill:
+                yield line.rstrip("\n")
+        for entry in self._new:
+            yield json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+
+    def save(self, file_sha: str, output: bytes, stats):
+        os.makedirs(self.dir, exist_ok=True)
+        _write_atomic(os.path.join(self.dir, self.OUTPUT), output)
+        # meta пишется потоком: записи страниц могут лежать в spill-файле, а не в памяти
+        head = json.dumps({"key": self.key, "fileSha256": file_sha, "stats": stats}, ensure_ascii=False,
+                          separators=(",", ":"))
+        path = os.path.join(self.dir, self.META)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(head[:-1] + ',"pages":[')
+            for i, entry in enumerate(self._entries_json()):
+                f.write("," + entry if i else entry)
+            f.write("]}")
+        os.replace(path + ".tmp", path)
+        if self._spill is not None:
+            self._spill.close()
+            os.remove(self._spill.name)
+            self._spill = None
+
+
+def _read_bytes(path: str):
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+# ----------------- Memory guard -----------------
+def current_rss_mb() -> float:
+    """Текущий RSS процесса (Linux /proc); где его нет — пиковый из getrusage."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return _peak_rss_kb() / 1024
+
+
+class MemoryGuard:
+    """
+    --max-rss MB: RSS проверяется после каждой страницы. Выше порога промежуточные
+    результаты страниц (записи кэша разбора) уходят на диск; раз в FLUSH_EVERY таких
+    страниц ещё сбрасывается store MuPDF и запускается gc (дорого делать это на каждой).
+    В памяти остаются только накопленные правила.
+    """
+
+    FLUSH_EVERY = 50
+
+    def __init__(self, max_rss_mb=None):
+        self.max_rss_mb = max_rss_mb
+        self.peak_mb = 0.0
+        self.spills = 0
+        self.spilled_pages = 0
+
+    def check(self, cache=None):
+        rss = current_rss_mb()
+        self.peak_mb = max(self.peak_mb, rss)
+        if self.max_rss_mb is None or rss <= self.max_rss_mb:
+            return
+        if cache is not None:
+            self.spilled_pages += cache.spill()
+        if self.spills % self.FLUSH_EVERY == 0:
+            if fitz is not None:
+                fitz.TOOLS.store_shrink(100)
+            gc.collect()
+        self.spills += 1
+
+    def report(self):
+        return {"maxRssMb": self.max_rss_mb, "peakRssMb": round(self.peak_mb, 1), "spills": self.spills,
+                "spilledPages": self.spilled_pages}
+
+
+# ----------------- Output -----------------
+OUTPUT_FORMATS = ("pretty", "compact", "jsonl")
+JSONL_FORMAT = "eec-rules-jsonl/1"
+
+
+def dumps(obj, indent: bool = False) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def iter_jsonl_records(out):
+    """
+    JSONL: заголовок, по строке на правило (prefix / exact / range), debug и stats в конце.
+    Читается построчно, не разбирая файл целиком (см. eec_index.load_rules, merge_rules.ts).
+    """
+    yield {"type": "header", "format": JSONL_FORMAT, "source": out["source"], "generatedAt": out["generatedAt"]}
+    rules = out["rules"]
+    for obj in rules["prefixObjects"]:
+        yield {"type": "prefix", **obj}
+    for code in rules["exact"]:
+        yield {"type": "exact", "code": code}
+    for r in rules["ranges"]:
+        yield {"type": "range", **r}
+    if out.get("provenance"):
+        yield {"type": "provenance", **out["provenance"]}
+    if out.get("debug"):
+        yield {"type": "debug", **out["debug"]}
+    yield {"type": "stats", **out["stats"]}
+
+
+def iter_output(out, fmt: str = "pretty"):
+    """Вывод кусками bytes: pretty (indent=2, как раньше), compact (без отступов) или jsonl."""
+    if fmt == "jsonl":
+        for rec in iter_jsonl_records(out):
+            yield dumps(rec) + b"\n"
+    else:
+        yield dumps(out, indent=fmt == "pretty")
+
+
+# ----------------- Delta -----------------
+def merge_diff(prev, cur, key):
+    """
+    Сравнение двух отсортированных по key списков за один проход (sorted-merge).
+    Отдаёт пары (prev_item | None, cur_item | None) по объединению ключей.
+    """
+    i = j = 0
+    while i < len(prev) or j < len(cur):
+        if j >= len(cur) or (i < len(prev) and key(prev[i]) < key(cur[j])):
+            yield prev[i], None
+            i += 1
+        elif i >= len(prev) or key(cur[j]) < key(prev[i]):
+            yield None, cur[j]
+            j += 1
+        else:
+            yield prev[i], cur[j]
+            i += 1
+            j += 1
+
+
+def _range_key(r):
+    return r["from"], r["to"], r.get("len") or 0, r.get("mode") or "", r.get("raw") or ""
+
+
+def _tagged(doc, section: str, key):
+    """[(правило, страница)] раздела, отсортированные по key (вывод уже отсортирован — это O(n))."""
+    items = doc["rules"].get(section) or []
+    pages = (doc.get("provenance") or {}).get(section) or []
+    if len(pages) != len(items):
+        pages = [None] * len(items)  # старый вывод без provenance
+    return sorted(zip(items, pages), key=lambda ip: key(ip[0]))
+
+
+def rules_delta(prev_doc, cur_doc):
+    """
+    Дельта между двумя выводами (см. eec_index.load_output): добавленные/удалённые
+    exact, префиксы (и смена raw) и диапазоны. page — страница, откуда правило:
+    для удалённых — из provenance прошлого вывода (если он есть).
+    """
+    delta = {
+        "from": prev_doc.get("generatedAt"),
+        "to": cur_doc.get("generatedAt"),
+        "exact": {"added": [], "removed": []},
+        "prefixes": {"added": [], "removed": [], "rawChanged": []},
+        "ranges": {"added": [], "removed": []},
+    }
+
+    def first(ip):
+        return ip[0]
+
+    for a, b in merge_diff(_tagged(prev_doc, "exact", str), _tagged(cur_doc, "exact", str), first):
+        if a is None:
+            delta["exact"]["added"].append({"code": b[0], "page": b[1]})
+        elif b is None:
+            delta["exact"]["removed"].append({"code": a[0], "page": a[1]})
+
+    def prefix_key(ip):
+        return ip[0]["prefix"]
+
+    prev_p = _tagged(prev_doc, "prefixObjects", lambda o: o["prefix"])
+    cur_p = _tagged(cur_doc, "prefixObjects", lambda o: o["prefix"])
+    for a, b in merge_diff(prev_p, cur_p, prefix_key):
+        if a is None:
+            delta["prefixes"]["added"].append({"prefix": b[0]["prefix"], "raw": b[0].get("raw"), "page": b[1]})
+        elif b is None:
+            delta["prefixes"]["removed"].append({"prefix": a[0]["prefix"], "raw": a[0].get("raw"), "page": a[1]})
+        elif a[0].get("raw") != b[0].get("raw"):
+            delta["prefixes"]["rawChanged"].append({"prefix": b[0]["prefix"], "rawBefore": a[0].get("raw"),
+                                                    "raw": b[0].get("raw"), "page": b[1]})
+
+    def range_key(ip):
+        return _range_key(ip[0])
+
+    for a, b in merge_diff(_tagged(prev_doc, "ranges", _range_key), _tagged(cur_doc, "ranges", _range_key), range_key):
+        if a is None:
+            delta["ranges"]["added"].append({**b[0], "page": b[1]})
+        elif b is None:
+            delta["ranges"]["removed"].append({**a[0], "page": a[1]})
+
+    delta["stats"] = {
+        f"{section}.{change}": len(items)
+        for section in ("exact", "prefixes", "ranges")
+        for change, items in delta[section].items()
+    }
+    return delta
+
+
+def write_delta(prev_data: bytes, cur_doc, delta_path: str):
+    delta = rules_delta(load_output(prev_data), cur_doc)
+    _write_atomic(delta_path, dumps(delta, indent=True))
+    return delta
+
+
+def write_extras(args, doc, prev_data):
+    """
+    Производные файлы от вывода doc ({"generatedAt", "rules", "provenance", "stats"}):
+    --index, --prev (дельта), --normalize, --history. Одинаково для свежего разбора и попадания в кэш.
+    """
+    if args.index:
+        write_index(doc["rules"], args.index)
+    if prev_data is not None:
+        delta_path = args.delta or os.path.splitext(args.out_path)[0] + ".delta.json"
+        print("delta:", delta_path, write_delta(prev_data, doc, delta_path)["stats"])
+    if args.normalize:
+        report = normalize_rules(doc["rules"], doc["provenance"])
+        _write_atomic(args.normalize, dumps(report, indent=True))
+        print("normalize:", args.normalize, report["stats"])
+    if args.history:
+        if (doc.get("stats") or {}).get("degradedPages"):
+            # неполный разбор закрыл бы в истории правила, которых просто не нашли
+            print("history: skipped, output has degraded pages")
+            return
+        date = args.history_date or doc["generatedAt"] or datetime.utcnow().isoformat() + "Z"
+        file_sha = file_sha256(args.pdf_path) if os.path.isfile(args.pdf_path) else None
+        result = HistoryStore(args.history).add(doc["rules"], date, source=os.path.basename(args.pdf_path),
+                                                file_sha=file_sha)
+        print("history:", args.history, result)
+
+
+def build_arg_parser():
+    ap = argparse.ArgumentParser(
+        usage="python scripts/parse_eec_pdf.py <input.pdf> <output.json> [options]\n"
+              "       python scripts/parse_eec_pdf.py serve [--socket PATH] [--jobs N]\n"
+              "       python scripts/parse_eec_pdf.py batch <dir|manifest> <out_dir> [--jobs N] [options]",
+    )
+    ap.add_argument("pdf_path")
+    ap.add_argument("out_path")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="число процессов для разбора страниц (1 = последовательно)")
+    ap.add_argument("--cache", metavar="DIR", default=None,
+                    help="каталог инкрементального кэша разбора (по SHA-256 файла и страниц)")
+    ap.add_argument("--index", metavar="PATH", default=None,
+                    help="дополнительно записать бинарный индекс для поиска (см. scripts/eec_index.py)")
+    ap.add_argument("--format", choices=OUTPUT_FORMATS, default="pretty",
+                    help="pretty — JSON с отступами; compact — JSON без пробелов; "
+                         "jsonl — заголовок, по строке на правило, stats в конце")
+    ap.add_argument("--prev", metavar="PATH", default=None,
+                    help="прошлый вывод (любой --format): записать дельту правил рядом с выводом")
+    ap.add_argument("--delta", metavar="PATH", default=None,
+                    help="куда писать дельту (по умолчанию <output>.delta.json)")
+    ap.add_argument("--normalize", metavar="PATH", default=None,
+                    help="записать отчёт нормализации: минимальный набор правил, покрытые и слитые правила "
+                         "(см. scripts/eec_ranges.py)")
+    ap.add_argument("--history", metavar="DIR", default=None,
+                    help="добавить правила прогона версией в историю (см. scripts/eec_history.py): "
+                         "интервалы действия правил, поиск на дату")
+    ap.add_argument("--history-date", metavar="DATE", default=None,
+                    help="дата версии реестра для --history (по умолчанию — generatedAt вывода)")
+    ap.add_argument("--no-parse", action="store_true",
+                    help="PDF не разбирать: взять уже записанный <output> и только пересобрать "
+                         "--index/--normalize/--prev/--history (PDF-библиотеки не импортируются)")
+    ap.add_argument("--debug-hits", metavar="MODE", default="first:5000",
+                    help="off | first:N | reservoir:N | stream:PATH (JSONL) — что сохранять из совпадений")
+    ap.add_argument("--profile", action="store_true",
+                    help="замеры по страницам и стадиям: <output>.profile.json/.csv + сводка")
+    ap.add_argument("--backends", metavar="SPEC", default="all",
+                    help="all | auto | список из words,pdfminer,pymupdf — какие текстовые бэкенды запускать; "
+                         "auto пропускает дорогие бэкенды, которые давно ничего не добавляли")
+    ap.add_argument("--low-memory", action="store_true",
+                    help="не удерживать разобранные страницы и кэши объектов PDF: память не растёт с числом страниц")
+    ap.add_argument("--max-rss", metavar="MB", type=float, default=None,
+                    help="порог RSS (включает --low-memory): выше него промежуточные результаты страниц "
+                         "(записи --cache) сбрасываются на диск")
+    ap.add_argument("--page-budget", metavar="SEC", type=float, default=None,
+                    help="бюджет времени на страницу: стадии сверх него прерываются, страница идёт дешёвыми "
+                         "экстракторами (words, PyMuPDF) и помечается в stats.degradedPages")
+    ap.add_argument("--stage-budget", metavar="SEC", type=float, default=None,
+                    help="бюджет времени на одну стадию страницы (tables, words, pdfminer, fallback)")
+    ap.add_argument("--deadline", metavar="SEC", type=float, default=None,
+                    help="дедлайн всего прогона: оставшиеся страницы разбираются только PyMuPDF")
+    ap.add_argument("--table-strategy", choices=["all", "adaptive"], default="all",
+                    help="all — все стратегии таблиц на каждой странице; "
+                         "adaptive — сначала стратегия, выигрывавшая на прошлых страницах")
+    return ap
+
+
+def main(argv=None, progress=None):
+    """
+    Разбор одного PDF. argv — аргументы командной строки (None -> sys.argv),
+    progress(page_i) вызывается после каждой страницы (serve шлёт это клиенту).
+    Возвращает {"out", "stats", "cached"}.
+    """
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv[:1] == ["serve"]:
+        return serve_main(argv[1:])
+    if argv[:1] == ["batch"]:
+        return batch_main(argv[1:])
+
+    ap = build_arg_parser()
+    args = ap.parse_args(argv)
+
+    pdf_path = args.pdf_path
+    out_path = args.out_path
+    # прошлый вывод читаем до записи нового: --prev может указывать на тот же файл
+    prev_data = _read_bytes(args.prev) if args.prev else None
+    if args.prev and prev_data is None:
+        ap.error(f"--prev: cannot read {args.prev}")
+
+    if args.no_parse:
+        data = _read_bytes(out_path)
+        if data is None:
+            ap.error(f"--no-parse: cannot read {out_path}")
+        print("OK (no-parse):", out_path)
+        write_extras(args, load_output(data), prev_data)
+        return {"out": out_path, "stats": None, "cached": True}
+
+    try:
+        BackendPolicy(args.backends)  # ошибку в spec — до разбора
+    except ValueError as e:
+        ap.error(str(e))
+
+    cache_options = {"tableStrategy": args.table_strategy, "debugHits": args.debug_hits, "backends": args.backends,
+                     "format": args.format}
+    cache = ParseCache(args.cache, options=cache_options) if args.cache else None
+    file_sha = file_sha256(pdf_path) if cache else None
+    if cache:
+        cached = cache.cached_output(file_sha)
+        if cached is not None:
+            # тот же PDF, что и в прошлый раз -> прошлый результат без разбора
+            if _read_bytes(out_path) != cached:
+                _write_atomic(out_path, cached)
+            print("OK (cache):", out_path, cache.stats)
+            write_extras(args, load_output(cached), prev_data)
+            return {"out": out_path, "stats": cache.stats, "cached": True}
+
+    try:
+        recorder = DebugRecorder.from_spec(args.debug_hits)
+    except ValueError as e:
+        ap.error(str(e))
+
+    options = {"workers": args.workers, "cache": cache, "tableStrategy": args.table_strategy,
+               "profile": args.profile, "backends": args.backends,
+               "lowMemory": args.low_memory or args.max_rss is not None,
+               "pageBudget": args.page_budget, "stageBudget": args.stage_budget, "deadline": args.deadline}
+    return write_document(args, iter_page_rules(pdf_path, options), recorder, cache=cache, file_sha=file_sha,
+                          prev_data=prev_data, progress=progress)
+
+
+def write_document(args, pages, recorder, cache=None, file_sha=None, prev_data=None, progress=None):
+    """
+    Потребитель iter_page_rules: правила документа из PageRules страниц, вывод в
+    args.out_path (args — разобранные build_arg_parser), кэш и производные файлы.
+    Возвращает {"out", "stats", "cached"}.
+    """
+    rules = RuleSet()
+    backend_stats = BackendPolicy(args.backends)
+    table_stats = TableStrategyPicker(adaptive=args.table_strategy == "adaptive")
+    degraded = []
+
+    profile = ProfileReport() if args.profile else None
+    memory = MemoryGuard(args.max_rss)
+
+    for page in pages:
+        info = page.info
+        if info["tableStrategies"]:
+            table_stats.add(info["tableStrategies"])
+        if info["backends"]:
+            backend_stats.add(info["backends"])
+        if info["degraded"]:
+            degraded.append({"page": page.page, "stages": info["degraded"]})
+        hits = page.hits_copy()
+        if profile is not None and info["profile"] is not None:
+            profile.add_page(page.page, info["profile"], hits)
+        rules.add_hits(hits)
+        recorder.add_page(hits)
+        memory.check(cache)
+        if progress is not None:
+            progress(page.page)
+    recorder.close()
+
+    rules.finalize()
 
     out = {
         "source": "EEC registry — robust parser (tables + words + fallbacks), 4/6/10 aware",
         "generatedAt": datetime.utcnow().isoformat() + "Z",
-        "rules": {
-            "prefixObjects": sorted(prefix_objects.values(), key=lambda x: x["prefix"]),
-            "exact": sorted(exact),
-            "ranges": [
-                {"from": a, "to": b, "len": L, "mode": mode, "raw": raw}
-                for (a, b, L, mode, raw) in sorted(ranges)
-            ],
-        },
-        "stats": {
-            "prefixObjects": len(prefix_objects),
-            "exact": len(exact),
-            "ranges": len(ranges),
-        },
-        "debug": {
-            "note": "Первые 5000 совпадений для проверки откуда взято.",
-            "hitsSample": debug_hits[:5000],
-        },
+        "rules": rules.to_json(),
+        "stats": rules.stats(),
+        "provenance": rules.provenance(),
+        "debug": recorder.section(),
     }
+    if table_stats.adaptive:
+        out["debug"]["tableStrategies"] = table_stats.report()
+    if backend_stats.mode != "all":
+        out["debug"]["backends"] = backend_stats.report()
+    if degraded:
+        out["stats"]["degradedPages"] = [d["page"] for d in degraded]
+    if args.page_budget is not None or args.stage_budget is not None or args.deadline is not None:
+        out["debug"]["budget"] = {"pageBudget": args.page_budget, "stageBudget": args.stage_budget,
+                                  "deadline": args.deadline, "degraded": degraded}
+    if args.max_rss is not None:
+        out["debug"]["memory"] = memory.report()
+
+    chunks = [] if cache else None
+    with open(args.out_path, "wb") as f:
+        for chunk in iter_output(out, args.format):
+            f.write(chunk)
+            if chunks is not None:
+                chunks.append(chunk)
+    if cache:
+        # с деградировавшими страницами вывод не привязываем к файлу: следующий прогон разберёт их заново
+        cache.save(None if degraded else file_sha, b"".join(chunks), out["stats"])
+
+    print("OK:", args.out_path, out["stats"])
+    if cache:
+        print("cache pages:", cache.page_stats)
+    write_extras(args, out, prev_data)
+    if table_stats.adaptive:
+        print("table strategies:", table_stats.report())
+    if backend_stats.mode != "all":
+        print("backends:", backend_stats.report())
+    if degraded:
+        print("degraded pages:", degraded)
+    if args.max_rss is not None:
+        print("memory:", memory.report())
+    if profile is not None:
+        paths = profile.write(args.out_path)
+        print(profile.summary())
+        print("profile:", *paths)
+    return {"out": args.out_path, "stats": out["stats"], "cached": False}
+
+
+# ----------------- Batch -----------------
+# Перепрогон архива снимков реестра одним процессом: страницы всех документов идут
+# в общий пул (крупные документы первыми), интерпретация таблиц и запись вывода —
+# в родителе, документ за документом, пока пул уже разбирает следующие страницы.
+BATCH_SUMMARY = "batch_summary.json"
+# пути вывода и кэш свои у каждого документа; параллелизм задаёт --jobs
+BATCH_PER_DOCUMENT = ("cache", "index", "prev", "delta", "normalize", "no_parse", "history", "history_date")
+
+
+def batch_inputs(source: str, out_dir: str, ext: str):
+    """
+    [(pdf, out)] из каталога (*.pdf рекурсивно) или манифеста (путь на строку, # — комментарий,
+    относительные пути — от каталога манифеста). Вывод повторяет путь PDF относительно них.
+    """
+    if os.path.isdir(source):
+        base = source
+        pdfs = sorted(os.path.join(d, f) for d, _, files in os.walk(source) for f in files
+                      if f.lower().endswith(".pdf"))
+    else:
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source, "r", encoding="utf-8") as f:
+            lines = [line.strip() for line in f]
+        pdfs = [os.path.join(base, line) for line in lines if line and not line.startswith("#")]
+
+    jobs = []
+    seen = set()
+    for pdf in pdfs:
+        rel = os.path.relpath(os.path.abspath(pdf), os.path.abspath(base))
+        if rel.startswith(".."):
+            rel = os.path.basename(pdf)
+        out = os.path.join(out_dir, os.path.splitext(rel)[0] + ext)
+        if out in seen:
+            raise ValueError(f"two inputs map to {out}")
+        seen.add(out)
+        jobs.append((pdf, out))
+    return jobs
+
+
+def count_pages(pdf_path: str) -> int:
+    load_pdf_libs("pdfplumber")
+    with pdfplumber.open(pdf_path) as pdf:
+        return sum(1 for _ in iter_pdf_pages(pdf, low_memory=True))
+
+
+def batch_main(argv):
+    ap = argparse.ArgumentParser(
+        usage="python scripts/parse_eec_pdf.py batch <dir|manifest> <out_dir> [--jobs N] [options]",
+        description="options — как у разбора одного PDF: --format, --backends, --table-strategy, "
+                    "--debug-hits, --profile, --low-memory, --max-rss, --page-budget, "
+                    "--stage-budget, --deadline (дедлайн — на весь batch).",
+    )
+    ap.add_argument("source", help="каталог с PDF или манифест (путь на строку)")
+    ap.add_argument("out_dir")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="процессов в общем пуле страниц")
+    args, rest = ap.parse_known_args(argv)
+
+    template = build_arg_parser().parse_args(["in.pdf", "out.json", *rest])
+    per_doc = [name for name in BATCH_PER_DOCUMENT if getattr(template, name)]
+    if per_doc or template.workers != 1:
+        ap.error("not supported in batch: " + ", ".join("--" + n.replace("_", "-") for n in per_doc or ["workers"]))
+    if template.debug_hits.startswith("stream:"):
+        ap.error("--debug-hits stream:PATH is per-document, not supported in batch")
+    try:
+        BackendPolicy(template.backends)
+        DebugRecorder.from_spec(template.debug_hits)
+    except ValueError as e:
+        ap.error(str(e))
+
+    ext = ".jsonl" if template.format == "jsonl" else ".json"
+    try:
+        inputs = batch_inputs(args.source, args.out_dir, ext)
+    except (OSError, ValueError) as e:
+        ap.error(str(e))
+
+    jobs = []
+    errors = []
+    for pdf, out in inputs:
+        try:
+            jobs.append((count_pages(pdf), pdf, out))
+        except Exception as e:  # битый PDF не останавливает остальные
+            errors.append({"pdf": pdf, "out": out, "error": f"{type(e).__name__}: {e}"})
+    jobs.sort(key=lambda job: -job[0])  # крупные первыми: меньше хвост, когда остальные уже закончились
+
+    workers = max(1, args.jobs)
+    low_memory = template.low_memory or template.max_rss is not None
+    options = {"tableStrategy": template.table_strategy, "profile": template.profile, "backends": template.backends,
+               "lowMemory": low_memory, "pageBudget": template.page_budget, "stageBudget": template.stage_budget}
+    watchdog = Watchdog(template.page_budget, template.stage_budget, template.deadline)
+    t0 = perf_counter()
+    documents = []
+    pool = None
+    scans = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_batch_init,
+                                   initargs=(template.table_strategy, template.profile, template.backends,
+                                             low_memory, watchdog))
+        tasks = [(pdf, page_i) for n, pdf, _ in jobs for page_i in range(1, n + 1)]
+        scans = _map_ahead(pool, _batch_scan_page, tasks, ahead=4 * workers)
+    try:
+        for n, pdf, out in jobs:
+            d0 = perf_counter()
+            os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+            doc_args = build_arg_parser().parse_args([pdf, out, *rest])
+            deadline = max(0.0, watchdog.deadline_at - time()) if watchdog.deadline_at is not None else None
+            pages = iter_page_rules(pdf, {**options, "scans": scans, "deadline": deadline})
+            result = write_document(doc_args, pages, DebugRecorder.from_spec(doc_args.debug_hits))
+            documents.append({"pdf": pdf, "out": out, "pages": n, "stats": result["stats"],
+                              "seconds": round(perf_counter() - d0, 3)})
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    seconds = perf_counter() - t0
+    pages_total = sum(d["pages"] for d in documents)
+    summary = {
+        "generatedAt": datetime.utcnow().isoformat() + "Z",
+        "jobs": workers,
+        "documents": documents,
+        "errors": errors,
+        "pages": pages_total,
+        "seconds": round(seconds, 3),
+        "pagesPerSec": round(pages_total / seconds, 3) if seconds > 0 else None,
+    }
+    os.makedirs(args.out_dir, exist_ok=True)
+    summary_path = os.path.join(args.out_dir, BATCH_SUMMARY)
+    _write_atomic(summary_path, dumps(summary, indent=True))
+    print(f"batch: {len(documents)} documents, {pages_total} pages, {summary['seconds']}s "
+          f"({summary['pagesPerSec']} pages/s), errors: {len(errors)} -> {summary_path}")
+    return summary
+
+
+# ----------------- Serve -----------------
+# Тёплый процесс: библиотеки импортированы, регэкспы скомпилированы, воркеры пула
+# живут между заданиями. Протокол — JSON-RPC 2.0, по запросу на строку:
+#   {"jsonrpc": "2.0", "id": 1, "method": "parse",
+#    "params": {"pdf": "a.pdf", "out": "a.json", "args": ["--format", "compact"], "progress": true}}
+#   -> {"jsonrpc": "2.0", "id": 1, "result": {"out", "stats", "cached", "seconds", "log"}}
+#   progress: true -> по ходу {"jsonrpc": "2.0", "method": "progress", "params": {"id": 1, "page": N}}
+# Методы: parse, stats (задания, jobs/s), ping, shutdown.
+_SERVE_PROGRESS = None
+
+
+def _serve_init(progress_queue):
+    global _SERVE_PROGRESS
+    _SERVE_PROGRESS = progress_queue
+    load_pdf_libs("pdfplumber", "pdfminer", "fitz")  # воркер держит библиотеки тёплыми
+
+
+def _serve_job(job_id: int, argv, want_progress: bool):
+    """Одно задание в воркере serve: main() с перехваченным stdout."""
+    log = StringIO()
+    t0 = perf_counter()
+
+    def progress(page_i):
+        _SERVE_PROGRESS.put((job_id, page_i))
+
+    try:
+        with redirect_stdout(log), redirect_stderr(log):
+            result = main(argv, progress=progress if want_progress else None)
+    except SystemExit as e:  # ошибка аргументов (argparse)
+        raise ValueError(log.getvalue().strip() or f"exit code {e.code}") from None
+    finally:
+        if want_progress:
+            _SERVE_PROGRESS.put((job_id, None))  # прогресс задания закончился
+    result["seconds"] = round(perf_counter() - t0, 3)
+    result["log"] = log.getvalue()
+    return result
+
+
+class ParseServer:
+    """
+    Очередь заданий разбора поверх пула процессов (--jobs N).
+    Параллелизм — между заданиями, поэтому внутри задания --workers всегда 1.
+    Прогресс идёт из воркеров через очередь; ответ на задание с прогрессом уходит
+    только после его последнего сообщения, чтобы клиент не получил их не по порядку.
+    """
+
+    def __init__(self, jobs: int = 1):
+        self._progress = multiprocessing.Queue()
+        self.pool = ProcessPoolExecutor(max_workers=jobs, initializer=_serve_init, initargs=(self._progress,))
+        self.started = perf_counter()
+        self.done = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self._next_id = 0
+        self._cond = threading.Condition()
+        self._pending = set()  # job_id, ответ ещё не отправлен
+        self._subscribers = {}  # job_id -> (send, rpc id)
+        self._held = {}  # job_id -> ответ, ждущий конца прогресса
+        self._drained = set()  # job_id, прогресс которых закончился раньше ответа
+        self._pump = threading.Thread(target=self._pump_progress, daemon=True)
+        self._pump.start()
+
+    def _pump_progress(self):
+        while True:
+            item = self._progress.get()
+            if item is None:
+                return
+            job_id, page_i = item
+            if page_i is None:
+                self._finish(job_id)
+                continue
+            sub = self._subscribers.get(job_id)
+            if sub is not None:
+                send, rpc_id = sub
+                send({"jsonrpc": "2.0", "method": "progress", "params": {"id": rpc_id, "page": page_i}})
+
+    def _finish(self, job_id: int, send=None, msg=None):
+        """
+        Ответ отправляется, когда есть и он, и (для заданий с прогрессом) конец прогресса.
+        msg=None — конец прогресса из воркера.
+        """
+        with self._cond:
+            if msg is None:
+                if job_id not in self._held:
+                    self._drained.add(job_id)
+                    return
+                send, msg = self._held.pop(job_id)
+            elif job_id in self._subscribers and job_id not in self._drained:
+                self._held[job_id] = (send, msg)
+                return
+            self._drained.discard(job_id)
+            self._subscribers.pop(job_id, None)
+            send(msg)
+            self._pending.discard(job_id)
+            self._cond.notify_all()
+
+    def stats(self):
+        uptime = perf_counter() - self.started
+        return {"jobs": self.done, "failed": self.failed, "pending": len(self._pending),
+                "uptimeSeconds": round(uptime, 3), "busySeconds": round(self.busy_seconds, 3),
+                "jobsPerSec": round(self.done / uptime, 3) if uptime else 0.0}
+
+    def submit(self, params, send, rpc_id):
+        if not isinstance(params, dict) or not params.get("pdf") or not params.get("out"):
+            raise ValueError('params: {"pdf": PATH, "out": PATH, "args": [...]} expected')
+        args = params.get("args") or []
+        if not isinstance(args, list):
+            raise ValueError("params.args must be a list")
+        argv = [str(params["pdf"]), str(params["out"]), *map(str, args), "--workers", "1"]
+        want_progress = bool(params.get("progress"))
+
+        with self._cond:
+            self._next_id += 1
+            job_id = self._next_id
+            self._pending.add(job_id)
+            if want_progress:
+                self._subscribers[job_id] = (send, rpc_id)
+
+        def done(f):
+            try:
+                result = f.result()
+            except Exception as e:
+                self.failed += 1
+                msg = {"jsonrpc": "2.0", "id": rpc_id, "error": {"code": -32000, "message": str(e)}}
+            else:
+                self.done += 1
+                self.busy_seconds += result["seconds"]
+                msg = {"jsonrpc": "2.0", "id": rpc_id, "result": result}
+            self._finish(job_id, send, msg)
+
+        fut = self.pool.submit(_serve_job, job_id, argv, want_progress)
+        fut.add_done_callback(done)
+        return fut
+
+    def handle(self, line: str, send):
+        """Одна строка JSON-RPC. Возвращает False, если пришёл shutdown."""
+        try:
+            req = json.loads(line)
+        except ValueError as e:
+            send({"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": f"parse error: {e}"}})
+            return True
+        rpc_id = req.get("id") if isinstance(req, dict) else None
+        method = req.get("method") if isinstance(req, dict) else None
+
+        def reply(result):
+            send({"jsonrpc": "2.0", "id": rpc_id, "result": result})
+
+        if method == "parse":
+            try:
+                self.submit(req.get("params"), send, rpc_id)
+            except ValueError as e:
+                send({"jsonrpc": "2.0", "id": rpc_id, "error": {"code": -32602, "message": str(e)}})
+        elif method == "stats":
+            reply(self.stats())
+        elif method == "ping":
+            reply("pong")
+        elif method == "shutdown":
+            self.wait()
+            reply(self.stats())
+            return False
+        else:
+            send({"jsonrpc": "2.0", "id": rpc_id, "error": {"code": -32601, "message": f"unknown method {method!r}"}})
+        return True
+
+    def wait(self):
+        """Ждём, пока на все принятые задания уйдут ответы."""
+        with self._cond:
+            self._cond.wait_for(lambda: not self._pending)
+
+    def close(self):
+        self.wait()
+        self.pool.shutdown()
+        self._progress.put(None)
+        self._pump.join()
+
+
+def _line_sender(write, flush):
+    lock = threading.Lock()
+
+    def send(msg):
+        data = json.dumps(msg, ensure_ascii=False) + "\n"
+        with lock:
+            try:
+                write(data)
+                flush()
+            except (OSError, ValueError):
+                pass  # клиент ушёл
 
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(out, f, ensure_ascii=False, indent=2)
+    return send
 
-    print("OK:", out_path, out["stats"])
+
+def take_stdout():
+    """
+    stdout процесса -> канал JSON-RPC; fd 1 (и его наследуют воркеры) уходит в stderr,
+    чтобы печать библиотек (PyMuPDF пишет мимо sys.stdout) не ломала протокол.
+    """
+    channel = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    sys.stdout.flush()
+    os.dup2(2, 1)
+    return channel
+
+
+def serve_stdio(server: ParseServer, stdin=None, stdout=None):
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    send = _line_sender(stdout.write, stdout.flush)
+    for line in stdin:
+        if line.strip() and not server.handle(line, send):
+            break
+    server.wait()
+
+
+def serve_unix(server: ParseServer, path: str):
+    import socketserver
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            send = _line_sender(lambda s: self.wfile.write(s.encode("utf-8")), self.wfile.flush)
+            for raw in self.rfile:
+                line = raw.decode("utf-8")
+                if line.strip() and not server.handle(line, send):
+                    threading.Thread(target=srv.shutdown, daemon=True).start()
+                    return
+            server.wait()  # ответы этого клиента должны уйти до закрытия соединения
+
+    if os.path.exists(path):
+        os.unlink(path)
+    with socketserver.ThreadingUnixStreamServer(path, Handler) as srv:
+        print("serve:", path, file=sys.stderr)
+        try:
+            srv.serve_forever()
+        finally:
+            os.unlink(path)
+
+
+def serve_main(argv):
+    ap = argparse.ArgumentParser(usage="python scripts/parse_eec_pdf.py serve [--socket PATH] [--jobs N]")
+    ap.add_argument("--socket", metavar="PATH", default=None,
+                    help="Unix-сокет; без него — JSON-RPC по stdin/stdout")
+    ap.add_argument("--jobs", type=int, default=1, help="сколько заданий разбирать параллельно")
+    args = ap.parse_args(argv)
+
+    channel = None if args.socket else take_stdout()  # до запуска воркеров
+    server = ParseServer(jobs=max(1, args.jobs))
+    try:
+        if args.socket:
+            serve_unix(server, args.socket)
+        else:
+            serve_stdio(server, stdout=channel)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return server.stats()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,35 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "scripts"))
+
+pytest.importorskip("fitz")
+pytest.importorskip("pdfplumber")
+import bench_eec_parser as bench  # noqa: E402
+
+
+def test_synthetic_registry_parses_into_all_rule_kinds(tmp_path):
+    pdf = tmp_path / "synthetic.pdf"
+    bench.make_synthetic_registry(str(pdf), 5, seed=3)
+
+    first = bench.run_case(str(pdf))
+    assert first["pages"] == 5
+    assert first["rules"]["exact"] > 0 and first["rules"]["prefixObjects"] > 0 and first["rules"]["ranges"] > 0
+    assert {"words", "tables"} <= set(first["stages"])
+    assert first["codesPerSec"] == pytest.approx(sum(first["rules"].values()) / first["seconds"], rel=0.01)
+    assert first["hitsPerSec"] >= first["codesPerSec"] > 0
+
+    again = tmp_path / "again.pdf"
+    bench.make_synthetic_registry(str(again), 5, seed=3)
+    assert bench.run_case(str(again))["rulesSha256"] == first["rulesSha256"]
+
+
+def test_compare_flags_rule_changes_and_slowdowns():
+    base = {"rulesSha256": "a", "rules": {}, "pagesPerSec": 10.0}
+    assert bench.compare("x", dict(base, pagesPerSec=9.0), base, 0.2) == []
+    problems = bench.compare("x", dict(base, rulesSha256="b", pagesPerSec=7.0), base, 0.2)
+    assert len(problems) == 2
+    assert bench.compare("x", base, None, 0.2) == []
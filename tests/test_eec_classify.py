@@ -0,0 +1,97 @@
+import random
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import eec_classify  # noqa: E402
+
+
+def reference_check(rules, code_raw):
+    """Построчный порт checkTnved (lib/rules_runtime.ts): (type, rule) или (None, None)."""
+    code = eec_classify.digits(code_raw)
+    if not code:
+        return None, None
+    for e in rules["exact"]:
+        if e["code"] == code:
+            return "exact", e
+    for item in rules["prefix"]:
+        p = item["prefix"] if isinstance(item, dict) else item
+        if p and code.startswith(p):
+            return "prefix", item
+    for r in rules["ranges"]:
+        a, b = r["from"], r["to"]
+        if len(a) in (4, 6) and len(a) == len(b):
+            if len(code) >= len(a) and a <= code[:len(a)] <= b:
+                return "range_prefix", r
+            continue
+        if len(a) == 10 and len(b) == 10 and int(a) <= int(code) <= int(b):
+            return "range_numeric", r
+    return None, None
+
+
+def random_rules(rnd):
+    heads = [f"{rnd.randint(0, 99):02d}" for _ in range(4)]
+
+    def code(n):
+        return rnd.choice(heads) + "".join(rnd.choice("0123456789") for _ in range(n - 2))
+
+    rules = {
+        "exact": [{"code": code(rnd.choice((10, 10, 4)))} for _ in range(15)],
+        # порядок массива важен (первый подходящий), поэтому не сортируем
+        "prefix": [{"prefix": code(rnd.choice((4, 6)))} for _ in range(10)] + [code(4)],
+        "ranges": [],
+    }
+    for _ in range(10):
+        L = rnd.choice((4, 6, 10, 8))
+        a = code(L)
+        b = str(min(int(a) + rnd.randint(0, 50), 10 ** L - 1)).zfill(L)
+        rules["ranges"].append({"from": a, "to": b})
+    return rules, code
+
+
+def assert_matches_reference(rules, table, codes, types, indexes):
+    for c, t, i in zip(codes, types, indexes):
+        exp_type, exp_rule = reference_check(rules, c)
+        assert eec_classify.TYPES[int(t)] == exp_type, c
+        if exp_type == "prefix" and not isinstance(exp_rule, dict):
+            exp_rule = {"prefix": exp_rule}
+        assert table.rule(t, int(i)) == exp_rule, c
+
+
+@pytest.mark.parametrize("backend", ["numpy", "bisect"])
+def test_classify_matches_check_tnved_port(monkeypatch, backend):
+    if backend == "bisect":
+        monkeypatch.setattr(eec_classify, "np", None)
+    rnd = random.Random(11)
+    for _ in range(40):
+        rules, code = random_rules(rnd)
+        table = eec_classify.RuleTable(rules)
+        codes = [code(rnd.choice((10, 10, 10, 4, 6, 8, 12))) for _ in range(200)] + ["", "22 03 00 000 0"]
+        for r in rules["ranges"]:
+            codes += [r["from"], r["to"], r["from"] + "0" * (10 - len(r["from"]))]
+
+        assert_matches_reference(rules, table, codes, *table.classify(codes))
+
+
+def test_numpy_batch_matches_check_tnved_port():
+    rnd = random.Random(5)
+    for _ in range(10):
+        rules, code = random_rules(rnd)
+        table = eec_classify.RuleTable(rules)
+        codes = [code(10) for _ in range(500)]
+        codes += [r["from"] + "0" * (10 - len(r["from"])) for r in rules["ranges"]]
+
+        batch = np.array([int(c) for c in codes], dtype=np.int64)
+        assert_matches_reference(rules, table, codes, *table.classify(batch))
+
+
+def test_int_codes_keep_leading_zeros():
+    table = eec_classify.RuleTable({"exact": [{"code": "0101210000"}], "prefix": ["0201"], "ranges": []})
+    types, indexes = table.classify([101210000, 201000000, "0101210000"])
+    assert [eec_classify.TYPES[int(t)] for t in types] == ["exact", "prefix", "exact"]
+    assert [int(i) for i in indexes] == [0, 0, 0]
@@ -0,0 +1,105 @@
+import json
+import random
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import eec_history  # noqa: E402
+import eec_index  # noqa: E402
+
+
+def random_versions(rnd, n):
+    """n версий реестра: правила берутся из общего пула, так что большинство повторяется."""
+    heads = [f"{rnd.randint(0, 99):02d}" for _ in range(5)]
+
+    def code(k):
+        return rnd.choice(heads) + "".join(rnd.choice("0123456789") for _ in range(k - 2))
+
+    pool = {
+        "exact": sorted({code(10) for _ in range(30)}),
+        "prefixObjects": [{"prefix": code(rnd.choice((4, 6))), "raw": rnd.choice((None, "из"))} for _ in range(15)],
+        "ranges": [],
+    }
+    for _ in range(10):
+        L = rnd.choice((4, 6, 10))
+        a = code(L)
+        b = str(min(int(a) + rnd.randint(0, 30), 10 ** L - 1)).zfill(L)
+        pool["ranges"].append({"from": a, "to": b, "len": L, "mode": "numeric" if L == 10 else "prefix", "raw": None})
+    for obj in pool["prefixObjects"]:
+        if obj["raw"]:
+            obj["raw"] = "из " + obj["prefix"]
+
+    versions = []
+    for _ in range(n):
+        versions.append({k: [x for x in v if rnd.random() < 0.8] for k, v in pool.items()})
+    return versions, code
+
+
+def test_point_in_time_lookups_match_index_of_that_version(tmp_path):
+    rnd = random.Random(3)
+    versions, code = random_versions(rnd, 6)
+    dates = [f"2025-0{i + 1}-15" for i in range(len(versions))]
+
+    store = eec_history.HistoryStore(str(tmp_path / "hist"))
+    order = list(range(len(versions)))
+    rnd.shuffle(order)  # бэкфилл архива не по порядку дат
+    for i in order:
+        assert store.add(versions[i], dates[i], file_sha=f"sha{i}")["added"]
+    assert store.add(versions[0], "2030-01-01", file_sha="sha0")["added"] is False
+
+    # правило хранится один раз, сколько бы версий его ни содержали
+    keys = [tuple(map(str, eec_history.rule_key(r["type"], r["rule"]))) for r in store.rules.values()]
+    lines = (tmp_path / "hist" / "rules.jsonl").read_text(encoding="utf-8").splitlines()
+    assert len(lines) == len(set(keys)) == len(store.rules)
+
+    probes = [code(10) for _ in range(200)] + [code(4), code(6), ""]
+    for v in versions:
+        probes += v["exact"][:5] + [o["prefix"] + "0000" for o in v["prefixObjects"][:5]]
+        probes += [r["from"] for r in v["ranges"]]
+        # короткие и длинные коды: диапазоны ловят их по-разному в зависимости от вида (как checkTnved)
+        probes += [r["from"] + "12" for r in v["ranges"]] + [r["from"][:-1] for r in v["ranges"]]
+        probes += ["0" + r["from"] for r in v["ranges"] if len(r["from"]) == 10]
+
+    with eec_history.EecHistory(str(tmp_path / "hist")) as hist:
+        assert hist.lookup(probes[0], at="2024-12-31") is None
+        for i, v in enumerate(versions):
+            path = tmp_path / f"v{i}.idx"
+            eec_index.write_index(v, str(path))
+            with eec_index.EecIndex(str(path)) as idx:
+                for c in probes:
+                    got, want = hist.lookup(c, at=dates[i] + "T12:00:00Z"), idx.lookup(c)
+                    assert (got or {}).get("type") == (want or {}).get("type"), (i, c)
+                    if want and want["type"] != "range":
+                        assert got == want, (i, c)
+                    elif want:
+                        # EecIndex сливает и примыкающие диапазоны, история — только содержащие код
+                        assert len(got["from"]) == len(want["from"]), (i, c)
+                        assert want["from"] <= got["from"] <= got["to"] <= want["to"], (i, c)
+
+        for c in probes[:50]:
+            periods = hist.history(c)
+            for i, date in enumerate(dates):
+                current = [p for p in periods if p["from"][:10] <= date and (p["to"] is None or date < p["to"][:10])]
+                assert [p["match"] for p in current] in ([hist.lookup(c, at=date)], []), (c, date)
+            assert all(a["match"] != b["match"] for a, b in zip(periods, periods[1:]))
+
+
+def test_history_reports_when_a_rule_changed(tmp_path):
+    store = eec_history.HistoryStore(str(tmp_path))
+    store.add({"exact": ["8703100000"], "prefixObjects": [{"prefix": "8703", "raw": None}]}, "2024-01-01")
+    store.add({"exact": ["8703100000"], "prefixObjects": []}, "2024-06-01")
+    result = store.add({"exact": [], "prefixObjects": []}, "2025-01-01")
+    assert result == {"added": True, "version": 3, "opened": 0, "closed": 1}
+
+    with eec_history.EecHistory(str(tmp_path)) as hist:
+        assert hist.history("8703200000") == [
+            {"from": "2024-01-01T00:00:00Z", "to": "2024-06-01T00:00:00Z",
+             "match": {"type": "prefix", "prefix": "8703", "raw": None}},
+            {"from": "2024-06-01T00:00:00Z", "to": None, "match": None},
+        ]
+        assert hist.lookup("8703100000", at="2024-12-31") == {"type": "exact", "code": "8703100000"}
+        assert hist.lookup("8703100000") is None
+    rec = json.loads((tmp_path / "rules.jsonl").read_text(encoding="utf-8").splitlines()[0])
+    assert rec == {"type": "exact", "rule": {"code": "8703100000"}, "valid": [[1, 3]]}
@@ -0,0 +1,89 @@
+import json
+import random
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import eec_index  # noqa: E402
+
+RULES = {
+    "exact": ["3306100000", "0101210000", "8517620009"],
+    "prefixObjects": [
+        {"prefix": "8703", "raw": "из 8703"},
+        {"prefix": "0201", "raw": None},
+        {"prefix": "851762", "raw": None},
+    ],
+    "ranges": [
+        {"from": "0103", "to": "0104", "len": 4, "mode": "prefix", "raw": "0103 - 0104"},
+        {"from": "0105", "to": "0106", "len": 4, "mode": "prefix", "raw": "0105 - 0106"},
+        {"from": "220300", "to": "220399", "len": 6, "mode": "prefix", "raw": None},
+        {"from": "9401000000", "to": "9401999999", "len": 10, "mode": "numeric", "raw": None},
+        {"from": "9401500000", "to": "9402000005", "len": 10, "mode": "numeric", "raw": None},
+    ],
+}
+
+
+def reference_lookup(rules, code):
+    """Линейная проверка по JSON, как checkTnved (диапазоны — по одному)."""
+    if code in rules["exact"]:
+        return "exact"
+    for obj in sorted(rules["prefixObjects"], key=lambda o: o["prefix"]):
+        if code.startswith(obj["prefix"]):
+            return "prefix"
+    for r in rules["ranges"]:
+        L = len(r["from"])
+        if L < 10 and len(code) >= L and r["from"] <= code[:L] <= r["to"]:
+            return "range"
+        # numeric: весь код как число (BigInt в checkTnved), любой длины
+        if L == 10 and code and int(r["from"]) <= int(code) <= int(r["to"]):
+            return "range"
+    return None
+
+
+def test_merge_intervals_joins_overlapping_and_adjacent():
+    assert eec_index.merge_intervals([(5, 9), (1, 3), (4, 4), (20, 30), (25, 26)]) == [(1, 9), (20, 30)]
+
+
+def test_lookup_matches_linear_scan(tmp_path):
+    path = tmp_path / "rules.idx"
+    eec_index.write_index(RULES, str(path))
+
+    rnd = random.Random(1)
+    probes = ["3306100000", "8703", "87032110", "0201", "8517620001", "220350", "2203", "0103", "01069",
+              "9401000000", "9402000005", "9402000006", "99", ""]
+    probes += ["".join(rnd.choice("0123456789") for _ in range(n)) for n in (4, 5, 6, 10, 12) for _ in range(2000)]
+    probes += [p[:4] + "".join(rnd.choice("0123456789") for _ in range(n))
+               for p in ("8703", "0103", "0106", "9401", "2203") for n in (0, 1, 2, 6, 8)]
+    probes += ["9401", "940100000012", "09401000000", "220300", "22030", "01035"]
+
+    with eec_index.EecIndex(str(path)) as idx:
+        assert idx.n_ranges == 3  # 0103-0106 слиты, 9401.. слиты, 2203.. отдельно
+        for code in probes:
+            assert (idx.lookup(code) or {}).get("type") == reference_lookup(RULES, code), code
+        assert idx.lookup("87031") == {"type": "prefix", "prefix": "8703", "raw": "из 8703"}
+        assert idx.lookup("0201") == {"type": "prefix", "prefix": "0201", "raw": None}
+        assert idx.lookup("0106123456") == {"type": "range", "from": "0103", "to": "0106"}
+        assert idx.lookup("01061") == {"type": "range", "from": "0103", "to": "0106"}
+        # как checkTnved: 6-значный диапазон требует 6 цифр кода, numeric сравнивает весь код числом
+        assert idx.lookup("2203") is None
+        assert idx.lookup("220350") == {"type": "range", "from": "220300", "to": "220399"}
+        assert idx.lookup("9401") is None
+        assert idx.lookup("940100000012") is None
+        assert idx.lookup("09401000000") == {"type": "range", "from": "9401000000", "to": "9402000005"}
+        assert idx.lookup("22") is None
+        assert idx.lookup("") is None
+
+
+def test_index_covers_committed_rules(tmp_path):
+    rules = json.loads((ROOT / "data" / "eec_rules.json").read_text(encoding="utf-8"))["rules"]
+    path = tmp_path / "eec_rules.idx"
+    eec_index.write_index(rules, str(path))
+
+    with eec_index.EecIndex(str(path)) as idx:
+        for code in rules["exact"]:
+            assert idx.lookup(code)["type"] in ("exact", "prefix")
+            assert idx.has_exact(code)
+        for obj in rules["prefixObjects"]:
+            assert idx.find_prefix(obj["prefix"] + "0000")[0] in (obj["prefix"], obj["prefix"][:4])
@@ -0,0 +1,87 @@
+import random
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import eec_ranges  # noqa: E402
+from test_eec_index import reference_lookup  # noqa: E402
+
+
+def test_normalize_merges_ranges_and_reports_subsumed_rules():
+    rules = {
+        "exact": ["0101210000", "0103500000", "8703100000"],
+        "prefixObjects": [{"prefix": "8703", "raw": "из 8703"}, {"prefix": "870310", "raw": None}],
+        "ranges": [
+            {"from": "0103", "to": "0104", "len": 4, "mode": "prefix", "raw": "0103 - 0104"},
+            {"from": "0105", "to": "0106", "len": 4, "mode": "prefix", "raw": None},
+            {"from": "870321", "to": "870322", "len": 6, "mode": "prefix", "raw": None},
+            {"from": "9401000000", "to": "9401000009", "len": 10, "mode": "numeric", "raw": None},
+        ],
+    }
+    provenance = {"exact": [1, 2, 3], "prefixObjects": [4, 5], "ranges": [6, 7, 8, 9]}
+    report = eec_ranges.normalize_rules(rules, provenance)
+
+    minimal = report["minimal"]
+    assert minimal["exact"] == rules["exact"]  # exact не удаляем
+    assert [o["prefix"] for o in minimal["prefixObjects"]] == ["8703"]
+    assert minimal["ranges"] == [
+        {"from": "0103", "to": "0106", "len": 4, "mode": "prefix", "raw": None},
+        rules["ranges"][3],
+    ]
+
+    sub = report["subsumed"]
+    assert sub["prefixes"] == [{"prefix": "870310", "raw": None, "page": 5, "by": {"type": "prefix", "prefix": "8703"}}]
+    assert [(r["from"], r["page"]) for r in sub["ranges"]] == [("870321", 8)]
+    assert {e["code"]: e["by"]["type"] for e in sub["exact"]} == {"0103500000": "range", "8703100000": "prefix"}
+    assert [m["page"] for m in report["merged"][0]["members"]] == [6, 7]
+
+
+def test_minimal_rules_answer_lookups_like_full_rules():
+    rnd = random.Random(7)
+    heads = [f"{rnd.randint(0, 99):02d}" for _ in range(6)]
+
+    def code(n):
+        return rnd.choice(heads) + "".join(rnd.choice("0123456789") for _ in range(n - 2))
+
+    for _ in range(30):
+        rules = {"exact": sorted({code(10) for _ in range(20)}), "prefixObjects": [], "ranges": []}
+        for p in {code(rnd.choice((4, 6))) for _ in range(10)}:
+            rules["prefixObjects"].append({"prefix": p, "raw": None})
+        for _ in range(10):
+            L = rnd.choice((4, 6, 10))
+            a = code(L)
+            b = str(min(int(a) + rnd.randint(0, 30), 10 ** L - 1)).zfill(L)
+            rules["ranges"].append({"from": a, "to": b, "len": L, "mode": "numeric" if L == 10 else "prefix",
+                                    "raw": None})
+
+        # границы интервалов и соседние коды — там ошибки слияния видны первыми;
+        # 4/6/12 цифр — диапазоны разных видов ловят их по-разному
+        probes = [code(n) for n in (4, 6, 10, 10, 12) for _ in range(40)]
+        for r in rules["ranges"]:
+            L, lo, hi = eec_ranges.range_bounds(r)
+            for v in (lo - 1, lo, (lo + hi) // 2, hi, hi + 1):
+                if 0 <= v < 10 ** L:
+                    probes += [f"{v:0{L}d}", f"{v:0{L}d}" + "0" * (10 - L), f"{v:0{L}d}" + "12", str(v)]
+
+        minimal = eec_ranges.normalize_rules(rules)["minimal"]
+        for c in probes:
+            assert reference_lookup(minimal, c) == reference_lookup(rules, c), c
+
+
+def test_ranges_merge_only_within_their_kind():
+    rules = {
+        "exact": [],
+        "prefixObjects": [],
+        "ranges": [
+            {"from": "0103", "to": "0106", "len": 4, "mode": "prefix", "raw": None},
+            {"from": "0107000000", "to": "0107000005", "len": 10, "mode": "numeric", "raw": None},
+            {"from": "2203", "to": "2203", "len": 4, "mode": "prefix", "raw": None},
+            {"from": "220400", "to": "220405", "len": 6, "mode": "prefix", "raw": None},
+        ],
+    }
+    minimal = eec_ranges.normalize_rules(rules)["minimal"]
+    assert minimal["ranges"] == sorted(rules["ranges"], key=lambda r: (len(r["from"]), r["from"]))
+    for c in ("0104", "010412345678", "2203", "0107000003", "107000003", "22040012"):
+        assert reference_lookup(minimal, c) == reference_lookup(rules, c) == "range", c
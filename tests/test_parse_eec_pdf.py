@@ -0,0 +1,620 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+REGISTRY_PDF = ROOT / "data" / "eec_registry.pdf"
+sys.path.insert(0, str(ROOT / "scripts"))
+
+pytest.importorskip("pdfplumber")
+import parse_eec_pdf as parser  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def small_pdf(tmp_path_factory):
+    # первые страницы реестра: таблица начинается на стр. 1 и продолжается без заголовка
+    fitz = pytest.importorskip("fitz")
+    path = tmp_path_factory.mktemp("pdf") / "registry_head.pdf"
+    doc = fitz.open(str(REGISTRY_PDF))
+    doc.select([0, 1, 2, 3])
+    doc.save(str(path))
+    doc.close()
+    return path
+
+
+def run_main(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["parse_eec_pdf.py", *map(str, argv)])
+    parser.main()
+
+
+def load_output(path):
+    out = json.loads(Path(path).read_text(encoding="utf-8"))
+    out.pop("generatedAt")
+    return out
+
+
+def test_choose_code_col_threads_shape_explicitly():
+    with_header = [["Наименование", "Код ТН ВЭД"], ["x", "8703"]]
+    continuation = [["y", "из 3304"], ["z", "0201"]]
+
+    col, shape = parser.choose_code_col(with_header, None)
+    assert (col, shape) == (1, (2, 1))
+
+    assert parser.choose_code_col(continuation, shape) == (1, (2, 1))
+    assert parser.choose_code_col(continuation, None) == (None, None)
+
+
+def test_workers_output_matches_serial(small_pdf, tmp_path, monkeypatch):
+    serial = tmp_path / "serial.json"
+    pooled = tmp_path / "pooled.json"
+
+    run_main(monkeypatch, small_pdf, serial)
+    run_main(monkeypatch, small_pdf, pooled, "--workers", "2")
+
+    assert load_output(serial) == load_output(pooled)
+    assert load_output(serial)["stats"]["prefixObjects"] > 0
+
+
+def test_backend_session_matches_per_page_extraction(small_pdf):
+    from pdfminer.high_level import extract_text
+
+    with parser.BackendSession(str(small_pdf)) as backends:
+        for page_i in (3, 1):  # не по порядку: страницы pdfminer берутся лениво
+            expected = extract_text(str(small_pdf), page_numbers=[page_i - 1])
+            assert backends.pdfminer_text(page_i) == expected
+            assert backends.pdfminer_text(page_i) is backends.pdfminer_text(page_i)
+            backends.release(page_i)
+        assert backends.pdfminer_text(9) == ""
+
+
+def test_page_layout_builds_lines_once_and_releases(small_pdf, monkeypatch):
+    import pdfplumber
+
+    with pdfplumber.open(str(small_pdf)) as pdf:
+        page = pdf.pages[0]
+        words = sorted(page.extract_words(use_text_flow=True), key=lambda w: (round(w["top"] / 3), w["x0"]))
+        layout = parser.PageLayout(page)
+        lines = layout.lines()
+        assert " ".join(lines).split() == " ".join(w["text"] for w in words).split()
+        assert len(layout.x0) == len(words) and layout.word(0) == words[0]["text"]
+
+        calls = []
+        orig = parser.extract_codes_any_4_6_10
+        monkeypatch.setattr(parser, "extract_codes_any_4_6_10", lambda text: calls.append(text) or orig(text))
+        codes = layout.line_codes()
+        assert layout.line_codes() == codes and len(calls) == len(lines)
+
+        layout.release()
+        assert layout.page is None and "chars" not in vars(page)
+
+
+def test_parse_cache_reuses_file_and_unchanged_pages(small_pdf, tmp_path, monkeypatch, capsys):
+    fitz = pytest.importorskip("fitz")
+    cache_dir = tmp_path / "cache"
+
+    first = tmp_path / "first.json"
+    again = tmp_path / "again.json"
+    run_main(monkeypatch, small_pdf, first, "--cache", cache_dir)
+    run_main(monkeypatch, small_pdf, again, "--cache", cache_dir)
+    assert "OK (cache)" in capsys.readouterr().out
+    assert again.read_bytes() == first.read_bytes()
+
+    changed_pdf = tmp_path / "changed.pdf"
+    doc = fitz.open(str(small_pdf))
+    doc[2].insert_text((40, 40), "8517 62 000 9", fontsize=8)
+    doc.save(str(changed_pdf))
+    doc.close()
+
+    calls = []
+    scan_page = parser.scan_page
+    monkeypatch.setattr(parser, "scan_page", lambda page, page_i, *a: calls.append(page_i) or scan_page(page, page_i, *a))
+
+    incremental = tmp_path / "incremental.json"
+    run_main(monkeypatch, changed_pdf, incremental, "--cache", cache_dir)
+    assert calls == [2, 3, 4]  # изменённая страница и её соседи
+    assert "'changed': 1, 'neighbours': 2, 'reused': 1" in capsys.readouterr().out
+
+    monkeypatch.setattr(parser, "scan_page", scan_page)
+    full = tmp_path / "full.json"
+    run_main(monkeypatch, changed_pdf, full)
+    assert load_output(incremental) == load_output(full)
+    assert "8517620009" in load_output(full)["rules"]["exact"]
+
+
+def write_text_pdf(path, pages, pad=300, font=b"Helvetica"):
+    """Многостраничный PDF без pymupdf: строка с кодом и pad строк-комментариев в content stream на страницу."""
+    import zlib
+
+    objs = [b"<< /Type /Font /Subtype /Type1 /BaseFont /%s >>" % font, None]  # 1 — шрифт, 2 — дерево страниц
+    kids = []
+    for i in range(pages):
+        ops = f"BT /F1 8 Tf 40 780 Td (Item {i} iz {1000 + i % 8999:04d}) Tj ET\n"
+        ops += "".join(f"% padding {j} {'x' * 60}\n" for j in range(pad))
+        data = zlib.compress(ops.encode())
+        objs.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream" % (len(data), data))
+        objs.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                    b"/Resources << /Font << /F1 1 0 R >> >> /Contents %d 0 R >>" % (len(objs)))
+        kids.append(len(objs))
+    objs[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), pages)
+    objs.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for n, body in enumerate(objs, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (n, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, len(objs), xref)
+    Path(path).write_bytes(bytes(out))
+
+
+def test_page_fingerprint_covers_resources_not_just_content(tmp_path):
+    import pdfplumber
+
+    def fingerprints(path):
+        with pdfplumber.open(str(path)) as pdf:
+            memo = {}
+            return [parser.page_fingerprint(p.page_obj, memo) for p in pdf.pages]
+
+    write_text_pdf(tmp_path / "a.pdf", 3, pad=0)
+    write_text_pdf(tmp_path / "b.pdf", 3, pad=0)
+    write_text_pdf(tmp_path / "c.pdf", 3, pad=0, font=b"Courier")  # те же content streams, другой шрифт
+    a = fingerprints(tmp_path / "a.pdf")
+    assert a == fingerprints(tmp_path / "b.pdf") and len(set(a)) == 3
+    assert set(a).isdisjoint(fingerprints(tmp_path / "c.pdf"))
+
+
+def test_low_memory_peak_rss_does_not_grow_with_pages(tmp_path):
+    pdf = tmp_path / "big.pdf"
+    write_text_pdf(pdf, 2000)
+
+    rss = {}
+
+    def progress(page_i):
+        rss[page_i] = parser.current_rss_mb()
+
+    result = parser.main([str(pdf), str(tmp_path / "big.json"), "--low-memory", "--backends", "words",
+                          "--debug-hits", "off"], progress=progress)
+    assert result["stats"]["prefixObjects"] > 1000
+    # без --low-memory этот PDF прибавляет ~45 МБ на каждую 1000 страниц
+    warm = rss[200]
+    assert max(rss.values()) - warm < 10, (warm, max(rss.values()))
+
+
+def test_max_rss_spills_cache_entries_to_disk(small_pdf, tmp_path, monkeypatch, capsys):
+    plain = tmp_path / "plain.json"
+    spilled = tmp_path / "spilled.json"
+    cache_dir = tmp_path / "cache"
+    run_main(monkeypatch, small_pdf, plain)
+    run_main(monkeypatch, small_pdf, spilled, "--cache", cache_dir, "--max-rss", "1")
+
+    out = load_output(spilled)
+    assert out["debug"].pop("memory")["spilledPages"] == 4
+    assert out == load_output(plain)
+
+    meta = json.loads((cache_dir / parser.ParseCache.META).read_text(encoding="utf-8"))
+    assert len(meta["pages"]) == 4 and not (cache_dir / parser.ParseCache.SPILL).exists()
+    run_main(monkeypatch, small_pdf, spilled, "--cache", cache_dir)
+    assert "OK (cache)" in capsys.readouterr().out
+
+
+def test_iter_page_rules_yields_immutable_pages(small_pdf, tmp_path, monkeypatch):
+    out = tmp_path / "rules.json"
+    run_main(monkeypatch, small_pdf, out)
+    expected = load_output(out)["rules"]
+
+    pages = parser.iter_page_rules(str(small_pdf))
+    first = next(pages)  # первая страница готова до разбора остальных
+    assert first.page == 1 and not first.cached and first.timings["seconds"] > 0
+    before = [h.to_dict() for h in first.hits]
+    all_pages = [first, *pages]
+    assert [p.page for p in all_pages] == [1, 2, 3, 4]
+
+    rules = parser.RuleSet()
+    for page in all_pages:
+        rules.add_hits(page.hits_copy())
+    rules.finalize()
+    assert rules.to_json() == expected
+    assert [h.to_dict() for h in first.hits] == before  # RuleSet менял только копии
+    assert sorted({c for p in all_pages for c in p.exact}) == expected["exact"]
+
+    with pytest.raises(AttributeError):
+        first.exact = ()
+    with pytest.raises(TypeError):
+        first.timings["seconds"] = 0
+    with pytest.raises(ValueError):
+        next(parser.iter_page_rules(str(small_pdf), {"worker": 2}))
+
+
+def test_adaptive_table_strategy_keeps_rules(small_pdf, tmp_path, monkeypatch):
+    full = tmp_path / "all.json"
+    adaptive = tmp_path / "adaptive.json"
+    run_main(monkeypatch, small_pdf, full)
+    run_main(monkeypatch, small_pdf, adaptive, "--table-strategy", "adaptive")
+
+    out = load_output(adaptive)
+    assert out["rules"] == load_output(full)["rules"]
+
+    report = out["debug"]["tableStrategies"]
+    assert report["mode"] == "adaptive"
+    assert sum(s["wins"] for s in report["strategies"].values()) == 4
+    # после первой страницы остальные стратегии запускаются только как запасной вариант
+    assert report["strategies"]["text"]["runs"] == 1 + report["fallbacks"]
+
+
+def test_backend_policy_skips_idle_expensive_backends():
+    policy = parser.BackendPolicy("auto")
+    slow = {"words": 0.001, "pdfminer": 0.1, "pymupdf": 0.1}
+    for i in range(policy.WINDOW):
+        assert policy.plan(True) == parser.BACKEND_NAMES
+        # pdfminer ничего своего не находит, pymupdf каждый раз добавляет код
+        policy.observe({"words": {"0101"}, "pdfminer": {"0101"}, "pymupdf": {f"02{i:02d}"}}, slow, {"0101"})
+
+    assert policy.plan(True) == ["words", "pymupdf"]
+    # сомнительная страница — снова все бэкенды
+    assert policy.plan(False) == parser.BACKEND_NAMES
+    policy.observe({"words": set(), "pymupdf": set()}, slow, set())
+    assert policy.take()["skipped"]["pdfminer"] == 1
+
+    assert parser.BackendPolicy("pymupdf,words").plan(False) == ["words", "pymupdf"]
+    with pytest.raises(ValueError):
+        parser.BackendPolicy("words,ocr")
+
+
+def test_backends_option_drops_only_disabled_sources(small_pdf, tmp_path, monkeypatch):
+    full = tmp_path / "all.json"
+    words = tmp_path / "words.json"
+    run_main(monkeypatch, small_pdf, full)
+    run_main(monkeypatch, small_pdf, words, "--backends", "words", "--debug-hits", "first:100000")
+
+    out = load_output(words)
+    assert {h["kind"] for h in out["debug"]["hitsSample"]}.isdisjoint({"code_pdfminer", "code_pymupdf"})
+    assert set(out["rules"]["exact"]) <= set(load_output(full)["rules"]["exact"])
+    assert out["debug"]["backends"]["backends"]["pdfminer"]["runs"] == 0
+
+
+def test_stage_budget_degrades_slow_pages_to_cheap_extractors(small_pdf, monkeypatch):
+    import time
+
+    def stuck_tables(*args):
+        time.sleep(60)  # патологическая страница
+
+    monkeypatch.setattr(parser, "extract_tables_robust", stuck_tables)
+    t0 = time.perf_counter()
+    pages = list(parser.iter_page_rules(str(small_pdf), {"stageBudget": 0.2}))
+    assert time.perf_counter() - t0 < 30
+    # без таблиц разбор символов страницы достаётся words — он тоже может не уложиться
+    assert [p.info["degraded"][0] for p in pages] == ["tables"] * 4
+    kinds = {h.kind for p in pages for h in p.hits}
+    assert "code_pdfminer" not in kinds and "code_pymupdf" in kinds
+
+    pages = list(parser.iter_page_rules(str(small_pdf), {"deadline": 0}))
+    assert [p.info["degraded"] for p in pages] == [["deadline"]] * 4
+    assert {h.kind for p in pages for h in p.hits} == {"code_pymupdf", "code_fallback_after_tables"}
+
+
+def test_compact_and_jsonl_formats_carry_same_rules(small_pdf, tmp_path, monkeypatch):
+    from eec_index import load_rules
+
+    pretty = tmp_path / "pretty.json"
+    compact = tmp_path / "compact.json"
+    jsonl = tmp_path / "rules.jsonl"
+    run_main(monkeypatch, small_pdf, pretty)
+    run_main(monkeypatch, small_pdf, compact, "--format", "compact")
+    run_main(monkeypatch, small_pdf, jsonl, "--format", "jsonl")
+
+    assert load_output(compact) == load_output(pretty)
+    assert compact.stat().st_size < pretty.stat().st_size
+
+    records = [json.loads(line) for line in jsonl.read_text(encoding="utf-8").splitlines()]
+    assert records[0]["type"] == "header" and records[0]["format"] == parser.JSONL_FORMAT
+    assert records[-1] == {"type": "stats", **load_output(pretty)["stats"]}
+    assert load_rules(jsonl.read_bytes()) == load_output(pretty)["rules"]
+    assert len(load_output(pretty)["provenance"]["exact"]) == len(load_output(pretty)["rules"]["exact"])
+
+
+def test_rules_delta_tags_changes_with_pages():
+    prev = {
+        "generatedAt": "old",
+        "rules": {
+            "exact": ["0101000000", "0202000000"],
+            "prefixObjects": [{"prefix": "0303", "raw": None}, {"prefix": "0404", "raw": None}],
+            "ranges": [{"from": "0501", "to": "0509", "len": 4, "mode": "prefix", "raw": "0501-0509"}],
+        },
+        "provenance": {"exact": [1, 2], "prefixObjects": [3, 4], "ranges": [5]},
+    }
+    rules = parser.RuleSet()
+    rules.add_hits([
+        parser.make_hit(7, "exact", "0202000000"),
+        parser.make_hit(8, "code_pymupdf", "0303"),
+        parser.make_hit(9, "prefixObj", {"prefix": "0303", "raw": "из 0303"}),
+        parser.make_hit(9, "code_pdfminer", "0606000000"),
+    ])
+    rules.finalize()
+    cur = {"generatedAt": "new", "rules": rules.to_json(), "provenance": rules.provenance()}
+
+    delta = parser.rules_delta(prev, cur)
+    assert delta["exact"] == {"added": [{"code": "0606000000", "page": 9}],
+                              "removed": [{"code": "0101000000", "page": 1}]}
+    assert delta["prefixes"]["removed"] == [{"prefix": "0404", "raw": None, "page": 4}]
+    assert delta["prefixes"]["rawChanged"] == [{"prefix": "0303", "rawBefore": None, "raw": "из 0303", "page": 9}]
+    assert delta["ranges"]["removed"][0]["page"] == 5 and delta["stats"]["ranges.added"] == 0
+
+    # прошлый вывод без provenance — страницы удалённых неизвестны
+    prev.pop("provenance")
+    assert parser.rules_delta(prev, cur)["exact"]["removed"] == [{"code": "0101000000", "page": None}]
+
+
+def test_serve_runs_jobs_over_json_rpc(small_pdf, tmp_path, monkeypatch):
+    import io
+
+    direct = tmp_path / "direct.json"
+    run_main(monkeypatch, small_pdf, direct)
+
+    requests = [
+        {"jsonrpc": "2.0", "id": 1, "method": "ping"},
+        {"jsonrpc": "2.0", "id": 2, "method": "parse",
+         "params": {"pdf": str(small_pdf), "out": str(tmp_path / "served.json"), "progress": True}},
+        {"jsonrpc": "2.0", "id": 3, "method": "parse", "params": {"pdf": str(small_pdf)}},
+        {"jsonrpc": "2.0", "id": 4, "method": "parse",
+         "params": {"pdf": str(small_pdf), "out": str(tmp_path / "x.json"), "args": ["--format", "nope"]}},
+        {"jsonrpc": "2.0", "id": 5, "method": "shutdown"},
+    ]
+    stdin = io.StringIO("".join(json.dumps(r) + "\n" for r in requests))
+    stdout = io.StringIO()
+    server = parser.ParseServer(jobs=1)
+    try:
+        parser.serve_stdio(server, stdin=stdin, stdout=stdout)
+    finally:
+        server.close()
+
+    msgs = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    by_id = {m["id"]: m for m in msgs if "id" in m}
+    assert by_id[1]["result"] == "pong"
+    assert by_id[3]["error"]["code"] == -32602
+    assert by_id[4]["error"]["code"] == -32000
+    assert by_id[5]["result"]["jobs"] == 1 and by_id[5]["result"]["failed"] == 1
+
+    progress = [i for i, m in enumerate(msgs) if m.get("method") == "progress"]
+    assert [msgs[i]["params"]["page"] for i in progress] == [1, 2, 3, 4]
+    assert max(progress) < msgs.index(by_id[2])
+    assert load_output(tmp_path / "served.json")["rules"] == load_output(direct)["rules"]
+
+
+def test_batch_parses_manifest_on_shared_pool(small_pdf, tmp_path, monkeypatch):
+    fitz = pytest.importorskip("fitz")
+    docs = tmp_path / "archive"
+    (docs / "2023").mkdir(parents=True)
+    one_page = docs / "2023" / "one.pdf"
+    doc = fitz.open(str(small_pdf))
+    doc.select([1])
+    doc.save(str(one_page))
+    doc.close()
+    (docs / "broken.pdf").write_bytes(b"not a pdf")
+    manifest = docs / "manifest.txt"
+    manifest.write_text(f"# снимки\n2023/one.pdf\n{small_pdf}\nbroken.pdf\n", encoding="utf-8")
+
+    out_dir = tmp_path / "out"
+    summary = parser.main(["batch", str(manifest), str(out_dir), "--jobs", "2", "--format", "compact"])
+
+    # крупные документы первыми, битый PDF — в errors, остальные разобраны
+    assert [(d["pages"], Path(d["out"]).relative_to(out_dir).as_posix()) for d in summary["documents"]] == \
+        [(4, small_pdf.stem + ".json"), (1, "2023/one.json")]
+    assert [Path(e["pdf"]).name for e in summary["errors"]] == ["broken.pdf"]
+    assert json.loads((out_dir / parser.BATCH_SUMMARY).read_text(encoding="utf-8"))["pages"] == 5
+
+    for src, out in ((small_pdf, out_dir / (small_pdf.stem + ".json")), (one_page, out_dir / "2023" / "one.json")):
+        single = tmp_path / "single.json"
+        run_main(monkeypatch, src, single, "--format", "compact")
+        assert load_output(out) == load_output(single)
+
+    with pytest.raises(SystemExit):
+        parser.main(["batch", str(manifest), str(out_dir), "--cache", str(tmp_path / "cache")])
+
+
+def test_history_option_appends_runs_as_versions(tmp_path, capsys):
+    out = tmp_path / "rules.json"
+    store = tmp_path / "history"
+    runs = [
+        ("2025-01-10", {"exact": ["8703100000"], "prefixObjects": [{"prefix": "0201", "raw": None}], "ranges": []}),
+        ("2025-04-10", {"exact": ["8703100000"], "prefixObjects": [], "ranges": []}),
+    ]
+    for date, rules in runs:
+        out.write_text(json.dumps({"generatedAt": "2026-01-01T00:00:00Z", "rules": rules, "stats": {}}),
+                       encoding="utf-8")
+        parser.main(map(str, [tmp_path / "missing.pdf", out, "--no-parse", "--history", store, "--history-date", date]))
+
+    eec_history = pytest.importorskip("eec_history")
+    with eec_history.EecHistory(str(store)) as hist:
+        assert hist.lookup("0201100000", at="2025-02-01")["type"] == "prefix"
+        assert hist.lookup("0201100000") is None
+        assert [p["to"] for p in hist.history("8703100000")] == [None]
+
+    # неполный разбор в историю не идёт
+    out.write_text(json.dumps({"generatedAt": "2026-01-01T00:00:00Z", "rules": {"exact": []},
+                               "stats": {"degradedPages": [1]}}), encoding="utf-8")
+    parser.main(map(str, [tmp_path / "missing.pdf", out, "--no-parse", "--history", store]))
+    assert "history: skipped" in capsys.readouterr().out
+    assert len(json.loads((store / "versions.json").read_text(encoding="utf-8"))) == 2
+
+
+def import_profile(*argv):
+    """python -X importtime: (имена импортированных модулей, суммарное время импорта в мкс)."""
+    import subprocess
+
+    proc = subprocess.run([sys.executable, "-X", "importtime", str(ROOT / "scripts" / "parse_eec_pdf.py"),
+                           *map(str, argv)], capture_output=True, text=True, cwd=ROOT)
+    assert proc.returncode == 0, proc.stderr
+    modules, total = set(), 0
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:") and not line.rstrip().endswith("imported package"):
+            self_us, _, name = line[len("import time:"):].split("|")
+            modules.add(name.strip())
+            total += int(self_us)
+    return modules, total
+
+
+def test_fast_start_paths_skip_pdf_libraries(small_pdf, tmp_path, monkeypatch):
+    out = tmp_path / "rules.json"
+    cache_dir = tmp_path / "cache"
+    run_main(monkeypatch, small_pdf, out, "--cache", cache_dir)
+
+    pdf_libs = ("pdfplumber", "pdfminer", "fitz", "pymupdf")
+    runs = {
+        "help": ["--help"],
+        "cache": [small_pdf, out, "--cache", cache_dir],
+        "no-parse": [small_pdf, out, "--no-parse", "--index", tmp_path / "rules.idx"],
+    }
+    for name, argv in runs.items():
+        modules, total = import_profile(*argv)
+        loaded = sorted(m for m in modules if m.split(".")[0].lower() in pdf_libs)
+        assert not loaded, (name, loaded)
+        # с PDF-библиотеками импортируется ~320 модулей, без них ~150
+        assert len(modules) < 220, (name, len(modules), total)
+    assert (tmp_path / "rules.idx").stat().st_size > 0
+
+
+# --- эталонные реализации (до единого токенизатора) для проверки на совпадение ---
+def reference_codes_any_4_6_10(text):
+    import re
+
+    out = set()
+    if not text:
+        return out
+    for m in parser.RE_CHUNK_NUMBERS.finditer(text):
+        code = re.sub(r"\D", "", m.group(0))
+        if len(code) in (4, 6, 10):
+            if re.match(r"^(0[1-9]|[12]\d|3[01])(0[1-9]|1[0-2])(19|20)\d{2}$", code):
+                continue
+            out.add(code)
+    for n in (4, 6, 10):
+        for mm in re.finditer(r"(?<!\d)\d{%d}(?!\d)" % n, text):
+            out.add(mm.group(0))
+    return out
+
+
+def reference_codes10_any(text):
+    import re
+
+    out = set()
+    if not text:
+        return out
+    for m in parser.RE_CHUNK_NUMBERS.finditer(text):
+        code = re.sub(r"\D", "", m.group(0))
+        if len(code) == 10:
+            if re.match(r"^(0[1-9]|[12]\d|3[01])(0[1-9]|1[0-2])(19|20)\d{2}", code):
+                continue
+            out.add(code)
+    for m in re.finditer(r"(?<!\d)\d{10}(?!\d)", text):
+        out.add(m.group(0))
+    return out
+
+
+def registry_texts():
+    import pdfplumber
+
+    texts = []
+    with pdfplumber.open(str(REGISTRY_PDF)) as pdf:
+        for page in pdf.pages:
+            texts.append(page.extract_text() or "")
+            texts.extend(parser.page_lines_from_words(page))
+            for table in parser.clean_tables(page.extract_tables()):
+                for row in table:
+                    texts.append(" ".join(c for c in row if c))
+                    texts.extend(row)
+            page.close()
+    return texts
+
+
+def fuzz_texts(n=3000):
+    import random
+
+    rnd = random.Random(5)
+    alphabet = "0123456789" * 4 + "    -–—.,;/\nиз" + "٣"
+    return ["".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 80))) for _ in range(n)]
+
+
+def test_single_pass_tokenizer_matches_previous_extractors():
+    texts = registry_texts() + fuzz_texts() + [
+        "3306 10 000 0 и 3306100000, 8703",
+        "31122023 05 10.2023 3112202399 31 12 2023 99",
+        "1" * 70 + " 8517 62",
+    ]
+    assert len(texts) > 1000
+    for text in texts:
+        assert parser.extract_codes_any_4_6_10(text) == reference_codes_any_4_6_10(text), text
+        assert parser.extract_codes10_any(text) == reference_codes10_any(text), text
+
+
+def test_code_cell_uses_shared_tokenizer():
+    assert parser.parse_code_cell("из 0301 (за\nисключением\n0301 11 000 0,\n0301 19 000 0)") == [
+        ("exact", "0301110000"), ("exact", "0301190000")]
+    assert parser.parse_code_cell("2103 20 000 0") == [("exact", "2103200000")]  # не дата 21.03.2000
+    assert parser.parse_code_cell("8703 21 - 8703 24") == [
+        ("range", {"from": "870321", "to": "870324", "len": 6, "mode": "prefix", "raw": "8703 21 - 8703 24"})]
+    # цифры, склеенные через буквы и скобки, — не код (как и в тексте страницы)
+    assert parser.parse_code_cell("8207 (12)") == []
+    assert parser.parse_code_cell("19из 14") == []
+
+
+def test_prefix_index_filters_and_post_clean():
+    codes = {"3306", "330610", "3306100000", "3307", "851762", "8517620009"}
+    assert parser.filter_short_codes_if_covered_by_10(codes) == {"3306100000", "3307", "8517620009"}
+    assert parser.filter_short_codes_if_covered_by_10({"3306", "330610"}) == {"3306", "330610"}
+
+    prefix_objects = {
+        "3306": {"prefix": "3306", "raw": None},
+        "8703": {"prefix": "8703", "raw": "из 8703"},
+        "870321": {"prefix": "870321", "raw": None},
+        "0201": {"prefix": "0201", "raw": None},
+    }
+    dropped = parser.drop_prefixes_covered_by_exact(prefix_objects, {"3306100000", "8703219090"})
+    assert sorted(dropped) == ["3306", "870321"]
+    assert sorted(prefix_objects) == ["0201", "8703"]
+
+
+def test_debug_recorder_modes(tmp_path):
+    hits = [parser.make_hit(1 + i // 100, "exact", f"{i:010d}") for i in range(1000)]
+
+    first = parser.DebugRecorder.from_spec("first:10")
+    reservoir = parser.DebugRecorder.from_spec("reservoir:10")
+    stream = parser.DebugRecorder.from_spec(f"stream:{tmp_path / 'hits.jsonl'}")
+    off = parser.DebugRecorder.from_spec("off")
+    for rec in (first, reservoir, stream, off):
+        for page in range(10):
+            rec.add_page(hits[page * 100:(page + 1) * 100])
+        rec.close()
+
+    assert [h["value"] for h in first.section()["hitsSample"]] == [f"{i:010d}" for i in range(10)]
+
+    sample = reservoir.section()["hitsSample"]
+    assert len(sample) == 10 and reservoir.seen == 1000
+    assert max(int(h["value"]) for h in sample) >= 10  # не просто первые N
+
+    lines = (tmp_path / "hits.jsonl").read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 1000 and json.loads(lines[-1])["value"] == "0000000999"
+    assert stream.section()["hits"] == 1000
+
+    assert off.section() == {"note": "Сбор совпадений отключён.", "hits": 1000}
+    with pytest.raises(ValueError):
+        parser.DebugRecorder.from_spec("everything")
+
+
+def test_profile_report(small_pdf, tmp_path, monkeypatch, capsys):
+    out = tmp_path / "rules.json"
+    run_main(monkeypatch, small_pdf, out, "--profile")
+    assert "slowest pages" in capsys.readouterr().out
+
+    report = json.loads((tmp_path / "rules.profile.json").read_text(encoding="utf-8"))
+    assert [p["page"] for p in report["pages"]] == [1, 2, 3, 4]
+    assert {"words", "pdfminer", "pymupdf", "tables", "interpret"} <= set(report["stages"])
+    assert report["stages"]["tables"]["codes"] > 0
+    assert all("uniqueCodes" in report["stages"][s] for s in ("words", "pdfminer", "pymupdf"))
+
+    rows = (tmp_path / "rules.profile.csv").read_text(encoding="utf-8").splitlines()
+    assert rows[0] == "page,stage,wall_s,cpu_s,rss_peak_delta_kb,codes"
+    assert len(rows) > 4 * 4